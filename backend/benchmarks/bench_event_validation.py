@@ -0,0 +1,73 @@
+"""
+Benchmark for tracking event validation: Pydantic models vs the lean ingest path.
+
+Before: ClickEventCreate(...) -> .dict() -> ClickEvent(**data)
+After:  validate_click(...) -> ClickRecord (insert-ready tuple)
+
+Usage: python benchmarks/bench_event_validation.py [events]
+"""
+import os
+import random
+import sys
+import time
+import warnings
+
+# Add the src directory to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from models.click import ClickEventCreate
+from services.ingest import validate_click
+
+try:
+    from database.models import ClickEvent
+except ImportError:
+    ClickEvent = None
+
+USER_AGENT = "Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148"
+
+def make_events(count: int, seed: int = 10):
+    rng = random.Random(seed)
+    ips = [f"41.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}" for _ in range(count // 10)]
+    referrers = ["https://instagram.com/", "https://www.tiktok.com/", "https://t.co/abc", None]
+    return [
+        (rng.randint(1, 500), rng.randint(1, 50), rng.choice(ips), USER_AGENT, rng.choice(referrers))
+        for _ in range(count)
+    ]
+
+def run_pydantic(events):
+    for link_id, profile_id, ip_address, user_agent, referrer in events:
+        data = ClickEventCreate(
+            link_id=link_id,
+            profile_id=profile_id,
+            ip_address=ip_address,
+            user_agent=user_agent,
+            referrer=referrer
+        ).dict()
+        if ClickEvent is not None:
+            ClickEvent(**data)
+
+def run_fast_path(events):
+    for link_id, profile_id, ip_address, user_agent, referrer in events:
+        validate_click(link_id, profile_id, ip_address, user_agent, referrer)
+
+def measure(fn, events) -> float:
+    start = time.perf_counter()
+    fn(events)
+    return len(events) / (time.perf_counter() - start)
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    events = make_events(count)
+    warnings.simplefilter("ignore")
+
+    before = measure(run_pydantic, events)
+    after = measure(run_fast_path, events)
+
+    before_label = "Pydantic + .dict() + ORM" if ClickEvent is not None else "Pydantic + .dict() (ORM model unavailable)"
+    print(f"Events:                 {count:,}")
+    print(f"Before ({before_label}): {before:,.0f} events/sec/core")
+    print(f"After  (validate_click): {after:,.0f} events/sec/core")
+    print(f"Speedup:                {after / before:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Benchmark for the ingest filtering stage (bot matcher + duplicate window).
+
+Usage: python benchmarks/bench_ingest_filter.py [events]
+"""
+import os
+import random
+import sys
+import time
+
+# Add the src directory to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from services.ingest_filter import IngestFilter
+
+USER_AGENTS = [
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148 Instagram 300.0",
+    "Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Mobile Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 14_1) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.1 Safari/605.1.15",
+    "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)",
+    "facebookexternalhit/1.1 (+http://www.facebook.com/externalhit_uatext.php)",
+    "curl/8.4.0",
+]
+
+def make_events(count: int, seed: int = 10):
+    rng = random.Random(seed)
+    ips = [f"10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}" for _ in range(count // 4)]
+    return [
+        (rng.randint(1, 500), rng.choice(ips), rng.choice(USER_AGENTS))
+        for _ in range(count)
+    ]
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    events = make_events(count)
+
+    # Baseline loop cost so the reported number is the filter's own overhead
+    start = time.perf_counter()
+    for link_id, ip_address, user_agent in events:
+        pass
+    loop_seconds = time.perf_counter() - start
+
+    ingest_filter = IngestFilter(dedup_window_seconds=10.0, dedup_max_entries=100000)
+    check_click = ingest_filter.check_click
+    start = time.perf_counter()
+    for link_id, ip_address, user_agent in events:
+        check_click(link_id, ip_address, user_agent)
+    filter_seconds = time.perf_counter() - start - loop_seconds
+
+    print(f"Events:            {count:,}")
+    print(f"Per-event cost:    {filter_seconds / count * 1e6:.2f} us")
+    print(f"Throughput:        {count / filter_seconds:,.0f} events/sec")
+    print(f"Filter counters:   {ingest_filter.stats()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Benchmark for the link x day matrix endpoint's in-process work.
+
+Builds grouped rows for a profile (default 500 links over 90 days, every cell populated,
+which is the worst case for the grouped query) and times matrix assembly plus JSON
+serialization. The single grouped query itself is not included.
+
+Usage: python benchmarks/bench_link_matrix.py [links] [days]
+"""
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+# Add the src directory to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from services.link_matrix import build_link_matrix
+
+def make_rows(link_count: int, day_count: int, seed: int = 34):
+    rng = random.Random(seed)
+    end_date = datetime.now()
+    start_date = (end_date - timedelta(days=day_count - 1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    days = [start_date + timedelta(days=i) for i in range(day_count)]
+
+    links = [(i + 1, f"Link {i + 1}", i) for i in range(link_count)]
+    click_rows = [
+        (link_id, day, max(1, int(rng.expovariate(1.0) * 400 / (position + 1))))
+        for link_id, _, position in links
+        for day in days
+    ]
+    view_rows = [(day, rng.randint(2000, 5000)) for day in days]
+    return links, click_rows, view_rows, start_date, end_date
+
+def main():
+    link_count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    day_count = int(sys.argv[2]) if len(sys.argv) > 2 else 90
+    links, click_rows, view_rows, start_date, end_date = make_rows(link_count, day_count)
+
+    runs = 10
+    build_total = 0.0
+    encode_total = 0.0
+    for _ in range(runs):
+        started = time.perf_counter()
+        matrix = build_link_matrix(links, click_rows, view_rows, start_date, end_date)
+        built = time.perf_counter()
+        body = json.dumps(matrix, separators=(",", ":"))
+        build_total += built - started
+        encode_total += time.perf_counter() - built
+
+    print(f"Matrix:        {link_count} links x {day_count} days ({len(click_rows):,} grouped rows)")
+    print(f"Assembly:      {build_total / runs * 1000:.1f} ms")
+    print(f"Serialization: {encode_total / runs * 1000:.1f} ms ({len(body) / 1024:.0f} KiB)")
+    print(f"Total:         {(build_total + encode_total) / runs * 1000:.1f} ms")
+    print(f"Decay rate:    {matrix['position_decay']['decay_rate']}")
+
+if __name__ == "__main__":
+    main()
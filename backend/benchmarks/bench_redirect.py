@@ -0,0 +1,89 @@
+"""
+Latency benchmark for the /r/{link_id} short-link redirect.
+
+Calls the full ASGI app in-process (all middleware included, no network or server) with
+a populated routing table and measures per-request latency percentiles. The background
+click writer is not started, so only the hot path (lookup, enqueue, 302) is timed and
+no database is needed.
+
+Usage: python benchmarks/bench_redirect.py [requests] [links]
+"""
+import asyncio
+import os
+import sys
+import time
+
+# Add the src directory to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from main import app
+from services.redirects import click_queue, routing_table
+
+def make_scope(link_id: int) -> dict:
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": f"/r/{link_id}",
+        "raw_path": f"/r/{link_id}".encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [
+            (b"host", b"localhost"),
+            (b"user-agent", b"Mozilla/5.0 (iPhone; CPU iPhone OS 17_4 like Mac OS X) Mobile/15E148 Instagram"),
+            (b"referer", b"https://l.instagram.com/"),
+            (b"x-forwarded-for", b"203.0.113.7"),
+        ],
+        "client": ("203.0.113.7", 50000),
+        "server": ("localhost", 8000),
+    }
+
+async def request(link_id: int) -> int:
+    status = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(make_scope(link_id), receive, send)
+    return status
+
+async def run(count: int, link_count: int):
+    for _ in range(200):  # warm up
+        await request(1)
+
+    timings = []
+    for i in range(count):
+        started = time.perf_counter()
+        status = await request(i % link_count + 1)
+        timings.append(time.perf_counter() - started)
+        assert status == 302, status
+    return sorted(timings)
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    link_count = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+
+    routing_table._routes = {
+        link_id: (f"https://example.com/{link_id}", link_id // 8 + 1)
+        for link_id in range(1, link_count + 1)
+    }
+    timings = asyncio.run(run(count, link_count))
+
+    def percentile(p: float) -> float:
+        return timings[min(len(timings) - 1, int(len(timings) * p))] * 1000
+
+    print(f"Requests:  {count:,} over {link_count:,} links")
+    print(f"p50:       {percentile(0.50):.3f} ms")
+    print(f"p99:       {percentile(0.99):.3f} ms")
+    print(f"p99.9:     {percentile(0.999):.3f} ms")
+    print(f"Queued:    {click_queue.stats()['pending']:,} clicks")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Startup-time benchmark: how long a worker takes to import the application.
+
+Runs `python -X importtime -c "import main"` in a fresh interpreter and reports the
+total wall time plus the slowest modules by cumulative import time.
+
+Usage: python benchmarks/bench_startup.py [module] [top_n]
+"""
+import os
+import subprocess
+import sys
+import time
+
+# Packages that should only be imported on first use
+HEAVY_PACKAGES = ("reportlab", "pandas", "numpy", "scipy", "sklearn", "matplotlib", "joblib")
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+def parse_importtime(stderr: str):
+    timings = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_part, cumulative_part, name = line[len("import time:"):].split("|", 2)
+        timings.append((name.rstrip(), int(self_part), int(cumulative_part)))
+    return timings
+
+def main():
+    module = sys.argv[1] if len(sys.argv) > 1 else "main"
+    top_n = int(sys.argv[2]) if len(sys.argv) > 2 else 25
+
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SRC_DIR, capture_output=True, text=True
+    )
+    wall = time.perf_counter() - start
+    timings = parse_importtime(proc.stderr)
+
+    print(f"Importing '{module}': {wall * 1000:.0f} ms wall (including interpreter start)")
+    if proc.returncode != 0:
+        print("Import failed:")
+        print(proc.stderr.strip().splitlines()[-1])
+
+    print(f"\n{'cumulative ms':>14} {'self ms':>9}  module")
+    for name, self_us, cumulative_us in sorted(timings, key=lambda t: t[2], reverse=True)[:top_n]:
+        print(f"{cumulative_us / 1000:14.1f} {self_us / 1000:9.1f}  {name}")
+
+    heavy = sorted({
+        name.strip().split(".")[0] for name, _, _ in timings
+        if name.strip().split(".")[0] in HEAVY_PACKAGES
+    })
+    print(f"\nHeavy packages imported at startup: {', '.join(heavy) or 'none'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmark for time-series response encoding: TimeAnalytics models vs compact formats.
+
+Before: list of TimeBasedMetrics -> TimeAnalytics -> jsonable_encoder -> JSON
+After:  dense columns -> columnar JSON, or packed int32 (Accept-negotiated)
+
+Usage: python benchmarks/bench_time_series.py [days]
+"""
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+# Add the src directory to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from fastapi.encoders import jsonable_encoder
+
+from models.analytics import TimeAnalytics, TimeBasedMetrics
+from services.time_series import build_columns, from_binary, to_binary, to_columnar
+
+def make_rows(days: int, seed: int = 35):
+    rng = random.Random(seed)
+    end_date = datetime.now()
+    start_date = end_date - timedelta(days=days)
+    first = start_date.replace(minute=0, second=0, microsecond=0)
+    periods = [first + timedelta(hours=i) for i in range(days * 24 + 1)]
+    click_rows = [(period, rng.randint(0, 400), rng.randint(0, 200)) for period in periods]
+    view_rows = [(period, rng.randint(400, 2000)) for period in periods]
+    return click_rows, view_rows, start_date, end_date
+
+def encode_models(click_rows, view_rows) -> bytes:
+    views = {period: count for period, count in view_rows}
+    data = [
+        TimeBasedMetrics(period=str(period), clicks=clicks, views=views.get(period, 0), unique_visitors=uniques)
+        for period, clicks, uniques in click_rows
+    ]
+    analytics = TimeAnalytics(profile_id=1, granularity="hourly", data=data)
+    return json.dumps(jsonable_encoder(analytics)).encode()
+
+def encode_columnar(click_rows, view_rows, start_date, end_date) -> bytes:
+    columns = build_columns(click_rows, view_rows, "hourly", start_date, end_date)
+    return json.dumps(to_columnar(columns, profile_id=1, granularity="hourly"), separators=(",", ":")).encode()
+
+def encode_binary(click_rows, view_rows, start_date, end_date) -> bytes:
+    return to_binary(build_columns(click_rows, view_rows, "hourly", start_date, end_date))
+
+def measure(fn, *args, runs: int = 20):
+    start = time.perf_counter()
+    for _ in range(runs):
+        body = fn(*args)
+    return (time.perf_counter() - start) / runs * 1000, len(body)
+
+def main():
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 90
+    click_rows, view_rows, start_date, end_date = make_rows(days)
+
+    before_ms, before_bytes = measure(encode_models, click_rows, view_rows)
+    columnar_ms, columnar_bytes = measure(encode_columnar, click_rows, view_rows, start_date, end_date)
+    binary_ms, binary_bytes = measure(encode_binary, click_rows, view_rows, start_date, end_date)
+
+    decoded = from_binary(encode_binary(click_rows, view_rows, start_date, end_date))
+    assert decoded.clicks.tolist() == [clicks for _, clicks, _ in click_rows]
+
+    print(f"Periods:            {len(click_rows):,} hourly ({days} days)")
+    print(f"Before (models):    {before_ms:7.2f} ms  {before_bytes / 1024:7.1f} KiB")
+    print(f"After  (columnar):  {columnar_ms:7.2f} ms  {columnar_bytes / 1024:7.1f} KiB")
+    print(f"After  (binary):    {binary_ms:7.2f} ms  {binary_bytes / 1024:7.1f} KiB")
+
+if __name__ == "__main__":
+    main()
@@ -10,12 +10,9 @@ from sqlalchemy.orm import Session
 from datetime import datetime
 
 # Import our database and models
-from database.connection import get_db, test_connection, engine, Base
+from database.connection import get_db, test_connection
 from routes.tracking import router as tracking_router
 
-# Create all database tables
-Base.metadata.create_all(bind=engine)
-
 # Create FastAPI app
 app = FastAPI(
     title="LinkPro Analytics API",
@@ -0,0 +1,21 @@
+"""
+Incremental build of the per-profile, per-day visitor bitmaps behind /api/analytics/cohorts.
+
+    python build_cohorts.py                  # add all new events, then exit (cron-friendly)
+    python build_cohorts.py --follow         # keep running, polling for new events
+    python build_cohorts.py --follow --interval 60
+
+Progress is stored in the visitor_bitmap_cursor table; see services/event_jobs.py for
+resuming and sharding.
+"""
+from services.cohorts import visitor_bitmap_job
+from services.event_jobs import run_job_cli
+
+def describe(stats: dict) -> str:
+    return f"{stats['bitmaps_written']:,} daily bitmaps updated"
+
+def main():
+    run_job_cli(visitor_bitmap_job, "Build daily visitor bitmaps for retention cohorts", describe)
+
+if __name__ == "__main__":
+    main()
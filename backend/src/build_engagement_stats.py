@@ -0,0 +1,22 @@
+"""
+Incremental hourly click and page view counts per traffic source in engagement_stats,
+behind /api/analytics/significance and the best time significance.
+
+    python build_engagement_stats.py                  # add all new events, then exit (cron-friendly)
+    python build_engagement_stats.py --follow         # keep running, polling for new events
+    python build_engagement_stats.py --follow --interval 60
+
+Progress is stored in the engagement_stat_cursor table; see services/event_jobs.py for
+resuming and sharding.
+"""
+from services.event_jobs import run_job_cli
+from services.significance import engagement_stats_job
+
+def describe(stats: dict) -> str:
+    return f"{stats['rows_written']:,} hourly counts updated"
+
+def main():
+    run_job_cli(engagement_stats_job, "Count engagement per hour and traffic source for significance tests", describe)
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,151 @@
 import os
-from dotenv import load_dotenv # type: ignore
-
-# Make sure to load from the correct path
-load_dotenv()
 
 class Settings:
-    # Database settings with fallbacks
-    DB_HOST = os.getenv("DB_HOST", "localhost")
-    DB_PORT = os.getenv("DB_PORT", "5432") 
-    DB_NAME = os.getenv("DB_NAME", "linkpro_analytics")
-    DB_USER = os.getenv("DB_USER", "postgres")
-    DB_PASS = os.getenv("DB_PASS", "idkIDK168292")  # Your actual password as fallback
-    
-    # Build database URL
-    DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-    
-    # API settings
-    API_HOST = os.getenv("API_HOST", "0.0.0.0")
-    API_PORT = int(os.getenv("API_PORT", "8000"))
-    
-    # Security
-    SECRET_KEY = os.getenv("SECRET_KEY", "idkIDK168292")
-    
-    # Analytics settings
-    CLICK_BATCH_SIZE = int(os.getenv("CLICK_BATCH_SIZE", "1000"))
-    ANALYTICS_CACHE_TTL = int(os.getenv("ANALYTICS_CACHE_TTL", "300"))  # 5 minutes
-
-settings = Settings()
-
-# Test database connection on import
+    """Application settings read from the environment (and .env) when instantiated"""
+
+    def __init__(self):
+        # Database settings with fallbacks
+        self.DB_HOST = os.getenv("DB_HOST", "localhost")
+        self.DB_PORT = os.getenv("DB_PORT", "5432")
+        self.DB_NAME = os.getenv("DB_NAME", "linkpro_analytics")
+        self.DB_USER = os.getenv("DB_USER", "postgres")
+        self.DB_PASS = os.getenv("DB_PASS", "idkIDK168292")  # Your actual password as fallback
+        
+        # Build database URL (DATABASE_URL overrides the individual settings, e.g. for SQLite)
+        self.DATABASE_URL = os.getenv("DATABASE_URL") or f"postgresql://{self.DB_USER}:{self.DB_PASS}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
+        
+        # Connection pooling (per worker process)
+        self.DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+        self.DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+        self.DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+        self.DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+        self.DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+        
+        # Separate pool for heavy analytics reads
+        self.ANALYTICS_DATABASE_URL = os.getenv("ANALYTICS_DATABASE_URL")
+        self.ANALYTICS_POOL_SIZE = int(os.getenv("ANALYTICS_POOL_SIZE", "5"))
+        self.ANALYTICS_MAX_OVERFLOW = int(os.getenv("ANALYTICS_MAX_OVERFLOW", "0"))
+        
+        # Read replicas for analytics queries (comma-separated URLs; each gets an analytics-sized pool)
+        self.REPLICA_DATABASE_URLS = [url.strip() for url in os.getenv("REPLICA_DATABASE_URLS", "").split(",") if url.strip()]
+        self.REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "30"))
+        self.REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", "10"))
+        
+        # Horizontal sharding of per-profile data (comma-separated name=url pairs; empty: DATABASE_URL only)
+        self.SHARD_DATABASE_URLS = [url.strip() for url in os.getenv("SHARD_DATABASE_URLS", "").split(",") if url.strip()]
+        self.SHARD_VIRTUAL_NODES = int(os.getenv("SHARD_VIRTUAL_NODES", "64"))
+        self.SHARD_MAP_REFRESH_SECONDS = float(os.getenv("SHARD_MAP_REFRESH_SECONDS", "30"))
+        
+        # Concurrent queries within one analytics request (each uses its own pooled connection)
+        self.ANALYTICS_QUERY_THREADS = int(os.getenv("ANALYTICS_QUERY_THREADS", "4"))
+        self.ANALYTICS_MAX_PARALLEL_QUERIES = int(os.getenv("ANALYTICS_MAX_PARALLEL_QUERIES", "3"))
+        
+        # Per-route statement timeouts (PostgreSQL)
+        self.TRACKING_STATEMENT_TIMEOUT_MS = int(os.getenv("TRACKING_STATEMENT_TIMEOUT_MS", "2000"))
+        self.ANALYTICS_STATEMENT_TIMEOUT_MS = int(os.getenv("ANALYTICS_STATEMENT_TIMEOUT_MS", "15000"))
+        
+        # Admission control per route class (tracking has priority; limits adapt down to hold the latency targets)
+        self.ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+        self.TRACKING_CONCURRENCY_MAX = int(os.getenv("TRACKING_CONCURRENCY_MAX", "64"))
+        self.TRACKING_LATENCY_TARGET_MS = int(os.getenv("TRACKING_LATENCY_TARGET_MS", "250"))
+        self.TRACKING_QUEUE_SIZE = int(os.getenv("TRACKING_QUEUE_SIZE", "2000"))
+        self.TRACKING_QUEUE_TIMEOUT_MS = int(os.getenv("TRACKING_QUEUE_TIMEOUT_MS", "2000"))
+        self.ANALYTICS_CONCURRENCY_MAX = int(os.getenv("ANALYTICS_CONCURRENCY_MAX", "8"))
+        self.ANALYTICS_LATENCY_TARGET_MS = int(os.getenv("ANALYTICS_LATENCY_TARGET_MS", "3000"))
+        self.ANALYTICS_QUEUE_SIZE = int(os.getenv("ANALYTICS_QUEUE_SIZE", "50"))
+        self.ANALYTICS_QUEUE_TIMEOUT_MS = int(os.getenv("ANALYTICS_QUEUE_TIMEOUT_MS", "5000"))
+        self.STALE_RESPONSE_ENTRIES = int(os.getenv("STALE_RESPONSE_ENTRIES", "256"))
+        self.STALE_RESPONSE_MAX_AGE = float(os.getenv("STALE_RESPONSE_MAX_AGE", "600"))
+        
+        # API settings
+        self.API_HOST = os.getenv("API_HOST", "0.0.0.0")
+        self.API_PORT = int(os.getenv("API_PORT", "8000"))
+        
+        # Security
+        self.SECRET_KEY = os.getenv("SECRET_KEY", "idkIDK168292")
+        self.ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")  # X-Admin-Token for /api/admin (disabled when unset)
+        
+        # Slow-request capture and on-demand stack sampling (per worker)
+        self.SLOW_REQUEST_THRESHOLD_MS = int(os.getenv("SLOW_REQUEST_THRESHOLD_MS", "2000"))
+        self.SLOW_REQUEST_BUFFER_SIZE = int(os.getenv("SLOW_REQUEST_BUFFER_SIZE", "50"))
+        self.SLOW_REQUEST_PROFILE_RATE = float(os.getenv("SLOW_REQUEST_PROFILE_RATE", "0.01"))
+        self.SLOW_REQUEST_ARM_COUNT = int(os.getenv("SLOW_REQUEST_ARM_COUNT", "5"))
+        self.PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+        
+        # Analytics settings
+        self.CLICK_BATCH_SIZE = int(os.getenv("CLICK_BATCH_SIZE", "1000"))
+        self.CLICK_BATCH_MAX_BYTES = int(os.getenv("CLICK_BATCH_MAX_BYTES", str(4 * 1024 * 1024)))  # after gunzip
+        self.TRACKING_MAX_EVENT_AGE_HOURS = int(os.getenv("TRACKING_MAX_EVENT_AGE_HOURS", "168"))  # oldest backdated batch event
+        self.ANALYTICS_CACHE_TTL = int(os.getenv("ANALYTICS_CACHE_TTL", "300"))  # 5 minutes (ETag time bucket)
+        self.GZIP_MINIMUM_SIZE = int(os.getenv("GZIP_MINIMUM_SIZE", "1024"))
+        
+        # Cached hourly aggregates behind /compare and /quick-stats
+        self.WINDOW_CACHE_MAX_PROFILES = int(os.getenv("WINDOW_CACHE_MAX_PROFILES", "1000"))
+        self.WINDOW_CACHE_MAX_AGE = int(os.getenv("WINDOW_CACHE_MAX_AGE", "3600"))  # full refetch, bounds late-event staleness
+        self.WINDOW_CACHE_MAX_IP_ENTRIES = int(os.getenv("WINDOW_CACHE_MAX_IP_ENTRIES", "1000000"))  # per-IP counts held for unique visitors
+
+        # Realtime push channel (SSE / WebSocket)
+        self.REALTIME_COALESCE_MS = int(os.getenv("REALTIME_COALESCE_MS", "1000"))
+        self.REALTIME_WATERMARK_INTERVAL = float(os.getenv("REALTIME_WATERMARK_INTERVAL", "5"))
+        self.REALTIME_KEEPALIVE_SECONDS = float(os.getenv("REALTIME_KEEPALIVE_SECONDS", "15"))
+
+        # Short-link redirects (/r/{link_id})
+        self.ROUTING_REFRESH_SECONDS = float(os.getenv("ROUTING_REFRESH_SECONDS", "30"))
+        self.REDIRECT_FLUSH_MS = int(os.getenv("REDIRECT_FLUSH_MS", "50"))
+
+        # Streaming anomaly detection on tracked event rates
+        self.ANOMALY_BUCKET_SECONDS = int(os.getenv("ANOMALY_BUCKET_SECONDS", "300"))
+        self.ANOMALY_ALPHA = float(os.getenv("ANOMALY_ALPHA", "0.1"))
+        self.ANOMALY_THRESHOLD = float(os.getenv("ANOMALY_THRESHOLD", "4"))
+        self.ANOMALY_WARMUP_BUCKETS = int(os.getenv("ANOMALY_WARMUP_BUCKETS", "12"))
+        self.ANOMALY_MAX_ENTITIES = int(os.getenv("ANOMALY_MAX_ENTITIES", "50000"))
+
+        # Top referrer hosts (Space-Saving summaries per profile and hour)
+        self.REFERRER_SKETCH_SIZE = int(os.getenv("REFERRER_SKETCH_SIZE", "64"))
+        self.REFERRER_FLUSH_SECONDS = float(os.getenv("REFERRER_FLUSH_SECONDS", "60"))
+
+        # Sessionization of page views and clicks into visits (sessionize.py)
+        self.SESSION_TIMEOUT_MINUTES = float(os.getenv("SESSION_TIMEOUT_MINUTES", "30"))
+        self.SESSIONIZER_BATCH_SIZE = int(os.getenv("SESSIONIZER_BATCH_SIZE", "50000"))
+        self.SESSIONIZER_MAX_OPEN = int(os.getenv("SESSIONIZER_MAX_OPEN", "200000"))
+
+        # Visitor bitmaps behind the retention cohorts (build_cohorts.py)
+        self.COHORT_BATCH_SIZE = int(os.getenv("COHORT_BATCH_SIZE", "50000"))
+        self.VISITOR_ID_CACHE_SIZE = int(os.getenv("VISITOR_ID_CACHE_SIZE", "500000"))
+
+        # Per-hour, per-source engagement counts behind the significance tests (build_engagement_stats.py)
+        self.ENGAGEMENT_STATS_BATCH_SIZE = int(os.getenv("ENGAGEMENT_STATS_BATCH_SIZE", "50000"))
+
+        # Ingest-time enrichment (offline GeoIP file: .mmdb or start_ip,end_ip,country CSV)
+        self.GEOIP_DATABASE = os.getenv("GEOIP_DATABASE", "data/geoip.csv")
+        self.GEOIP_CACHE_SIZE = int(os.getenv("GEOIP_CACHE_SIZE", "65536"))
+        self.UA_CACHE_SIZE = int(os.getenv("UA_CACHE_SIZE", "4096"))
+
+        # Ingest filtering (bots and rapid repeat clicks)
+        self.INGEST_FILTER_ENABLED = os.getenv("INGEST_FILTER_ENABLED", "true").lower() == "true"
+        self.DEDUP_WINDOW_SECONDS = float(os.getenv("DEDUP_WINDOW_SECONDS", "10"))
+        self.DEDUP_MAX_ENTRIES = int(os.getenv("DEDUP_MAX_ENTRIES", "100000"))
+
+        # Local spool for tracking events while the database is slow or down
+        self.SPOOL_DIR = os.getenv("SPOOL_DIR", "spool")
+        self.SPOOL_SEGMENT_BYTES = int(os.getenv("SPOOL_SEGMENT_BYTES", str(16 * 1024 * 1024)))
+        self.SPOOL_FSYNC_INTERVAL_MS = int(os.getenv("SPOOL_FSYNC_INTERVAL_MS", "50"))
+        self.SPOOL_LATENCY_BUDGET_MS = int(os.getenv("SPOOL_LATENCY_BUDGET_MS", "250"))
+        self.SPOOL_SLOW_WRITE_LIMIT = int(os.getenv("SPOOL_SLOW_WRITE_LIMIT", "5"))  # consecutive slow writes before spooling
+        self.SPOOL_REPLAY_INTERVAL = float(os.getenv("SPOOL_REPLAY_INTERVAL", "5"))
+        self.SPOOL_REPLAY_BATCH_SIZE = int(os.getenv("SPOOL_REPLAY_BATCH_SIZE", "5000"))
+
+def load_settings() -> Settings:
+    """Load .env into the environment, then read the settings"""
+    from dotenv import load_dotenv # type: ignore
+    load_dotenv()
+    return Settings()
+
+# Modules read `settings` (and build their singletons from it) when they are imported,
+# so the .env file is read once, on the first import of config
+settings = load_settings()
+
+# Test database connection
 def test_db_connection():
     try:
         import psycopg2 # type: ignore
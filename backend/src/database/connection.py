@@ -0,0 +1,245 @@
+import itertools
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
+from sqlalchemy.pool import QueuePool
+
+from config import settings
+
+Base = declarative_base()
+
+class PoolStats:
+    """Checkout wait time and utilization counters for one connection pool"""
+
+    def __init__(self, name: str, capacity: int):
+        self.name = name
+        self.capacity = capacity
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, wait: float, timed_out: bool = False) -> None:
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.total_wait += wait
+            if wait > self.max_wait:
+                self.max_wait = wait
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection"""
+
+    stats: PoolStats
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except PoolTimeoutError:
+            self.stats.record(time.perf_counter() - started, timed_out=True)
+            raise
+        self.stats.record(time.perf_counter() - started)
+        return connection
+
+pool_stats: Dict[str, PoolStats] = {}
+engines: Dict[str, Engine] = {}
+
+def build_engine(name: str, url: str, pool_size: int, max_overflow: int):
+    """Create an engine whose pool is sized and instrumented from settings"""
+    stats = pool_stats.setdefault(name, PoolStats(name, pool_size + max_overflow))
+    pool_class = type(f"{name.title()}QueuePool", (InstrumentedQueuePool,), {"stats": stats})
+    connect_args = {"check_same_thread": False} if url.startswith("sqlite") else {}
+    engines[name] = create_engine(
+        url,
+        poolclass=pool_class,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        connect_args=connect_args
+    )
+    return engines[name]
+
+# Primary engine: tracking writes and everything else
+engine = build_engine(
+    "primary", settings.DATABASE_URL,
+    settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW
+)
+
+# Separate, smaller pool for heavy analytics reads so they can't starve tracking writes
+analytics_engine = build_engine(
+    "analytics", settings.ANALYTICS_DATABASE_URL or settings.DATABASE_URL,
+    settings.ANALYTICS_POOL_SIZE, settings.ANALYTICS_MAX_OVERFLOW
+)
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AnalyticsSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=analytics_engine)
+
+# Replication lag in seconds; zero when the replica has replayed everything it received
+REPLICA_LAG_SQL = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() "
+    "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+class ReplicaState:
+    def __init__(self, name: str, db_engine: Engine):
+        self.name = name
+        self.engine = db_engine
+        self.healthy = True
+        self.lag_seconds = 0.0
+        self.last_checked = 0.0
+        self.last_error: Optional[str] = None
+
+class ReplicaRouter:
+    """
+    Picks the engine for analytics reads: round-robin over healthy replicas whose
+    replication lag is within max_lag_seconds, falling back to the primary's analytics
+    pool when none qualify. Health is re-checked lazily at most every check_interval.
+    """
+
+    def __init__(self, fallback_engine: Engine, replicas: List[ReplicaState],
+                 max_lag_seconds: float, check_interval: float):
+        self.fallback_engine = fallback_engine
+        self.replicas = replicas
+        self.max_lag_seconds = max_lag_seconds
+        self.check_interval = check_interval
+        self.fallbacks = 0
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def check(self, replica: ReplicaState) -> None:
+        try:
+            with replica.engine.connect() as connection:
+                if connection.dialect.name == "postgresql":
+                    replica.lag_seconds = float(connection.execute(REPLICA_LAG_SQL).scalar() or 0)
+                else:
+                    connection.execute(text("SELECT 1"))
+                    replica.lag_seconds = 0.0
+            replica.healthy = True
+            replica.last_error = None
+        except Exception as e:
+            replica.healthy = False
+            replica.last_error = str(e)
+        replica.last_checked = time.monotonic()
+
+    def _refresh_stale(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            stale = [r for r in self.replicas if now - r.last_checked >= self.check_interval]
+            for replica in stale:
+                # Claim the check so concurrent requests don't all probe the same replica
+                replica.last_checked = now
+        for replica in stale:
+            self.check(replica)
+
+    def choose_engine(self) -> Engine:
+        if not self.replicas:
+            return self.fallback_engine
+        self._refresh_stale()
+        usable = [r for r in self.replicas if r.healthy and r.lag_seconds <= self.max_lag_seconds]
+        if not usable:
+            self.fallbacks += 1
+            return self.fallback_engine
+        return usable[next(self._counter) % len(usable)].engine
+
+    def status(self) -> dict:
+        return {
+            "replicas": [
+                {
+                    "name": r.name,
+                    "healthy": r.healthy,
+                    "lag_seconds": round(r.lag_seconds, 3),
+                    "last_error": r.last_error
+                }
+                for r in self.replicas
+            ],
+            "max_lag_seconds": self.max_lag_seconds,
+            "primary_fallbacks": self.fallbacks
+        }
+
+replica_router = ReplicaRouter(
+    analytics_engine,
+    [
+        ReplicaState(
+            f"replica{i}",
+            build_engine(f"replica{i}", url, settings.ANALYTICS_POOL_SIZE, settings.ANALYTICS_MAX_OVERFLOW)
+        )
+        for i, url in enumerate(settings.REPLICA_DATABASE_URLS, start=1)
+    ],
+    max_lag_seconds=settings.REPLICA_MAX_LAG_SECONDS,
+    check_interval=settings.REPLICA_CHECK_INTERVAL
+)
+
+@event.listens_for(Session, "after_begin")
+def apply_statement_timeout(session, transaction, connection):
+    """Apply the session's statement timeout to every transaction it opens (PostgreSQL only)"""
+    timeout_ms = session.info.get("statement_timeout_ms")
+    if timeout_ms and connection.dialect.name == "postgresql":
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout_ms)}")
+
+def session_dependency(session_factory: sessionmaker, statement_timeout_ms: Optional[int] = None,
+                       router: Optional[ReplicaRouter] = None):
+    """
+    Build a FastAPI dependency yielding a session with an optional per-route statement
+    timeout. With a router, each session is bound to the engine it picks.
+    """
+    def get_session():
+        db = session_factory(bind=router.choose_engine()) if router else session_factory()
+        if statement_timeout_ms:
+            db.info["statement_timeout_ms"] = statement_timeout_ms
+        try:
+            yield db
+        finally:
+            db.close()
+    return get_session
+
+# Tracking and general routes
+get_db = session_dependency(SessionLocal, settings.TRACKING_STATEMENT_TIMEOUT_MS)
+
+# Analytics routes (read-only; served by replicas when configured)
+get_analytics_db = session_dependency(
+    AnalyticsSessionLocal, settings.ANALYTICS_STATEMENT_TIMEOUT_MS, router=replica_router
+)
+
+def get_pool_metrics() -> dict:
+    """Checkout wait times and utilization for every engine pool"""
+    metrics = {}
+    for name, db_engine in engines.items():
+        pool = db_engine.pool
+        stats = pool_stats[name]
+        metrics[name] = {
+            "size": pool.size(),
+            "capacity": stats.capacity,
+            "checked_out": pool.checkedout(),
+            "idle": pool.checkedin(),
+            "utilization": round(pool.checkedout() / stats.capacity, 3) if stats.capacity else 0.0,
+            "checkouts": stats.checkouts,
+            "timeouts": stats.timeouts,
+            "avg_wait_ms": round(stats.total_wait / stats.checkouts * 1000, 3) if stats.checkouts else 0.0,
+            "max_wait_ms": round(stats.max_wait * 1000, 3)
+        }
+    return metrics
+
+def test_connection() -> Tuple[bool, str]:
+    """Check database connectivity; returns (connected, server version or error)"""
+    try:
+        with engine.connect() as connection:
+            if connection.dialect.name == "postgresql":
+                version = connection.execute(text("SELECT version()")).scalar()
+            else:
+                connection.execute(text("SELECT 1"))
+                version = f"{connection.dialect.name} {connection.dialect.server_version_info}"
+        return True, version
+    except Exception as e:
+        return False, str(e)
@@ -0,0 +1,177 @@
+from datetime import datetime
+
+from sqlalchemy import (
+    BigInteger, Boolean, Column, Date, DateTime, Float, ForeignKey, Index, Integer, LargeBinary, SmallInteger, String, Text
+)
+from sqlalchemy.orm import relationship
+
+from database.connection import Base
+
+class LinkProfile(Base):
+    __tablename__ = "link_profiles"
+    # SQLite only honours a shard's id range (see database/sharding.py) with AUTOINCREMENT
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id = Column(Integer, primary_key=True, index=True)
+    username = Column(String(50), unique=True, nullable=False, index=True)
+    title = Column(String(200))
+    created_at = Column(DateTime, default=datetime.now, nullable=False)
+
+    links = relationship("Link", back_populates="profile")
+
+class Link(Base):
+    __tablename__ = "links"
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id = Column(Integer, primary_key=True, index=True)
+    profile_id = Column(Integer, ForeignKey("link_profiles.id"), nullable=False, index=True)
+    title = Column(String(100), nullable=False)
+    url = Column(Text, nullable=False)
+    position = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=datetime.now, nullable=False)
+
+    profile = relationship("LinkProfile", back_populates="links")
+
+class ClickEvent(Base):
+    __tablename__ = "click_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    link_id = Column(Integer, ForeignKey("links.id"), nullable=False, index=True)
+    profile_id = Column(Integer, ForeignKey("link_profiles.id"), nullable=False, index=True)
+    ip_address = Column(String(45))
+    user_agent = Column(Text)
+    referrer = Column(Text)
+    clicked_at = Column(DateTime, default=datetime.now, nullable=False, index=True)
+
+    # Ingest-time enrichment (see services/enrichment.py)
+    country = Column(String(2))
+    device_class = Column(SmallInteger)
+    browser_family = Column(SmallInteger)
+
+class PageView(Base):
+    __tablename__ = "page_views"
+
+    id = Column(Integer, primary_key=True, index=True)
+    profile_id = Column(Integer, ForeignKey("link_profiles.id"), nullable=False, index=True)
+    ip_address = Column(String(45))
+    user_agent = Column(Text)
+    referrer = Column(Text)
+    viewed_at = Column(DateTime, default=datetime.now, nullable=False, index=True)
+
+    # Ingest-time enrichment (see services/enrichment.py)
+    country = Column(String(2))
+    device_class = Column(SmallInteger)
+    browser_family = Column(SmallInteger)
+
+class VisitSession(Base):
+    """A visitor's burst of page views and clicks on one profile (see services/sessionizer.py)"""
+    __tablename__ = "visit_sessions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    profile_id = Column(Integer, ForeignKey("link_profiles.id"), nullable=False)
+    visitor_key = Column(BigInteger, nullable=False)  # 64-bit hash of ip_address + user_agent
+    started_at = Column(DateTime, nullable=False)
+    ended_at = Column(DateTime, nullable=False)
+    page_views = Column(Integer, default=0, nullable=False)
+    clicks = Column(Integer, default=0, nullable=False)
+    first_view_at = Column(DateTime)
+    first_click_at = Column(DateTime)
+    first_click_seconds = Column(Float)  # first view -> first click, when the click came after a view
+    is_open = Column(Boolean, default=True, nullable=False)
+
+    __table_args__ = (Index("ix_visit_sessions_profile_id_started_at", "profile_id", "started_at"),)
+
+class SessionizerCursor(Base):
+    """Highest click and page view ids already folded into visit_sessions"""
+    __tablename__ = "sessionizer_cursor"
+
+    id = Column(Integer, primary_key=True)
+    last_click_id = Column(Integer, default=0, nullable=False)
+    last_view_id = Column(Integer, default=0, nullable=False)
+    event_time_watermark = Column(DateTime)  # latest event time seen; sessions idle past the timeout before it are closed
+    updated_at = Column(DateTime, default=datetime.now, nullable=False)
+
+class ReferrerSketch(Base):
+    """Space-Saving top-K summary of one profile's referrer hosts for one hour (see services/referrers.py)"""
+    __tablename__ = "referrer_sketches"
+
+    id = Column(Integer, primary_key=True, index=True)
+    profile_id = Column(Integer, ForeignKey("link_profiles.id"), nullable=False)
+    kind = Column(String(5), nullable=False)  # 'click' or 'view'
+    hour_start = Column(DateTime, nullable=False)
+    total = Column(Integer, default=0, nullable=False)
+    sketch = Column(Text, nullable=False)  # JSON: [[host, count, error], ...]
+
+    __table_args__ = (
+        Index("ix_referrer_sketches_profile_id_kind_hour_start", "profile_id", "kind", "hour_start", unique=True),
+    )
+
+class VisitorId(Base):
+    """Dictionary encoding of visitor IP addresses to dense integer ids for the visitor bitmaps"""
+    __tablename__ = "visitor_ids"
+
+    id = Column(Integer, primary_key=True)
+    ip_address = Column(String(45), unique=True, nullable=False)
+
+class VisitorBitmap(Base):
+    """Compressed bitmap of the visitor ids seen on one profile on one day (see services/cohorts.py)"""
+    __tablename__ = "visitor_bitmaps"
+
+    id = Column(Integer, primary_key=True, index=True)
+    profile_id = Column(Integer, ForeignKey("link_profiles.id"), nullable=False)
+    day = Column(Date, nullable=False)
+    visitors = Column(Integer, default=0, nullable=False)
+    bitmap = Column(LargeBinary, nullable=False)
+
+    __table_args__ = (Index("ix_visitor_bitmaps_profile_id_day", "profile_id", "day", unique=True),)
+
+class VisitorBitmapCursor(Base):
+    """Highest click and page view ids already added to visitor_bitmaps"""
+    __tablename__ = "visitor_bitmap_cursor"
+
+    id = Column(Integer, primary_key=True)
+    last_click_id = Column(Integer, default=0, nullable=False)
+    last_view_id = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.now, nullable=False)
+
+class EngagementStat(Base):
+    """Clicks and page views of one profile in one hour of one day from one traffic source (see services/significance.py)"""
+    __tablename__ = "engagement_stats"
+
+    id = Column(Integer, primary_key=True, index=True)
+    profile_id = Column(Integer, ForeignKey("link_profiles.id"), nullable=False)
+    day = Column(Date, nullable=False)
+    hour = Column(SmallInteger, nullable=False)
+    source = Column(String(20), nullable=False)
+    clicks = Column(Integer, default=0, nullable=False)
+    views = Column(Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        Index("ix_engagement_stats_profile_id_day_hour_source", "profile_id", "day", "hour", "source", unique=True),
+    )
+
+class EngagementStatCursor(Base):
+    """Highest click and page view ids already counted in engagement_stats"""
+    __tablename__ = "engagement_stat_cursor"
+
+    id = Column(Integer, primary_key=True)
+    last_click_id = Column(Integer, default=0, nullable=False)
+    last_view_id = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.now, nullable=False)
+
+class ShardIdRange(Base):
+    """Profile and link ids a shard allocates (catalog database only; see database/sharding.py)"""
+    __tablename__ = "shard_id_ranges"
+
+    shard = Column(String(50), primary_key=True)
+    first_id = Column(Integer, nullable=False, unique=True)
+    last_id = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.now, nullable=False)
+
+class ProfileShard(Base):
+    """Pinned shard of a profile, overriding the hash ring (catalog database only; see database/sharding.py)"""
+    __tablename__ = "profile_shards"
+
+    profile_id = Column(Integer, primary_key=True)
+    shard = Column(String(50), nullable=False)
+    updated_at = Column(DateTime, default=datetime.now, nullable=False)
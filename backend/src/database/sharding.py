@@ -0,0 +1,299 @@
+import bisect
+import contextvars
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, TypeVar
+
+from sqlalchemy import func, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from config import settings
+from database.connection import (
+    AnalyticsSessionLocal,
+    ReplicaRouter,
+    SessionLocal,
+    analytics_engine,
+    build_engine,
+    engine,
+    replica_router
+)
+from database.models import Link, LinkProfile, ProfileShard, ShardIdRange
+
+T = TypeVar("T")
+
+def hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+class HashRing:
+    """
+    Consistent hash ring over shard names.
+
+    Each shard owns `virtual_nodes` points on a 64-bit ring and a key belongs to the
+    first point at or after its hash, so adding or removing a shard only moves the keys
+    of the ring segments it gains or loses (about 1/N of them).
+    """
+
+    def __init__(self, names: Iterable[str], virtual_nodes: int = 64):
+        points = sorted((hash64(f"{name}#{i}"), name) for name in names for i in range(virtual_nodes))
+        self._points = [point for point, _ in points]
+        self._names = [name for _, name in points]
+
+    def lookup(self, key: int) -> str:
+        index = bisect.bisect_left(self._points, hash64(str(key)))
+        return self._names[index % len(self._names)]
+
+class Shard:
+    """One database holding a subset of profiles, with its tracking and analytics pools"""
+
+    __slots__ = ("name", "engine", "analytics_engine", "router")
+
+    def __init__(self, name: str, write_engine: Engine, read_engine: Engine,
+                 router: Optional[ReplicaRouter] = None):
+        self.name = name
+        self.engine = write_engine
+        self.analytics_engine = read_engine
+        self.router = router
+
+    def session(self, analytics: bool = False) -> Session:
+        if not analytics:
+            return SessionLocal(bind=self.engine)
+        return AnalyticsSessionLocal(bind=self.router.choose_engine() if self.router else self.analytics_engine)
+
+    def __repr__(self) -> str:
+        return f"Shard({self.name!r})"
+
+def parse_shard_urls(entries: List[str]) -> List[Tuple[str, str]]:
+    """'name=url' pairs (or bare URLs, named shard0, shard1, ...) from SHARD_DATABASE_URLS"""
+    shards = []
+    for i, entry in enumerate(entries):
+        name, separator, url = entry.partition("=")
+        if not separator or "://" in name:
+            name, url = f"shard{i}", entry
+        shards.append((name.strip(), url.strip()))
+    return shards
+
+class ShardRouter:
+    """
+    Maps profile ids to the shard holding all of a profile's rows.
+
+    The hash ring decides by default. Profiles pinned in the catalog's profile_shards
+    table (DATABASE_URL) override it; the rebalancing tool pins profiles while they are
+    away from their ring position and moves them. Pins are reloaded every
+    refresh_interval, so lookups never touch the database. Without SHARD_DATABASE_URLS
+    there is a single shard on the existing engines (and read replicas).
+    """
+
+    def __init__(self, shards: List[Shard], virtual_nodes: int = 64, refresh_interval: float = 30.0):
+        self.shards: Dict[str, Shard] = {shard.name: shard for shard in shards}
+        self.ring = HashRing(self.shards, virtual_nodes)
+        self.refresh_interval = refresh_interval
+
+        self._pins: Dict[int, str] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.loaded_at: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+
+    @property
+    def sharded(self) -> bool:
+        return len(self.shards) > 1
+
+    def get(self, name: Optional[str] = None) -> Shard:
+        """Shard by name; without a name, the only shard (ValueError if there are several)"""
+        if name is None:
+            if self.sharded:
+                raise ValueError(f"several shards configured, pick one of: {', '.join(self.shards)}")
+            return next(iter(self.shards.values()))
+        if name not in self.shards:
+            raise ValueError(f"unknown shard {name!r} (configured: {', '.join(self.shards)})")
+        return self.shards[name]
+
+    def ring_shard(self, profile_id: int) -> Shard:
+        """Where the hash ring places a profile, ignoring pins"""
+        return self.shards[self.ring.lookup(profile_id)]
+
+    def shard_for(self, profile_id: int) -> Shard:
+        pinned = self._pins.get(profile_id)
+        if pinned is not None and pinned in self.shards:
+            return self.shards[pinned]
+        return self.ring_shard(profile_id)
+
+    def session(self, profile_id: int, analytics: bool = False) -> Session:
+        return self.shard_for(profile_id).session(analytics)
+
+    def partition(self, items: Iterable[T], key: Callable[[T], int] = lambda row: row["profile_id"]) -> Dict[Shard, List[T]]:
+        """Group items (rows with a profile_id by default) by the shard they belong to"""
+        if not self.sharded:
+            items = list(items)
+            return {next(iter(self.shards.values())): items} if items else {}
+        groups: Dict[Shard, List[T]] = {}
+        for item in items:
+            groups.setdefault(self.shard_for(key(item)), []).append(item)
+        return groups
+
+    def scatter(self, task: Callable[[Session], T], analytics: bool = True) -> Dict[str, T]:
+        """Run task on every shard in parallel (one session each); results by shard name"""
+        def run(shard: Shard) -> T:
+            db = shard.session(analytics)
+            try:
+                return task(db)
+            finally:
+                db.close()
+
+        if not self.sharded:
+            shard = next(iter(self.shards.values()))
+            return {shard.name: run(shard)}
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=len(self.shards), thread_name_prefix="shard-scatter")
+        futures = {
+            name: self._executor.submit(contextvars.copy_context().run, run, shard)
+            for name, shard in self.shards.items()
+        }
+        return {name: future.result() for name, future in futures.items()}
+
+    def load(self) -> int:
+        """Reload the pinned profiles from the catalog; returns how many there are"""
+        db = SessionLocal()
+        try:
+            pins = dict(db.query(ProfileShard.profile_id, ProfileShard.shard))
+        finally:
+            db.close()
+        self._pins = pins
+        self.loaded_at = datetime.now()
+        self.last_error = None
+        return len(pins)
+
+    def _refresh_loop(self) -> None:
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                self.load()
+            except Exception as e:
+                # Keep routing with the previous pins
+                self.last_error = str(e)
+
+    def start(self) -> None:
+        """Load the pins and keep them fresh (nothing to do with a single shard)"""
+        if not self.sharded or self._thread is not None:
+            return
+        try:
+            self.load()
+        except Exception as e:
+            self.last_error = str(e)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._refresh_loop, name="shard-map-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            "shards": list(self.shards),
+            "pinned_profiles": len(self._pins),
+            "loaded_at": self.loaded_at,
+            "last_error": self.last_error
+        }
+
+# Profile and link ids each shard allocates, so ids stay unique when profiles move between shards
+ID_RANGE_SIZE = 100_000_000
+RANGED_TABLES = (LinkProfile.__table__, Link.__table__)
+
+def load_id_ranges(db: Session) -> Dict[str, Tuple[int, int]]:
+    """Shard name -> (first_id, last_id) from the catalog"""
+    return {shard: (first_id, last_id) for shard, first_id, last_id in
+            db.query(ShardIdRange.shard, ShardIdRange.first_id, ShardIdRange.last_id)}
+
+def assign_id_ranges(db: Session, names: Iterable[str]) -> Dict[str, Tuple[int, int]]:
+    """Give every shard without an id range the next free one (the first shard keeps its ids from 1 up)"""
+    ranges = load_id_ranges(db)
+    next_id = max((last_id for _, last_id in ranges.values()), default=0) + 1
+    for name in names:
+        if name not in ranges:
+            ranges[name] = (next_id, next_id + ID_RANGE_SIZE - 1)
+            db.add(ShardIdRange(shard=name, first_id=next_id, last_id=next_id + ID_RANGE_SIZE - 1))
+            next_id += ID_RANGE_SIZE
+    db.commit()
+    return ranges
+
+def apply_id_range(conn: Connection, first_id: int, last_id: int) -> List[str]:
+    """
+    Make a shard's profile and link ids continue after the highest id it holds in its range.
+
+    Run again after copying rows with explicit ids into the shard. Returns warnings for
+    tables whose ids can't be confined to the range.
+    """
+    warnings = []
+    for table in RANGED_TABLES:
+        highest = conn.execute(
+            select(func.max(table.c.id)).where(table.c.id.between(first_id, last_id))
+        ).scalar()
+        next_id = (highest or first_id - 1) + 1
+        if conn.dialect.name == "postgresql":
+            sequence = conn.execute(text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": table.name}).scalar()
+            if sequence is None:
+                warnings.append(f"{table.name}.id has no sequence")
+                continue
+            conn.execute(text(
+                f"ALTER SEQUENCE {sequence} MINVALUE {first_id} MAXVALUE {last_id} START WITH {first_id} RESTART WITH {next_id}"
+            ))
+        elif conn.dialect.name == "sqlite":
+            ddl = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :table"),
+                               {"table": table.name}).scalar() or ""
+            if "AUTOINCREMENT" not in ddl.upper():
+                warnings.append(f"{table.name} was created without AUTOINCREMENT; recreate it to use the id range")
+                continue
+            # SQLite continues after the highest id in the table, whatever its sequence says
+            if conn.execute(select(func.count()).select_from(table).where(table.c.id > last_id)).scalar():
+                warnings.append(f"{table.name} holds ids above {last_id:,} (moved in from another shard); "
+                                "SQLite continues after them, so new ids may collide with that shard's")
+            updated = conn.execute(text("UPDATE sqlite_sequence SET seq = :seq WHERE name = :table"),
+                                   {"seq": next_id - 1, "table": table.name}).rowcount
+            if not updated:
+                conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES (:table, :seq)"),
+                             {"seq": next_id - 1, "table": table.name})
+        else:
+            warnings.append(f"id ranges are not supported on {conn.dialect.name}")
+            break
+    return warnings
+
+def build_shards() -> List[Shard]:
+    if not settings.SHARD_DATABASE_URLS:
+        return [Shard("primary", engine, analytics_engine, replica_router)]
+    return [
+        Shard(
+            name,
+            build_engine(f"shard_{name}", url, settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW),
+            build_engine(f"shard_{name}_analytics", url, settings.ANALYTICS_POOL_SIZE, settings.ANALYTICS_MAX_OVERFLOW)
+        )
+        for name, url in parse_shard_urls(settings.SHARD_DATABASE_URLS)
+    ]
+
+shard_router = ShardRouter(
+    build_shards(),
+    virtual_nodes=settings.SHARD_VIRTUAL_NODES,
+    refresh_interval=settings.SHARD_MAP_REFRESH_SECONDS
+)
+
+def profile_session_dependency(analytics: bool, statement_timeout_ms: Optional[int] = None):
+    """FastAPI dependency yielding a session on the shard of the request's profile_id"""
+    def get_session(profile_id: int):
+        db = shard_router.session(profile_id, analytics)
+        if statement_timeout_ms:
+            db.info["statement_timeout_ms"] = statement_timeout_ms
+        try:
+            yield db
+        finally:
+            db.close()
+    return get_session
+
+# Per-profile tracking writes and analytics reads
+get_profile_db = profile_session_dependency(False, settings.TRACKING_STATEMENT_TIMEOUT_MS)
+get_profile_analytics_db = profile_session_dependency(True, settings.ANALYTICS_STATEMENT_TIMEOUT_MS)
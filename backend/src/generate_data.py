@@ -0,0 +1,469 @@
+"""
+Synthetic data generator for large-scale local testing.
+
+Creates profiles and links, then streams click and page view events with realistic
+shapes: a diurnal curve with a weekend factor, a referrer mix covering the notebook's
+PLATFORM_MAPPING sources, a skewed pool of visitor IPs (each with a fixed country and
+device), Zipf-like profile popularity and position decay across links. Chunks are
+generated with NumPy in parallel worker processes and written straight to the target:
+
+    python generate_data.py --clicks 20000000 --views 80000000              # into DATABASE_URL
+    python generate_data.py --format parquet --output synthetic/ --views 1e8
+    python generate_data.py --format csv --output synthetic/                # COPY-ready CSV
+
+PostgreSQL targets are loaded with COPY (one connection per worker); other databases fall
+back to executemany. Run `python migrate.py` first when writing to a database.
+"""
+import argparse
+import io
+import multiprocessing
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import create_engine, insert
+from sqlalchemy.pool import NullPool
+
+try:
+    import pyarrow as pa  # type: ignore
+    import pyarrow.parquet as pq  # type: ignore
+except ImportError:
+    pa = pq = None
+
+from services.enrichment import parse_user_agent
+
+# Referrer URLs per PLATFORM_MAPPING source; None is direct traffic
+REFERRERS = {
+    "Instagram": ["https://l.instagram.com/", "https://www.instagram.com/"],
+    "TikTok": ["https://www.tiktok.com/", "https://vm.tiktok.com/"],
+    "Twitter": ["https://twitter.com/", "https://t.co/"],
+    "Facebook": ["https://l.facebook.com/", "https://m.facebook.com/"],
+    "Google": ["https://www.google.com/", "https://www.google.fr/"],
+    "WhatsApp": ["https://wa.me/", "https://web.whatsapp.com/"],
+    "Trafic Direct": [None],
+    "Autres Sources": ["https://www.youtube.com/", "https://www.reddit.com/", "https://news.ycombinator.com/"],
+}
+
+DEFAULT_REFERRER_MIX = "Instagram=0.35,TikTok=0.2,Twitter=0.08,Facebook=0.07,Google=0.06,WhatsApp=0.04,Trafic Direct=0.15,Autres Sources=0.05"
+
+USER_AGENTS = [
+    ("Mozilla/5.0 (iPhone; CPU iPhone OS 17_4 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148 Instagram 326.0.3.30.91", 0.20),
+    ("Mozilla/5.0 (iPhone; CPU iPhone OS 17_4 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.4 Mobile/15E148 Safari/604.1", 0.15),
+    ("Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Mobile Safari/537.36", 0.14),
+    ("Mozilla/5.0 (Linux; Android 14; SM-S918B) AppleWebKit/537.36 (KHTML, like Gecko) SamsungBrowser/24.0 Chrome/117.0.0.0 Mobile Safari/537.36", 0.06),
+    ("Mozilla/5.0 (Linux; Android 13; SM-A536B) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Mobile Safari/537.36 musical_ly_2023401030", 0.08),
+    ("Mozilla/5.0 (iPhone; CPU iPhone OS 16_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148 [FBAN/FBIOS;FBAV/455.0.0.44.110]", 0.05),
+    ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36", 0.12),
+    ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36 Edg/123.0.0.0", 0.04),
+    ("Mozilla/5.0 (Macintosh; Intel Mac OS X 14_4) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.4 Safari/605.1.15", 0.07),
+    ("Mozilla/5.0 (X11; Linux x86_64; rv:124.0) Gecko/20100101 Firefox/124.0", 0.03),
+    ("Mozilla/5.0 (iPad; CPU OS 17_4 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.4 Mobile/15E148 Safari/604.1", 0.04),
+    ("Mozilla/5.0 (Linux; Android 14) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36 OPR/80.0.0.0", 0.02),
+]
+
+COUNTRIES = [("FR", 0.30), ("US", 0.18), ("BE", 0.08), ("CA", 0.07), ("GB", 0.07), ("DE", 0.05),
+             ("MA", 0.05), ("CH", 0.04), ("ES", 0.04), ("SN", 0.03), ("IT", 0.03), ("BR", 0.02),
+             (None, 0.04)]
+
+# Relative traffic per hour of day: quiet nights, lunch bump, evening peak around 21h
+DEFAULT_DIURNAL = [0.35, 0.2, 0.12, 0.08, 0.07, 0.1, 0.25, 0.5, 0.7, 0.75, 0.8, 0.9,
+                   1.1, 1.0, 0.85, 0.85, 0.9, 1.0, 1.2, 1.45, 1.65, 1.75, 1.5, 0.9]
+
+TABLES = {"click": "click_events", "view": "page_views"}
+TIMESTAMP_COLUMNS = {"click": "clicked_at", "view": "viewed_at"}
+
+# Everything derived from the visitor sits together so COPY rows can reuse one pre-formatted field
+VISITOR_COLUMNS = ["ip_address", "country", "user_agent", "device_class", "browser_family"]
+COPY_COLUMNS = {
+    "click": ["link_id", "profile_id", "clicked_at"] + VISITOR_COLUMNS + ["referrer"],
+    "view": ["profile_id", "viewed_at"] + VISITOR_COLUMNS + ["referrer"],
+}
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    """'Instagram=0.4,TikTok=0.2' -> {'Instagram': 0.4, 'TikTok': 0.2}"""
+    weights = {}
+    for part in spec.split(","):
+        name, _, value = part.partition("=")
+        if name.strip() not in REFERRERS:
+            raise ValueError(f"Unknown referrer source {name.strip()!r}; use one of {', '.join(REFERRERS)}")
+        weights[name.strip()] = float(value)
+    return weights
+
+def normalized(weights) -> np.ndarray:
+    weights = np.asarray(weights, dtype=np.float64)
+    return weights / weights.sum()
+
+def csv_field(value: Optional[str]) -> str:
+    """COPY ... (FORMAT csv) field: empty for NULL, quoted otherwise"""
+    if value is None:
+        return ""
+    return '"' + value.replace('"', '""') + '"'
+
+def distinct_addresses(rng: np.random.Generator, count: int) -> np.ndarray:
+    """count distinct random unicast IPv4 addresses as integers"""
+    addresses = np.empty(0, dtype=np.int64)
+    while len(addresses) < count:
+        draw = rng.integers(0x01000000, 0xDF000000, size=count - len(addresses) + 1024, dtype=np.int64)
+        addresses = np.unique(np.concatenate([addresses, draw]))
+    return rng.permutation(addresses)[:count]
+
+class EventModel:
+    """
+    Everything a worker needs to sample events, built once in the parent process.
+
+    Per-event columns are integer indexes into small pools (IPs, user agents, referrers),
+    so generation is a handful of vectorized draws and output formats just look the pools up.
+    """
+
+    def __init__(self, args, profile_ids: np.ndarray, link_ids: np.ndarray,
+                 link_profile_index: np.ndarray, link_positions: np.ndarray):
+        rng = np.random.default_rng(args.seed)
+
+        self.profile_ids = profile_ids
+        self.link_ids = link_ids
+        self.link_profile_index = link_profile_index
+
+        # Profile popularity ~ Zipf; links within a profile decay with position
+        profile_weight = 1.0 / np.arange(1, len(profile_ids) + 1) ** args.profile_skew
+        rng.shuffle(profile_weight)
+        self.profile_cdf = np.cumsum(normalized(profile_weight))
+        link_weight = profile_weight[link_profile_index] / (link_positions + 1.0) ** args.position_decay
+        self.link_cdf = np.cumsum(normalized(link_weight))
+
+        # Diurnal curve x day-of-week factor, flattened to one weight per hour of the range.
+        # Timestamps are naive local time like the rest of the app, so epoch math stays naive too.
+        end = datetime.now().replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+        self.start_epoch = int((end - timedelta(days=args.days) - datetime(1970, 1, 1)).total_seconds())
+        hour_index = self.start_epoch // 3600 + np.arange(args.days * 24)
+        hour_of_day = (np.asarray(DEFAULT_DIURNAL) ** args.diurnal_strength)[hour_index % 24]
+        weekend = ((hour_index // 24 - 4) % 7) >= 5  # 1970-01-01 was a Thursday
+        self.hour_cdf = np.cumsum(normalized(hour_of_day * np.where(weekend, args.weekend_factor, 1.0)))
+
+        # Referrers: pick a source by weight, then one of its URLs uniformly
+        mix = parse_weights(args.referrers)
+        urls, url_weights = [], []
+        for source, weight in mix.items():
+            for url in REFERRERS[source]:
+                urls.append(url)
+                url_weights.append(weight / len(REFERRERS[source]))
+        self.referrers = urls
+        self.referrer_cdf = np.cumsum(normalized(url_weights))
+
+        # Visitors: a skewed pool of IPs, each with its own country and device
+        self.user_agents = [ua for ua, _ in USER_AGENTS]
+        self.countries = [country for country, _ in COUNTRIES]
+        self.ip_ints = distinct_addresses(rng, args.ips)
+        self.ip_user_agent = rng.choice(len(USER_AGENTS), size=args.ips, p=normalized([w for _, w in USER_AGENTS]))
+        self.ip_country = rng.choice(len(COUNTRIES), size=args.ips, p=normalized([w for _, w in COUNTRIES]))
+        self.ip_skew = args.ip_skew
+
+        parsed = [parse_user_agent(ua) for ua in self.user_agents]
+        self.ua_device = np.array([int(device) for device, _ in parsed], dtype=np.int16)
+        self.ua_browser = np.array([int(browser) for _, browser in parsed], dtype=np.int16)
+
+    def ip_strings(self) -> List[str]:
+        ints = self.ip_ints
+        return [f"{a}.{b}.{c}.{d}" for a, b, c, d in zip(ints >> 24, (ints >> 16) & 255, (ints >> 8) & 255, ints & 255)]
+
+    def sample(self, kind: str, size: int, seed: int) -> Dict[str, np.ndarray]:
+        """Index columns for one chunk of events (seconds since the epoch for the timestamp)"""
+        rng = np.random.default_rng(seed)
+        chunk = {}
+        if kind == "click":
+            chunk["link"] = np.searchsorted(self.link_cdf, rng.random(size), side="right")
+            chunk["profile"] = self.link_profile_index[chunk["link"]]
+        else:
+            chunk["profile"] = np.searchsorted(self.profile_cdf, rng.random(size), side="right")
+
+        # u ** skew concentrates draws on the low end of the pool: a few heavy repeat visitors
+        chunk["visitor"] = (rng.random(size) ** self.ip_skew * len(self.ip_ints)).astype(np.int64)
+        chunk["referrer"] = np.searchsorted(self.referrer_cdf, rng.random(size), side="right")
+
+        hour = np.searchsorted(self.hour_cdf, rng.random(size), side="right")
+        chunk["timestamp"] = self.start_epoch + hour * 3600 + rng.integers(0, 3600, size)
+        chunk["timestamp"].sort()  # roughly time-ordered inserts, like real traffic
+        return chunk
+
+    def columns(self, kind: str, chunk: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """Resolve a chunk's indexes into id / pool-index columns named like the table's"""
+        visitor = chunk["visitor"]
+        user_agent = self.ip_user_agent[visitor]
+        columns = {}
+        if kind == "click":
+            columns["link_id"] = self.link_ids[chunk["link"]]
+        columns["profile_id"] = self.profile_ids[chunk["profile"]]
+        columns[TIMESTAMP_COLUMNS[kind]] = chunk["timestamp"].astype("datetime64[s]")
+        columns["ip_address"] = visitor
+        columns["country"] = self.ip_country[visitor]
+        columns["user_agent"] = user_agent
+        columns["device_class"] = self.ua_device[user_agent]
+        columns["browser_family"] = self.ua_browser[user_agent]
+        columns["referrer"] = chunk["referrer"]
+        return columns
+
+# Worker process state (set once per process by init_worker)
+_model: Optional[EventModel] = None
+_pools: Dict[str, np.ndarray] = {}
+_writer = None
+
+def string_pool(values) -> np.ndarray:
+    return np.array(list(values), dtype=object)
+
+def init_worker(model: EventModel, target: str, output: Optional[str], database_url: Optional[str]) -> None:
+    global _model, _pools, _writer
+    _model = model
+    ips = model.ip_strings()
+    _pools = {
+        "ip_address": string_pool(ips),
+        "user_agent": string_pool(model.user_agents),
+        "referrer": string_pool(model.referrers),
+        "country": string_pool(model.countries),
+    }
+    if target == "parquet":
+        _writer = ParquetWriter(output)
+        return
+
+    # COPY text is assembled from pre-formatted pieces that carry their own trailing separator,
+    # so a chunk is a few pool lookups and a single "".join: ids and times of day come from
+    # string tables, and everything derived from the visitor (ip, country, user agent, device,
+    # browser) is one pre-joined field per IP
+    user_agent_fields = [
+        f"{csv_field(ua)},{device},{browser}"
+        for ua, device, browser in zip(model.user_agents, model.ua_device.tolist(), model.ua_browser.tolist())
+    ]
+    _pools.update({
+        "profile_csv": string_pool(f"{profile_id}," for profile_id in model.profile_ids.tolist()),
+        "link_csv": string_pool(f"{link_id}," for link_id in model.link_ids.tolist()),
+        "second_csv": string_pool(f"{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}," for s in range(86400)),
+        "visitor_csv": string_pool(
+            f"{ip},{csv_field(model.countries[country])},{user_agent_fields[ua]},"
+            for ip, country, ua in zip(ips, model.ip_country.tolist(), model.ip_user_agent.tolist())
+        ),
+        "referrer_csv": string_pool(csv_field(url) + "\n" for url in model.referrers),
+    })
+    if target == "db":
+        _writer = DatabaseWriter(database_url)
+    else:
+        _writer = CsvWriter(output)
+
+def to_csv(kind: str, chunk: Dict[str, np.ndarray]) -> str:
+    """COPY (FORMAT csv) text for a chunk, in COPY_COLUMNS[kind] order"""
+    timestamps = chunk["timestamp"]
+    first_day = int(timestamps[0]) // 86400
+    days = string_pool(
+        f"{np.datetime64(day, 'D')} " for day in range(first_day, int(timestamps[-1]) // 86400 + 1)
+    )
+    pieces = [
+        _pools["profile_csv"][chunk["profile"]],
+        days[timestamps // 86400 - first_day],
+        _pools["second_csv"][timestamps % 86400],
+        _pools["visitor_csv"][chunk["visitor"]],
+        _pools["referrer_csv"][chunk["referrer"]],
+    ]
+    if kind == "click":
+        pieces.insert(0, _pools["link_csv"][chunk["link"]])
+
+    # Interleave the columns into one flat list instead of joining each row separately
+    flat = np.empty(len(timestamps) * len(pieces), dtype=object)
+    for offset, piece in enumerate(pieces):
+        flat[offset::len(pieces)] = piece
+    return "".join(flat.tolist())
+
+def to_rows(kind: str, chunk: Dict[str, np.ndarray]) -> List[dict]:
+    columns = _model.columns(kind, chunk)
+    names = list(columns)
+    values = []
+    for name in names:
+        column = columns[name]
+        if name in _pools:
+            values.append(_pools[name][column].tolist())
+        elif column.dtype.kind == "M":
+            values.append(column.astype("datetime64[us]").tolist())
+        else:
+            values.append(column.tolist())
+    return [dict(zip(names, row)) for row in zip(*values)]
+
+class DatabaseWriter:
+    """COPY on PostgreSQL, executemany anywhere else"""
+
+    def __init__(self, database_url: str):
+        self.engine = create_engine(database_url, poolclass=NullPool)
+        self.copy = self.engine.dialect.name == "postgresql"
+
+    def write(self, kind: str, part: int, chunk: Dict[str, np.ndarray]) -> None:
+        if self.copy:
+            connection = self.engine.raw_connection()
+            try:
+                with connection.cursor() as cursor:
+                    cursor.copy_expert(
+                        f"COPY {TABLES[kind]} ({', '.join(COPY_COLUMNS[kind])}) FROM STDIN WITH (FORMAT csv)",
+                        io.StringIO(to_csv(kind, chunk))
+                    )
+                connection.commit()
+            finally:
+                connection.close()
+        else:
+            from database.models import ClickEvent, PageView
+            model = ClickEvent if kind == "click" else PageView
+            with self.engine.begin() as conn:
+                conn.execute(insert(model), to_rows(kind, chunk))
+
+class CsvWriter:
+    """One COPY-ready CSV file per chunk: <output>/<table>/part-NNNNN.csv"""
+
+    def __init__(self, output: str):
+        self.output = output
+
+    def write(self, kind: str, part: int, chunk: Dict[str, np.ndarray]) -> None:
+        with open(os.path.join(self.output, TABLES[kind], f"part-{part:05d}.csv"), "w") as f:
+            f.write(",".join(COPY_COLUMNS[kind]) + "\n")
+            f.write(to_csv(kind, chunk))
+
+class ParquetWriter:
+    """One Parquet file per chunk: <output>/<table>/part-NNNNN.parquet (dictionary-encoded strings)"""
+
+    def __init__(self, output: str):
+        self.output = output
+        self.dictionaries = {name: pa.array(pool.tolist(), type=pa.string()) for name, pool in _pools.items()}
+        # Pool entries that are None (direct traffic, unknown country) become nulls
+        self.nulls = {name: np.array([value is None for value in pool]) for name, pool in _pools.items()}
+
+    def write(self, kind: str, part: int, chunk: Dict[str, np.ndarray]) -> None:
+        arrays = {}
+        for name, column in _model.columns(kind, chunk).items():
+            if name in self.dictionaries:
+                indexes = pa.array(column.astype(np.int32), mask=self.nulls[name][column])
+                arrays[name] = pa.DictionaryArray.from_arrays(indexes, self.dictionaries[name])
+            else:
+                arrays[name] = pa.array(column)
+        pq.write_table(pa.table(arrays), os.path.join(self.output, TABLES[kind], f"part-{part:05d}.parquet"))
+
+def generate_chunk(task: Tuple[str, int, int, int]) -> Tuple[str, int]:
+    kind, part, size, seed = task
+    _writer.write(kind, part, _model.sample(kind, size, seed))
+    return kind, size
+
+def create_profiles_and_links(args) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Insert (or, for file targets, write) profiles and links; returns their ids and layout"""
+    rng = np.random.default_rng(args.seed)
+    links_per_profile = np.clip(rng.poisson(args.links_per_profile, args.profiles), 1, None)
+    link_profile_index = np.repeat(np.arange(args.profiles), links_per_profile)
+    link_positions = np.concatenate([np.arange(count) for count in links_per_profile])
+    prefix = args.prefix or f"synth{int(time.time())}_"
+    now = datetime.now()
+
+    profiles = [
+        {"username": f"{prefix}{i}", "title": f"Synthetic profile {i}", "created_at": now - timedelta(days=args.days)}
+        for i in range(args.profiles)
+    ]
+
+    if args.format == "db":
+        from database.models import Link, LinkProfile
+        engine = create_engine(args.database_url, poolclass=NullPool)
+        with engine.begin() as conn:
+            profile_ids = np.array(conn.execute(
+                insert(LinkProfile).returning(LinkProfile.id, sort_by_parameter_order=True), profiles
+            ).scalars().all(), dtype=np.int64)
+            links = [
+                {"profile_id": int(profile_ids[p]), "title": f"Link {pos + 1}",
+                 "url": f"https://example.com/{p}/{pos}", "position": int(pos),
+                 "created_at": now - timedelta(days=args.days)}
+                for p, pos in zip(link_profile_index.tolist(), link_positions.tolist())
+            ]
+            link_ids = np.array(conn.execute(
+                insert(Link).returning(Link.id, sort_by_parameter_order=True), links
+            ).scalars().all(), dtype=np.int64)
+        engine.dispose()
+    else:
+        profile_ids = np.arange(1, args.profiles + 1, dtype=np.int64)
+        link_ids = np.arange(1, len(link_profile_index) + 1, dtype=np.int64)
+        for table in ("link_profiles", "links", *TABLES.values()):
+            os.makedirs(os.path.join(args.output, table), exist_ok=True)
+        with open(os.path.join(args.output, "link_profiles", "link_profiles.csv"), "w") as f:
+            f.write("id,username,title,created_at\n")
+            for profile_id, profile in zip(profile_ids.tolist(), profiles):
+                f.write(f"{profile_id},{profile['username']},{profile['title']},{profile['created_at'].isoformat()}\n")
+        with open(os.path.join(args.output, "links", "links.csv"), "w") as f:
+            f.write("id,profile_id,title,url,position,created_at\n")
+            created_at = (now - timedelta(days=args.days)).isoformat()
+            for link_id, p, pos in zip(link_ids.tolist(), link_profile_index.tolist(), link_positions.tolist()):
+                f.write(f"{link_id},{profile_ids[p]},Link {pos + 1},https://example.com/{p}/{pos},{pos},{created_at}\n")
+
+    return profile_ids, link_ids, link_profile_index, link_positions
+
+def build_tasks(args) -> List[Tuple[str, int, int, int]]:
+    tasks = []
+    part = 0
+    for kind, total in (("view", args.views), ("click", args.clicks)):
+        for offset in range(0, total, args.chunk_size):
+            tasks.append((kind, part, min(args.chunk_size, total - offset), args.seed * 1_000_003 + part))
+            part += 1
+    return tasks
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    count = lambda value: int(float(value))  # accepts 1e8
+    parser.add_argument("--format", choices=["db", "parquet", "csv"], default="db")
+    parser.add_argument("--output", default="synthetic", help="directory for parquet/csv output")
+    parser.add_argument("--database-url", default=None, help="defaults to DATABASE_URL from the settings")
+    parser.add_argument("--profiles", type=count, default=1000)
+    parser.add_argument("--links-per-profile", type=float, default=8)
+    parser.add_argument("--views", type=count, default=1_000_000)
+    parser.add_argument("--clicks", type=count, default=250_000)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--ips", type=count, default=200_000, help="distinct visitor IPs")
+    parser.add_argument("--ip-skew", type=float, default=2.0, help="higher = more repeat visits from the same IPs")
+    parser.add_argument("--profile-skew", type=float, default=1.1, help="Zipf exponent of profile popularity")
+    parser.add_argument("--position-decay", type=float, default=0.8, help="link weight ~ 1 / (position + 1) ** decay")
+    parser.add_argument("--diurnal-strength", type=float, default=1.0, help="0 = flat day, 1 = default curve")
+    parser.add_argument("--weekend-factor", type=float, default=1.2)
+    parser.add_argument("--referrers", default=DEFAULT_REFERRER_MIX, help="source=weight,... over PLATFORM_MAPPING sources")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=count, default=250_000)
+    parser.add_argument("--seed", type=int, default=40)
+    parser.add_argument("--prefix", default=None, help="username prefix for generated profiles")
+    args = parser.parse_args(argv)
+    args.ips = min(args.ips, 0xDF000000 - 0x01000000)
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.format == "parquet" and pa is None:
+        raise SystemExit("Parquet output needs pyarrow: pip install pyarrow")
+    if args.format == "db" and args.database_url is None:
+        from config import settings
+        args.database_url = settings.DATABASE_URL
+
+    started = time.perf_counter()
+    profile_ids, link_ids, link_profile_index, link_positions = create_profiles_and_links(args)
+    model = EventModel(args, profile_ids, link_ids, link_profile_index, link_positions)
+    tasks = build_tasks(args)
+    print(f"{len(profile_ids):,} profiles, {len(link_ids):,} links; "
+          f"generating {args.views:,} views and {args.clicks:,} clicks in {len(tasks)} chunks on {args.workers} workers")
+
+    generation_started = time.perf_counter()
+    written = 0
+    total = args.views + args.clicks
+    initargs = (model, args.format, args.output, args.database_url)
+    if args.workers <= 1:
+        init_worker(*initargs)
+        results = map(generate_chunk, tasks)
+    else:
+        pool = multiprocessing.Pool(args.workers, initializer=init_worker, initargs=initargs)
+        results = pool.imap_unordered(generate_chunk, tasks)
+    for _, size in results:
+        written += size
+        elapsed = time.perf_counter() - generation_started
+        print(f"\r{written:,}/{total:,} events, {written / elapsed:,.0f} rows/s", end="", flush=True)
+    if args.workers > 1:
+        pool.close()
+        pool.join()
+
+    elapsed = time.perf_counter() - generation_started
+    print(f"\nDone: {written:,} events in {elapsed:.1f}s ({written / max(elapsed, 1e-9):,.0f} rows/s), "
+          f"{time.perf_counter() - started:.1f}s total")
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,29 @@
 from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from sqlalchemy.orm import Session
 from datetime import datetime
 import sys
 
 # Import our database and models
-from database.connection import get_db, test_connection, engine, Base
+from database.connection import get_db, test_connection, get_pool_metrics, replica_router
+from database.sharding import shard_router
 from routes.tracking import router as tracking_router
 
 # Create analytics routes
 from routes.analytics import router as analytics_router
-
-# Create all database tables
-Base.metadata.create_all(bind=engine)
+from routes.realtime import router as realtime_router
+from routes.redirects import router as redirects_router
+from routes.admin import router as admin_router
+from services.admission import AdmissionMiddleware, admission_controller, stale_responses
+from services.anomaly import anomaly_detector
+from services.http_cache import AnalyticsETagMiddleware
+from services.notifier import profile_hub
+from services.profiling import SlowRequestMiddleware, slow_requests
+from services.redirects import click_queue, routing_table
+from services.referrers import referrer_tracker
+from services.spool import event_spool
+from config import settings
 
 # Create FastAPI app
 app = FastAPI(
@@ -22,6 +33,11 @@ app = FastAPI(
     docs_url="/docs"
 )
 
+# Compress large responses and answer unchanged analytics polls with 304
+# (added before CORS so 304s still carry the CORS headers)
+app.add_middleware(GZipMiddleware, minimum_size=settings.GZIP_MINIMUM_SIZE)
+app.add_middleware(AnalyticsETagMiddleware, bucket_seconds=settings.ANALYTICS_CACHE_TTL)
+
 # Enable CORS for frontend
 app.add_middleware(
     CORSMiddleware,
@@ -31,9 +47,83 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Time /api/ requests (inside admission, so queueing isn't counted) and keep the slow ones
+app.add_middleware(SlowRequestMiddleware, recorder=slow_requests)
+
+# Outermost: shed or queue requests by route class before any other work is done for them
+if settings.ADMISSION_ENABLED:
+    app.add_middleware(AdmissionMiddleware, controller=admission_controller, stale_cache=stale_responses)
+
 # Include routers
 app.include_router(tracking_router)
 app.include_router(analytics_router)
+app.include_router(realtime_router)
+app.include_router(redirects_router)
+app.include_router(admin_router)
+
+@app.on_event("startup")
+async def start_shard_router():
+    """Load the pinned profiles from the catalog and keep them fresh (sharded setups only)"""
+    shard_router.start()
+
+@app.on_event("startup")
+async def start_event_spool():
+    """Start the spool fsync and replay threads"""
+    event_spool.start(
+        replay_interval=settings.SPOOL_REPLAY_INTERVAL,
+        replay_batch_size=settings.SPOOL_REPLAY_BATCH_SIZE
+    )
+
+@app.on_event("startup")
+async def start_profile_hub():
+    """Start the coalescing loop behind the realtime push channel"""
+    profile_hub.start()
+
+@app.on_event("startup")
+async def start_redirects():
+    """Load the link routing table and start the redirect click writer"""
+    routing_table.start()
+    click_queue.start()
+
+@app.on_event("startup")
+async def start_anomaly_detector():
+    """Close detector buckets on schedule and push anomalies to live dashboards"""
+    anomaly_detector.start(
+        lambda anomaly: profile_hub.broadcast(anomaly.profile_id, "anomaly", anomaly._asdict())
+    )
+
+@app.on_event("startup")
+async def start_referrer_tracker():
+    """Periodically merge this worker's referrer summaries into the database"""
+    referrer_tracker.start()
+
+@app.on_event("shutdown")
+async def stop_redirects():
+    """Write queued redirect clicks (to the database or spool) before the spool closes"""
+    routing_table.stop()
+    click_queue.stop()
+
+@app.on_event("shutdown")
+async def stop_referrer_tracker():
+    """Flush pending referrer summaries"""
+    referrer_tracker.stop()
+
+@app.on_event("shutdown")
+async def stop_event_spool():
+    """Make spooled events durable before the worker exits"""
+    event_spool.stop()
+
+@app.on_event("shutdown")
+async def stop_shard_router():
+    shard_router.stop()
+
+@app.on_event("shutdown")
+async def stop_profile_hub():
+    await profile_hub.stop()
+
+@app.on_event("shutdown")
+async def stop_anomaly_detector():
+    await anomaly_detector.stop()
 
 # Basic routes
 @app.get("/")
@@ -63,9 +153,23 @@ async def health_check():
         "service": "LinkPro Analytics API",
         "database": "Connected" if db_connected else "Disconnected",
         "database_info": db_info,
+        "event_spool": event_spool.stats(),
+        "read_replicas": replica_router.status(),
+        "admission": {**admission_controller.stats(), "stale_responses": len(stale_responses)},
+        "shards": shard_router.stats(),
+        "realtime": profile_hub.stats(),
+        "redirects": {"routing_table": routing_table.stats(), "click_queue": click_queue.stats()},
+        "anomaly_detector": anomaly_detector.stats(),
+        "referrer_tracker": referrer_tracker.stats(),
+        "slow_requests": slow_requests.stats(),
         "python_version": f"{sys.version_info.major}.{sys.version_info.minor}.{sys.version_info.micro}"
     }
 
+@app.get("/api/system/pools")
+async def pool_metrics():
+    """Connection pool checkout wait times and utilization"""
+    return get_pool_metrics()
+
 @app.get("/api/system/info")
 async def system_info():
     """Get system information"""
@@ -88,6 +192,9 @@ if __name__ == "__main__":
     print("- Time Analytics: /api/analytics/time/{profile_id}")
     print("- Quick Stats: /api/analytics/quick-stats/{profile_id}")
     print("- Period Comparison: /api/analytics/compare/{profile_id}")
+    print("- Anomalies: /api/analytics/anomalies/{profile_id}")
+    print("- Short-link redirects: /r/{link_id}")
+    print("- Shard overview: /api/admin/shards")
     print("Use 'uvicorn src.main:app --reload' for development with hot reload")
     
     import uvicorn
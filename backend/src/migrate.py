@@ -0,0 +1,130 @@
+"""
+Explicit schema management for LinkPro Analytics.
+
+The API no longer creates tables at import time; run this once per deploy instead:
+
+    python migrate.py            # create any missing tables, columns and indexes
+    python migrate.py --check    # list missing tables and columns without changing anything
+
+With SHARD_DATABASE_URLS set, every shard gets the full schema and DATABASE_URL (the
+catalog) only the profile_shards and shard_id_ranges tables. Each shard is then given
+its own range of profile and link ids (database/sharding.py), so ids stay unique across
+shards.
+"""
+import sys
+
+from sqlalchemy import Index, inspect, text
+
+from config import settings
+from database.connection import SessionLocal, engine, Base
+from database.models import ClickEvent, PageView, ProfileShard, ShardIdRange
+from database.sharding import apply_id_range, assign_id_ranges, load_id_ranges, shard_router
+
+# Indexes the ORM models don't declare
+EXTRA_INDEXES = [
+    # Per-profile max(id) watermark behind the analytics ETags
+    Index("ix_click_events_profile_id_id", ClickEvent.profile_id, ClickEvent.id),
+    Index("ix_page_views_profile_id_id", PageView.profile_id, PageView.id),
+]
+
+# Columns added to existing tables after their first release
+ADDED_COLUMNS = [
+    # Ingest-time enrichment (services/enrichment.py)
+    ClickEvent.__table__.c.country,
+    ClickEvent.__table__.c.device_class,
+    ClickEvent.__table__.c.browser_family,
+    PageView.__table__.c.country,
+    PageView.__table__.c.device_class,
+    PageView.__table__.c.browser_family,
+]
+
+def targets() -> list:
+    """(label, engine, tables) for every database this deployment uses"""
+    if not settings.SHARD_DATABASE_URLS:
+        return [("primary", engine, Base.metadata.sorted_tables)]
+    catalog_tables = [ProfileShard.__table__, ShardIdRange.__table__]
+    shard_tables = [table for table in Base.metadata.sorted_tables if table not in catalog_tables]
+    return [("catalog", engine, catalog_tables)] + [
+        (f"shard {name}", shard.engine, shard_tables) for name, shard in shard_router.shards.items()
+    ]
+
+def missing_tables(bind, tables) -> list:
+    existing = set(inspect(bind).get_table_names())
+    return [table.name for table in tables if table.name not in existing]
+
+def missing_columns(bind, tables) -> list:
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    missing = []
+    for column in ADDED_COLUMNS:
+        table = column.table.name
+        # New tables are created with every column already
+        if column.table in tables and table in existing_tables \
+                and column.name not in {c["name"] for c in inspector.get_columns(table)}:
+            missing.append(column)
+    return missing
+
+def migrate(bind, tables) -> list:
+    """Create missing tables, columns and indexes; returns the names of the tables that were created"""
+    missing = missing_tables(bind, tables)
+    Base.metadata.create_all(bind=bind, tables=tables)
+    with bind.begin() as conn:
+        for column in missing_columns(bind, tables):
+            column_type = column.type.compile(dialect=bind.dialect)
+            conn.execute(text(f"ALTER TABLE {column.table.name} ADD COLUMN {column.name} {column_type}"))
+    for index in EXTRA_INDEXES:
+        if index.table in tables:
+            index.create(bind=bind, checkfirst=True)
+    return missing
+
+def missing_id_ranges() -> list:
+    """Shards without an id range in the catalog (none without sharding)"""
+    if not settings.SHARD_DATABASE_URLS:
+        return []
+    if ShardIdRange.__tablename__ not in inspect(engine).get_table_names():
+        return list(shard_router.shards)
+    db = SessionLocal()
+    try:
+        ranges = load_id_ranges(db)
+    finally:
+        db.close()
+    return [name for name in shard_router.shards if name not in ranges]
+
+def migrate_id_ranges() -> None:
+    """Assign id ranges to new shards and point every shard's id sequences into its range"""
+    db = SessionLocal()
+    try:
+        ranges = assign_id_ranges(db, shard_router.shards)
+    finally:
+        db.close()
+    for name, shard in shard_router.shards.items():
+        first_id, last_id = ranges[name]
+        with shard.engine.begin() as conn:
+            warnings = apply_id_range(conn, first_id, last_id)
+        print(f"[shard {name}] Profile and link ids {first_id:,} to {last_id:,}")
+        for warning in warnings:
+            print(f"[shard {name}] Warning: {warning}")
+
+if __name__ == "__main__":
+    if "--check" in sys.argv:
+        outdated = False
+        for label, bind, tables in targets():
+            missing = missing_tables(bind, tables)
+            columns = [f"{column.table.name}.{column.name}" for column in missing_columns(bind, tables)]
+            if missing:
+                print(f"[{label}] Missing tables: {', '.join(missing)}")
+            if columns:
+                print(f"[{label}] Missing columns: {', '.join(columns)}")
+            if not missing and not columns:
+                print(f"[{label}] Schema is up to date")
+            outdated = outdated or bool(missing or columns)
+        unranged = missing_id_ranges()
+        if unranged:
+            print(f"[catalog] Shards without an id range: {', '.join(unranged)}")
+        sys.exit(1 if outdated or unranged else 0)
+
+    for label, bind, tables in targets():
+        created = migrate(bind, tables)
+        print(f"[{label}] Created tables: {', '.join(created)}" if created else f"[{label}] Schema is up to date")
+    if settings.SHARD_DATABASE_URLS:
+        migrate_id_ranges()
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from datetime import datetime
+from datetime import date, datetime
 from typing import List, Optional, Dict, Any
 
 class BasicMetrics(BaseModel):
@@ -42,6 +42,204 @@ class TrafficAnalytics(BaseModel):
     total_clicks: int
     total_views: int
 
+class DeviceBreakdown(BaseModel):
+    """Clicks and views for one device class"""
+    device: str
+    clicks: int
+    views: int
+    percentage: float
+
+class BrowserBreakdown(BaseModel):
+    """Clicks and views for one browser family"""
+    browser: str
+    clicks: int
+    views: int
+    percentage: float
+
+class DeviceAnalytics(BaseModel):
+    """Device class and browser family analysis"""
+    profile_id: int
+    devices: List[DeviceBreakdown]
+    browsers: List[BrowserBreakdown]
+    total_clicks: int
+    total_views: int
+
+class CountryBreakdown(BaseModel):
+    """Clicks and views for one country (ISO 3166 alpha-2, or 'unknown')"""
+    country: str
+    clicks: int
+    views: int
+    percentage: float
+
+class GeoAnalytics(BaseModel):
+    """Geographic analysis"""
+    profile_id: int
+    countries: List[CountryBreakdown]
+    total_clicks: int
+    total_views: int
+
+class ReferrerCount(BaseModel):
+    """Estimated events from one referrer host"""
+    host: str  # '(direct)' for events without a referrer
+    count: int  # upper bound: never below the true count
+    lower_bound: int  # count - error: never above the true count
+    error: int
+    percentage: float
+
+class ReferrerRanking(BaseModel):
+    """Top referrer hosts for one event type"""
+    total: int
+    error_bound: int  # no estimate is off by more than this (total / sketch_size)
+    referrers: List[ReferrerCount]
+
+class ReferrerAnalytics(BaseModel):
+    """Top referrer hosts from the ingest-time Space-Saving summaries"""
+    profile_id: int
+    sketch_size: int
+    hours: int  # stored hourly summaries merged for this range
+    clicks: ReferrerRanking
+    views: ReferrerRanking
+
+class SessionAnalytics(BaseModel):
+    """Visit-based engagement from the sessionizer"""
+    profile_id: int
+    total_sessions: int
+    sessions_with_views: int
+    converted_sessions: int  # sessions with a page view followed by at least one click
+    session_ctr: float  # converted_sessions / sessions_with_views, in percent
+    bounce_rate: float  # single-view sessions without a click, in percent of sessions_with_views
+    avg_views_per_session: float
+    avg_clicks_per_converted_session: float
+
+class TimeToClickBucket(BaseModel):
+    """Converted sessions whose first click came within [min_seconds, max_seconds)"""
+    label: str
+    min_seconds: float
+    max_seconds: Optional[float] = None
+    sessions: int
+    percentage: float
+
+class TimeToClickDistribution(BaseModel):
+    """Time from a session's first page view to its first click"""
+    profile_id: int
+    converted_sessions: int
+    mean_seconds: Optional[float] = None
+    percentiles: Dict[str, float]
+    buckets: List[TimeToClickBucket]
+
+class WeeklyVisitors(BaseModel):
+    """Distinct visitors (by IP address) in one Monday-based week"""
+    week_start: date
+    visitors: int
+    returning_visitors: int  # also visited the week before
+    new_visitors: int  # not seen in any earlier week of the report (or the week before it)
+    returning_rate: float  # returning_visitors / visitors, in percent
+
+class RetentionCohort(BaseModel):
+    """Visitors first seen in one week, and how many came back in each following week"""
+    week_start: date
+    size: int
+    retained: List[int]  # retained[k]: cohort visitors seen k weeks later (retained[0] == size)
+    retention: List[float]  # retained as a percentage of size
+
+class CohortAnalytics(BaseModel):
+    """Returning-visitor counts and weekly retention cohorts from the visitor bitmaps"""
+    profile_id: int
+    weeks: List[WeeklyVisitors]
+    cohorts: List[RetentionCohort]
+
+class AnomalyRecord(BaseModel):
+    """A bucket whose event count deviated sharply from its baseline"""
+    link_id: Optional[int] = None
+    metric: str  # profile_views, profile_clicks or link_clicks
+    kind: str  # spike or drop
+    bucket_start: datetime
+    observed: int
+    expected: float
+    z_score: float
+
+class RateBaseline(BaseModel):
+    """Live per-bucket baseline for one tracked rate"""
+    link_id: Optional[int] = None
+    metric: str
+    current: int
+    expected: float
+    std_dev: float
+    warm: bool
+
+class AnomalyReport(BaseModel):
+    """Recent anomalies and current baselines for a profile"""
+    profile_id: int
+    bucket_seconds: int
+    anomalies: List[AnomalyRecord]
+    baselines: List[RateBaseline]
+
+class SignificanceTest(BaseModel):
+    """One hypothesis test over pre-aggregated engagement counts"""
+    test: str  # kruskal_wallis, mann_whitney_u or chi_square
+    groups: List[str]
+    statistic: float
+    pvalue: float
+    significant: bool  # pvalue < alpha
+    effect_size: Optional[float] = None  # Rosenthal's r (Mann-Whitney) or Cramér's V (chi-square)
+
+class ConfidenceInterval(BaseModel):
+    """Estimate with its confidence interval for one group of events"""
+    group: str
+    events: int
+    estimate: float
+    lower: float
+    upper: float
+
+class SignificanceAnalytics(BaseModel):
+    """The notebook's temporal and traffic source significance tests, from the engagement_stats counts"""
+    profile_id: int
+    start_date: date
+    end_date: date
+    alpha: float
+    confidence_level: float
+    events: int
+    hourly_test: Optional[SignificanceTest] = None
+    weekend_test: Optional[SignificanceTest] = None
+    time_slot_test: Optional[SignificanceTest] = None
+    source_independence_test: Optional[SignificanceTest] = None
+    source_click_rate_test: Optional[SignificanceTest] = None
+    engagement_mean: Optional[ConfidenceInterval] = None
+    click_rate: Optional[ConfidenceInterval] = None
+    time_slot_engagement: List[ConfidenceInterval]
+    source_click_rates: List[ConfidenceInterval]
+    contingency_table: Dict[str, Dict[str, int]]  # traffic source -> {"clicks": n, "views": n}
+
+class ShardSummary(BaseModel):
+    """Row counts on one shard"""
+    shard: str
+    profiles: int
+    links: int
+    clicks: int
+    views: int
+
+class ShardOverview(BaseModel):
+    """Row counts per shard, gathered from all shards in parallel"""
+    shards: List[ShardSummary]
+    pinned_profiles: int  # profiles routed away from their hash ring shard
+    total_profiles: int
+    total_clicks: int
+    total_views: int
+
+class ProfileRank(BaseModel):
+    """One profile's event counts in a cross-profile ranking"""
+    profile_id: int
+    username: str
+    shard: str
+    clicks: int
+    views: int
+
+class TopProfiles(BaseModel):
+    """Most clicked profiles across all shards"""
+    start_date: datetime
+    end_date: datetime
+    profiles: List[ProfileRank]
+
 class TimeBasedMetrics(BaseModel):
     """Metrics for a specific time period"""
     period: str  
@@ -57,6 +255,8 @@ class TimeAnalytics(BaseModel):
     peak_hour: Optional[int] = None  
     peak_day: Optional[str] = None  
     best_time_recommendation: Optional[str] = None
+    best_time_pvalue: Optional[float] = None  # Kruskal-Wallis across hours (hourly) or weekdays (daily)
+    best_time_significant: Optional[bool] = None
 
 class AnalyticsPeriod(BaseModel):
     """Date range for analytics queries"""
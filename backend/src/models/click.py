@@ -1,6 +1,6 @@
 from pydantic import BaseModel, validator # type: ignore
 from datetime import datetime
-from typing import Optional
+from typing import Optional, List
 import ipaddress
 
 class ClickEventBase(BaseModel):
@@ -66,4 +66,17 @@ class TrackingResponse(BaseModel):
     status: str
     message: str
     timestamp: datetime
-    event_id: Optional[int] = None
\ No newline at end of file
+    event_id: Optional[int] = None
+
+class BatchEventStatus(BaseModel):
+    index: int
+    status: str  # accepted, filtered or rejected
+    error: Optional[str] = None
+
+class BatchTrackingResponse(BaseModel):
+    status: str
+    accepted: int
+    filtered: int
+    rejected: int
+    timestamp: datetime
+    results: List[BatchEventStatus]
\ No newline at end of file
@@ -0,0 +1,35 @@
+from pydantic import BaseModel
+from datetime import datetime
+from typing import List, Optional
+
+class SqlStatement(BaseModel):
+    """One statement executed while serving a request"""
+    statement: str
+    duration_ms: float
+    executemany: bool
+
+class SlowRequestSummary(BaseModel):
+    """A request that exceeded SLOW_REQUEST_THRESHOLD_MS"""
+    id: int
+    started_at: datetime
+    method: str
+    path: str
+    query: str
+    route: str  # path with ids replaced, e.g. GET /api/analytics/profile/{id}
+    status: int
+    duration_ms: float
+    sql_count: int
+    sql_ms: float  # time spent in the database, summed over statements
+    profiled: bool
+
+class SlowRequestDetail(SlowRequestSummary):
+    """A slow request with its SQL statements and cProfile report"""
+    queries: List[SqlStatement]  # first 200 statements
+    profile: Optional[str] = None  # top functions by cumulative time, when the request was profiled
+
+class SlowRequestList(BaseModel):
+    """Most recent slow requests captured by this worker"""
+    threshold_ms: int
+    requests: int
+    slow_requests: int
+    captures: List[SlowRequestSummary]
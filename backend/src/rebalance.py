@@ -0,0 +1,301 @@
+"""
+Online rebalancing of profiles between shards (SHARD_DATABASE_URLS).
+
+    python rebalance.py --plan                  # profiles stored away from their hash ring shard
+    python rebalance.py --pin                   # pin such profiles where they are (see below)
+    python rebalance.py                         # move them to their ring shard, in batches
+    python rebalance.py --profile 42 --to b     # move one profile to a given shard (stays pinned there)
+
+Adding a shard changes the hash ring, so before the API runs with the new
+SHARD_DATABASE_URLS: run `python migrate.py` and `python rebalance.py --pin` with the new
+setting, so every profile keeps being routed to the shard that holds it. Then deploy and
+run `python rebalance.py` to move the pinned profiles while traffic continues.
+
+Each batch copies the profiles, their links (with ids, which migrate.py keeps unique
+across shards) and their events (without ids) to the target, pins the profiles there and
+waits for every worker to pick up the new shard map (--settle, SHARD_MAP_REFRESH_SECONDS
+plus a margin by default). Events written to the source meanwhile are copied after the
+wait, referrer summaries are merged, and the source rows are deleted. Sessions, visitor
+bitmaps and engagement stats are not copied: the copied events get new ids on the target,
+so its sessionize.py, build_cohorts.py and build_engagement_stats.py jobs rebuild them.
+
+Run one rebalancer at a time. A move interrupted after its pin leaves a stale copy on the
+source shard; --plan lists those. Profiles created before the shards had id ranges may
+share an id with a different profile (another username) on another shard; --plan lists
+those as conflicts, and they are never pinned or moved.
+"""
+import argparse
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+from config import settings
+from database.connection import SessionLocal
+from database.models import (
+    ClickEvent,
+    EngagementStat,
+    Link,
+    LinkProfile,
+    PageView,
+    ProfileShard,
+    ReferrerSketch,
+    VisitorBitmap,
+    VisitSession
+)
+from database.sharding import apply_id_range, load_id_ranges, shard_router
+from services.referrers import SpaceSaving, referrer_tracker
+
+EVENT_MODELS = (ClickEvent, PageView)
+# Deleted from the source, in foreign key order; derived rows are rebuilt on the target
+PROFILE_MODELS = (ClickEvent, PageView, VisitSession, ReferrerSketch, VisitorBitmap, EngagementStat, Link)
+
+# (profile_id, source shard, target shard)
+Move = Tuple[int, str, str]
+
+def locate_profiles() -> Dict[int, Dict[str, str]]:
+    """profile_id -> {shard name: username} for the shards holding a link_profiles row for it"""
+    located: Dict[int, Dict[str, str]] = {}
+    rows = shard_router.scatter(lambda db: db.query(LinkProfile.id, LinkProfile.username).all(), analytics=False)
+    for name, profiles in rows.items():
+        for profile_id, username in profiles:
+            located.setdefault(profile_id, {})[name] = username
+    return located
+
+def is_conflict(copies: Dict[str, str]) -> bool:
+    """Whether the rows sharing a profile id are different profiles (created on several shards)"""
+    return len(set(copies.values())) > 1
+
+def current_shard(profile_id: int, names) -> str:
+    """Shard whose copy of a profile is authoritative: the routed one if it has the profile"""
+    routed = shard_router.shard_for(profile_id).name
+    return routed if routed in names else next(iter(names))
+
+def plan(located: Dict[int, Dict[str, str]]) -> Tuple[List[Move], List[Tuple[int, str]], List[int]]:
+    """Profiles away from their ring shard, stale copies left by interrupted moves, and conflicting ids"""
+    moves = []
+    stale = []
+    conflicts = []
+    for profile_id, names in sorted(located.items()):
+        if is_conflict(names):
+            conflicts.append(profile_id)
+            continue
+        current = current_shard(profile_id, names)
+        stale.extend((profile_id, name) for name in names if name != current)
+        target = shard_router.ring_shard(profile_id).name
+        if current != target:
+            moves.append((profile_id, current, target))
+    return moves, stale, conflicts
+
+def set_pins(pins: Dict[int, Optional[str]]) -> None:
+    """Write (or, for None, drop) pins in the catalog and reload this process's shard map"""
+    db = SessionLocal()
+    try:
+        for profile_id, shard in pins.items():
+            if shard is None:
+                db.execute(delete(ProfileShard).where(ProfileShard.profile_id == profile_id))
+            else:
+                db.merge(ProfileShard(profile_id=profile_id, shard=shard, updated_at=datetime.now()))
+        db.commit()
+    finally:
+        db.close()
+    shard_router.load()
+
+def copy_rows(source: Session, target: Session, model, profile_id: int, after_id: int = 0,
+              chunk_size: int = 5000) -> int:
+    """Copy a profile's events with id > after_id (new ids on the target); returns the last source id"""
+    columns = [column for column in model.__table__.c if column.name != "id"]
+    while True:
+        rows = source.execute(
+            select(model.id, *columns).where(model.profile_id == profile_id, model.id > after_id)
+            .order_by(model.id).limit(chunk_size)
+        ).all()
+        if not rows:
+            return after_id
+        target.execute(insert(model), [dict(zip((column.name for column in columns), row[1:])) for row in rows])
+        target.commit()
+        after_id = rows[-1][0]
+
+def check_target(source: Session, target: Session, profile_id: int) -> None:
+    """ValueError if the target holds a different profile (another username) under the profile's id"""
+    username = source.execute(select(LinkProfile.username).where(LinkProfile.id == profile_id)).scalar()
+    existing = target.execute(select(LinkProfile.username).where(LinkProfile.id == profile_id)).scalar()
+    if existing is not None and existing != username:
+        raise ValueError(f"profile id {profile_id} belongs to {existing!r} on the target, not {username!r}")
+
+def copy_profile(source: Session, target: Session, profile_id: int, id_range: Tuple[int, int]) -> List[str]:
+    """
+    Copy the profile and its links (those not there yet) with their ids, so links and events keep resolving.
+
+    id_range is the target's: its id sequences are moved past the copied ids afterwards, so
+    the target never allocates them again. Returns the warnings of that step.
+    """
+    check_target(source, target, profile_id)
+    profile = source.execute(select(*LinkProfile.__table__.c).where(LinkProfile.id == profile_id)).one()
+    if target.execute(select(LinkProfile.id).where(LinkProfile.id == profile_id)).first() is None:
+        target.execute(insert(LinkProfile), [profile._asdict()])
+
+    links = source.execute(select(*Link.__table__.c).where(Link.profile_id == profile_id)).all()
+    taken = dict(target.execute(
+        select(Link.id, Link.profile_id).where(Link.id.in_([link.id for link in links]))
+    ).all()) if links else {}
+    others = sorted(link_id for link_id, owner in taken.items() if owner != profile_id)
+    if others:
+        raise ValueError(f"link ids {', '.join(map(str, others[:10]))} belong to other profiles on the target")
+    links = [link._asdict() for link in links if link.id not in taken]
+    if links:
+        target.execute(insert(Link), links)
+    return apply_id_range(target.connection(), *id_range)
+
+def merge_sketches(source: Session, target: Session, profile_id: int) -> None:
+    for row in source.query(ReferrerSketch).filter(ReferrerSketch.profile_id == profile_id):
+        sketch = SpaceSaving.from_json(row.sketch, referrer_tracker.capacity, row.total)
+        existing = target.query(ReferrerSketch).filter(
+            ReferrerSketch.profile_id == profile_id,
+            ReferrerSketch.kind == row.kind,
+            ReferrerSketch.hour_start == row.hour_start
+        ).with_for_update().first()
+        if existing is None:
+            target.add(ReferrerSketch(profile_id=profile_id, kind=row.kind, hour_start=row.hour_start,
+                                      total=sketch.total, sketch=sketch.to_json()))
+            continue
+        merged = SpaceSaving.from_json(existing.sketch, referrer_tracker.capacity, existing.total).merge(sketch)
+        existing.total = merged.total
+        existing.sketch = merged.to_json()
+
+def purge_profile(db: Session, profile_id: int) -> None:
+    for model in PROFILE_MODELS:
+        db.execute(delete(model).where(model.profile_id == profile_id))
+    db.execute(delete(LinkProfile).where(LinkProfile.id == profile_id))
+
+def move_batch(moves: List[Move], id_ranges: Dict[str, Tuple[int, int]], settle: float, chunk_size: int,
+               log=print) -> None:
+    last_ids: Dict[Tuple[int, type], int] = {}
+
+    # 1. Bulk copy while the source still takes all writes
+    for profile_id, source_name, target_name in moves:
+        source = shard_router.shards[source_name].session()
+        target = shard_router.shards[target_name].session()
+        try:
+            # Leftovers of an earlier attempt (the profile was never routed there)
+            check_target(source, target, profile_id)
+            purge_profile(target, profile_id)
+            for warning in copy_profile(source, target, profile_id, id_ranges[target_name]):
+                log(f"{target_name}: {warning}")
+            target.commit()
+            for model in EVENT_MODELS:
+                last_ids[(profile_id, model)] = copy_rows(source, target, model, profile_id, chunk_size=chunk_size)
+        except Exception:
+            target.rollback()
+            raise
+        finally:
+            source.close()
+            target.close()
+        log(f"profile {profile_id}: copied {source_name} -> {target_name}")
+
+    # 2. Switch new writes to the target and let every worker reload the shard map
+    set_pins({profile_id: target_name for profile_id, _, target_name in moves})
+    log(f"pinned {len(moves)} profiles, waiting {settle:.0f}s for workers to pick up the shard map")
+    time.sleep(settle)
+
+    # 3. Copy what arrived on the source in the meantime, then drop it there
+    for profile_id, source_name, target_name in moves:
+        source = shard_router.shards[source_name].session()
+        target = shard_router.shards[target_name].session()
+        try:
+            # Links created during the wait, then the events
+            copy_profile(source, target, profile_id, id_ranges[target_name])
+            target.commit()
+            for model in EVENT_MODELS:
+                copy_rows(source, target, model, profile_id, last_ids[(profile_id, model)], chunk_size)
+            merge_sketches(source, target, profile_id)
+            target.commit()
+            purge_profile(source, profile_id)
+            source.commit()
+        except Exception:
+            source.rollback()
+            target.rollback()
+            raise
+        finally:
+            source.close()
+            target.close()
+        log(f"profile {profile_id}: moved to {target_name}")
+
+    # Profiles now on their ring shard need no pin
+    set_pins({
+        profile_id: None for profile_id, _, target_name in moves
+        if shard_router.ring_shard(profile_id).name == target_name
+    })
+
+def main():
+    parser = argparse.ArgumentParser(description="Move profiles between shards")
+    parser.add_argument("--plan", action="store_true",
+                        help="list misplaced profiles, stale copies and conflicting ids, change nothing")
+    parser.add_argument("--pin", action="store_true", help="pin misplaced profiles to the shard holding them")
+    parser.add_argument("--profile", type=int, help="move only this profile (with --to)")
+    parser.add_argument("--to", help="target shard for --profile (default: its ring shard)")
+    parser.add_argument("--batch-size", type=int, default=100, help="profiles per batch (one settle wait each)")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="events per copy statement")
+    parser.add_argument("--settle", type=float, default=settings.SHARD_MAP_REFRESH_SECONDS + 5,
+                        help="seconds to wait after pinning for workers to reload the shard map")
+    parser.add_argument("--limit", type=int, help="move at most this many profiles")
+    args = parser.parse_args()
+    if args.to is not None and args.to not in shard_router.shards:
+        parser.error(f"unknown shard {args.to!r} (configured: {', '.join(shard_router.shards)})")
+
+    db = SessionLocal()
+    try:
+        id_ranges = load_id_ranges(db)
+    finally:
+        db.close()
+    unranged = [name for name in shard_router.shards if name not in id_ranges]
+    if unranged:
+        sys.exit(f"Shards without an id range: {', '.join(unranged)}; run `python migrate.py` first")
+
+    shard_router.load()
+    located = locate_profiles()
+    moves, stale, conflicts = plan(located)
+
+    if args.profile is not None:
+        if args.profile not in located:
+            parser.error(f"profile {args.profile} not found on any shard")
+        if args.profile in conflicts:
+            parser.error(f"profile id {args.profile} belongs to different profiles on "
+                         f"{', '.join(located[args.profile])}; rename one of them first")
+        source = current_shard(args.profile, located[args.profile])
+        target = args.to or shard_router.ring_shard(args.profile).name
+        moves = [(args.profile, source, target)] if source != target else []
+
+    if args.plan:
+        for profile_id, source, target in moves:
+            print(f"profile {profile_id}: on {source}, ring shard {target}")
+        for profile_id, name in stale:
+            print(f"profile {profile_id}: stale copy on {name} (check for unmoved events, then delete)")
+        for profile_id in conflicts:
+            owners = ", ".join(f"{username!r} on {name}" for name, username in located[profile_id].items())
+            print(f"profile id {profile_id}: different profiles ({owners}), not moved")
+        print(f"{len(moves):,} profiles to move, {len(stale):,} stale copies, {len(conflicts):,} conflicting ids")
+        return
+
+    if args.pin:
+        pins = {}
+        for profile_id, names in located.items():
+            if is_conflict(names):
+                continue
+            current = current_shard(profile_id, names)
+            if shard_router.shard_for(profile_id).name != current:
+                pins[profile_id] = None if shard_router.ring_shard(profile_id).name == current else current
+        set_pins(pins)
+        print(f"Updated {len(pins):,} pins to the shard holding each profile")
+        return
+
+    moves = moves[:args.limit] if args.limit else moves
+    for start in range(0, len(moves), args.batch_size):
+        move_batch(moves[start:start + args.batch_size], id_ranges, args.settle, args.chunk_size)
+    print(f"Moved {len(moves):,} profiles" if moves else "Nothing to move")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+from datetime import datetime, timedelta
+from typing import Optional
+import hmac
+
+from config import settings
+from database.sharding import shard_router
+from models.analytics import ProfileRank, ShardOverview, ShardSummary, TopProfiles
+from models.profiling import SlowRequestDetail, SlowRequestList, SlowRequestSummary, SqlStatement
+from services.analytics import AnalyticsService
+from services.profiling import SlowRequest, collapsed, slow_requests, stack_sampler
+
+router = APIRouter(prefix="/api/admin", tags=["admin"])
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Admin routes expose every profile, code paths and SQL: only with the configured ADMIN_TOKEN"""
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled; set ADMIN_TOKEN to enable them")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, settings.ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid or missing X-Admin-Token")
+
+@router.get("/shards", response_model=ShardOverview, dependencies=[Depends(require_admin)])
+async def get_shard_overview():
+    """Profile, link and event counts on every shard (queried in parallel)"""
+    try:
+        counts = await run_in_threadpool(shard_router.scatter, lambda db: AnalyticsService(db).count_rows())
+        shards = [ShardSummary(shard=name, **shard_counts) for name, shard_counts in counts.items()]
+        return ShardOverview(
+            shards=shards,
+            pinned_profiles=shard_router.stats()["pinned_profiles"],
+            total_profiles=sum(shard.profiles for shard in shards),
+            total_clicks=sum(shard.clicks for shard in shards),
+            total_views=sum(shard.views for shard in shards)
+        )
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting shard overview: {str(e)}")
+
+@router.get("/top-profiles", response_model=TopProfiles, dependencies=[Depends(require_admin)])
+async def get_top_profiles(
+    days: int = Query(7, ge=1, le=365, description="Number of days to analyze (default: 7)"),
+    limit: int = Query(20, ge=1, le=100, description="Number of profiles to return")
+):
+    """
+    Most clicked profiles across all shards.
+
+    Each shard returns its own top `limit`; a profile lives on exactly one shard, so the
+    merged and re-sorted lists give the exact global top `limit`.
+    """
+    try:
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=days)
+
+        results = await run_in_threadpool(
+            shard_router.scatter,
+            lambda db: AnalyticsService(db).top_profiles(start_date, end_date, limit)
+        )
+        ranked = sorted(
+            (
+                ProfileRank(profile_id=profile_id, username=username, shard=name, clicks=clicks, views=views)
+                for name, rows in results.items()
+                for profile_id, username, clicks, views in rows
+            ),
+            key=lambda profile: profile.clicks,
+            reverse=True
+        )
+        return TopProfiles(start_date=start_date, end_date=end_date, profiles=ranked[:limit])
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting top profiles: {str(e)}")
+
+def summarize_capture(capture: SlowRequest) -> dict:
+    fields = capture._asdict()
+    fields.pop("queries")
+    fields["profiled"] = fields.pop("profile") is not None
+    return fields
+
+@router.get("/profiling/sample", response_class=PlainTextResponse, dependencies=[Depends(require_admin)])
+async def sample_stacks(
+    seconds: float = Query(10, gt=0, le=settings.PROFILE_MAX_SECONDS, description="How long to sample"),
+    interval_ms: float = Query(10, ge=1, le=1000, description="Time between samples"),
+    idle: bool = Query(False, description="Include threads that are only waiting")
+):
+    """
+    Sample every thread of the worker that serves this request and return collapsed stacks.
+
+    The output (one `frame;frame;... count` line per distinct stack) feeds flamegraph.pl,
+    speedscope or inferno directly. With several workers, each call samples only one of them.
+    """
+    try:
+        stacks, passes = await run_in_threadpool(stack_sampler.sample, seconds, interval_ms / 1000, idle)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(collapsed(stacks), headers={"X-Sample-Passes": str(passes)})
+
+@router.get("/profiling/slow-requests", response_model=SlowRequestList, dependencies=[Depends(require_admin)])
+async def get_slow_requests(limit: int = Query(50, ge=1, le=500, description="Number of captures to return")):
+    """Most recent requests over SLOW_REQUEST_THRESHOLD_MS in this worker, newest first"""
+    stats = slow_requests.stats()
+    return SlowRequestList(
+        threshold_ms=stats["threshold_ms"],
+        requests=stats["requests"],
+        slow_requests=stats["slow_requests"],
+        captures=[SlowRequestSummary(**summarize_capture(capture)) for capture in slow_requests.recent(limit)]
+    )
+
+@router.get("/profiling/slow-requests/{capture_id}", response_model=SlowRequestDetail, dependencies=[Depends(require_admin)])
+async def get_slow_request(capture_id: int):
+    """One captured slow request with its SQL statements and cProfile report"""
+    capture = slow_requests.get(capture_id)
+    if capture is None:
+        raise HTTPException(status_code=404, detail="Capture not found (the ring buffer may have dropped it)")
+    return SlowRequestDetail(
+        **summarize_capture(capture),
+        queries=[SqlStatement(statement=statement, duration_ms=duration, executemany=executemany)
+                 for statement, duration, executemany in capture.queries],
+        profile=capture.profile
+    )
@@ -1,12 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 from typing import Optional
 
-from database.connection import get_db
+from database.sharding import get_profile_analytics_db
 from database.models import LinkProfile
-from models.analytics import ProfileAnalytics, TrafficAnalytics, TimeAnalytics
-from services.analytics import AnalyticsService
+from models.analytics import (
+    ProfileAnalytics, TrafficAnalytics, TimeAnalytics, DeviceAnalytics, GeoAnalytics, AnomalyReport,
+    SessionAnalytics, TimeToClickDistribution, ReferrerAnalytics, CohortAnalytics, SignificanceAnalytics
+)
+from services.analytics import AnalyticsService, compare_metrics
+from services.anomaly import anomaly_detector
+from services.time_series import (
+    BINARY_MEDIA_TYPE,
+    COLUMNAR_MEDIA_TYPE,
+    negotiate_format,
+    to_binary,
+    to_columnar
+)
+from services.window_cache import window_aggregator
 
 router = APIRouter(prefix="/api/analytics", tags=["analytics"])
 
@@ -20,12 +33,17 @@ def parse_date(date_string: str) -> datetime:
         except ValueError:
             raise HTTPException(status_code=400, detail=f"Invalid date format: {date_string}. Use YYYY-MM-DD or ISO format")
 
+def check_date_range(start_dt: Optional[datetime], end_dt: Optional[datetime]) -> None:
+    """Reject a start after the end (which defaults to now)"""
+    if start_dt and start_dt > (end_dt or datetime.now()):
+        raise HTTPException(status_code=422, detail="start_date must not be after end_date")
+
 @router.get("/profile/{profile_id}", response_model=ProfileAnalytics)
 async def get_profile_analytics(
     profile_id: int,
     start_date: Optional[str] = Query(None, description="Start date (YYYY-MM-DD)"),
     end_date: Optional[str] = Query(None, description="End date (YYYY-MM-DD)"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_profile_analytics_db)
 ):
     """Get complete analytics for a profile"""
     try:
@@ -56,7 +74,7 @@ async def get_traffic_analytics(
     profile_id: int,
     start_date: Optional[str] = Query(None, description="Start date (YYYY-MM-DD)"),
     end_date: Optional[str] = Query(None, description="End date (YYYY-MM-DD)"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_profile_analytics_db)
 ):
     """Get traffic source analytics for a profile"""
     try:
@@ -82,15 +100,241 @@ async def get_traffic_analytics(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting traffic analytics: {str(e)}")
 
+@router.get("/devices/{profile_id}", response_model=DeviceAnalytics)
+async def get_device_analytics(
+    profile_id: int,
+    start_date: Optional[str] = Query(None, description="Start date (YYYY-MM-DD)"),
+    end_date: Optional[str] = Query(None, description="End date (YYYY-MM-DD)"),
+    db: Session = Depends(get_profile_analytics_db)
+):
+    """Get device class and browser family breakdown for a profile"""
+    try:
+        # Verify profile exists
+        profile = db.query(LinkProfile).filter(LinkProfile.id == profile_id).first()
+        if not profile:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        
+        # Parse dates
+        start_dt = parse_date(start_date) if start_date else None
+        end_dt = parse_date(end_date) if end_date else None
+        
+        # Aggregate the columns filled in at ingest
+        analytics_service = AnalyticsService(db)
+        return analytics_service.analyze_devices(
+            profile_id=profile_id,
+            start_date=start_dt,
+            end_date=end_dt
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting device analytics: {str(e)}")
+
+@router.get("/geo/{profile_id}", response_model=GeoAnalytics)
+async def get_geo_analytics(
+    profile_id: int,
+    start_date: Optional[str] = Query(None, description="Start date (YYYY-MM-DD)"),
+    end_date: Optional[str] = Query(None, description="End date (YYYY-MM-DD)"),
+    db: Session = Depends(get_profile_analytics_db)
+):
+    """Get country breakdown for a profile"""
+    try:
+        # Verify profile exists
+        profile = db.query(LinkProfile).filter(LinkProfile.id == profile_id).first()
+        if not profile:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        
+        # Parse dates
+        start_dt = parse_date(start_date) if start_date else None
+        end_dt = parse_date(end_date) if end_date else None
+        
+        # Aggregate the columns filled in at ingest
+        analytics_service = AnalyticsService(db)
+        return analytics_service.analyze_geography(
+            profile_id=profile_id,
+            start_date=start_dt,
+            end_date=end_dt
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting geo analytics: {str(e)}")
+
+@router.get("/referrers/{profile_id}", response_model=ReferrerAnalytics)
+async def get_referrer_analytics(
+    profile_id: int,
+    start_date: Optional[str] = Query(None, description="Start date (YYYY-MM-DD), defaults to 30 days ago"),
+    end_date: Optional[str] = Query(None, description="End date (YYYY-MM-DD)"),
+    limit: int = Query(20, ge=1, le=100, description="Number of hosts to return"),
+    db: Session = Depends(get_profile_analytics_db)
+):
+    """Get the top referrer hosts for a profile, with error bounds"""
+    try:
+        # Verify profile exists
+        profile = db.query(LinkProfile).filter(LinkProfile.id == profile_id).first()
+        if not profile:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        
+        # Parse dates
+        start_dt = parse_date(start_date) if start_date else None
+        end_dt = parse_date(end_date) if end_date else None
+        
+        # Merge the hourly summaries kept at ingest instead of scanning raw referrers
+        analytics_service = AnalyticsService(db)
+        return analytics_service.analyze_referrers(
+            profile_id=profile_id,
+            start_date=start_dt,
+            end_date=end_dt,
+            limit=limit
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting referrer analytics: {str(e)}")
+
+@router.get("/cohorts/{profile_id}", response_model=CohortAnalytics)
+async def get_cohort_analytics(
+    profile_id: int,
+    weeks: int = Query(8, ge=1, le=52, description="Number of weeks to report"),
+    end_date: Optional[str] = Query(None, description="Any date in the last reported week (YYYY-MM-DD)"),
+    db: Session = Depends(get_profile_analytics_db)
+):
+    """Get returning visitors and weekly retention cohorts for a profile"""
+    try:
+        # Verify profile exists
+        profile = db.query(LinkProfile).filter(LinkProfile.id == profile_id).first()
+        if not profile:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        
+        # Parse dates
+        end_dt = parse_date(end_date) if end_date else None
+        
+        # Combine the daily visitor bitmaps written by build_cohorts.py
+        analytics_service = AnalyticsService(db)
+        return analytics_service.analyze_cohorts(
+            profile_id=profile_id,
+            weeks=weeks,
+            end_date=end_dt
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting cohort analytics: {str(e)}")
+
+@router.get("/significance/{profile_id}", response_model=SignificanceAnalytics)
+async def get_significance_analytics(
+    profile_id: int,
+    start_date: Optional[str] = Query(None, description="Start date (YYYY-MM-DD), defaults to 30 days ago"),
+    end_date: Optional[str] = Query(None, description="End date (YYYY-MM-DD)"),
+    db: Session = Depends(get_profile_analytics_db)
+):
+    """Get significance tests of temporal and traffic source patterns for a profile"""
+    try:
+        # Verify profile exists
+        profile = db.query(LinkProfile).filter(LinkProfile.id == profile_id).first()
+        if not profile:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        
+        # Parse dates
+        start_dt = parse_date(start_date) if start_date else None
+        end_dt = parse_date(end_date) if end_date else None
+        
+        # Test the hourly counts written by build_engagement_stats.py instead of the events
+        analytics_service = AnalyticsService(db)
+        return analytics_service.analyze_significance(
+            profile_id=profile_id,
+            start_date=start_dt,
+            end_date=end_dt
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting significance analytics: {str(e)}")
+
+@router.get("/sessions/{profile_id}", response_model=SessionAnalytics)
+async def get_session_analytics(
+    profile_id: int,
+    start_date: Optional[str] = Query(None, description="Start date (YYYY-MM-DD)"),
+    end_date: Optional[str] = Query(None, description="End date (YYYY-MM-DD)"),
+    db: Session = Depends(get_profile_analytics_db)
+):
+    """Get visit-based click-through for a profile"""
+    try:
+        # Verify profile exists
+        profile = db.query(LinkProfile).filter(LinkProfile.id == profile_id).first()
+        if not profile:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        
+        # Parse dates
+        start_dt = parse_date(start_date) if start_date else None
+        end_dt = parse_date(end_date) if end_date else None
+        
+        # Read the visits written by sessionize.py
+        analytics_service = AnalyticsService(db)
+        return analytics_service.analyze_sessions(
+            profile_id=profile_id,
+            start_date=start_dt,
+            end_date=end_dt
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting session analytics: {str(e)}")
+
+@router.get("/time-to-click/{profile_id}", response_model=TimeToClickDistribution)
+async def get_time_to_click_analytics(
+    profile_id: int,
+    start_date: Optional[str] = Query(None, description="Start date (YYYY-MM-DD)"),
+    end_date: Optional[str] = Query(None, description="End date (YYYY-MM-DD)"),
+    db: Session = Depends(get_profile_analytics_db)
+):
+    """Get the distribution of time from first page view to first click"""
+    try:
+        # Verify profile exists
+        profile = db.query(LinkProfile).filter(LinkProfile.id == profile_id).first()
+        if not profile:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        
+        # Parse dates
+        start_dt = parse_date(start_date) if start_date else None
+        end_dt = parse_date(end_date) if end_date else None
+        
+        # Read the visits written by sessionize.py
+        analytics_service = AnalyticsService(db)
+        return analytics_service.time_to_click_distribution(
+            profile_id=profile_id,
+            start_date=start_dt,
+            end_date=end_dt
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting time-to-click analytics: {str(e)}")
+
 @router.get("/time/{profile_id}", response_model=TimeAnalytics)
 async def get_time_analytics(
+    request: Request,
+    response: Response,
     profile_id: int,
     granularity: str = Query('daily', description="Time granularity: 'hourly' or 'daily'"),
     start_date: Optional[str] = Query(None, description="Start date (YYYY-MM-DD)"),
     end_date: Optional[str] = Query(None, description="End date (YYYY-MM-DD)"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_profile_analytics_db)
 ):
-    """Get time-based analytics for a profile"""
+    """
+    Get time-based analytics for a profile.
+
+    Send `Accept: application/vnd.linkpro.timeseries+json` for columnar arrays
+    (start + step + clicks[] + views[] + unique_visitors[]) or
+    `Accept: application/vnd.linkpro.timeseries` for packed int32 columns.
+    """
     try:
         # Validate granularity
         if granularity not in ['hourly', 'daily']:
@@ -101,12 +345,36 @@ async def get_time_analytics(
         if not profile:
             raise HTTPException(status_code=404, detail="Profile not found")
         
-        # Parse dates
+        # Parse dates (an inverted range has no periods to densify)
         start_dt = parse_date(start_date) if start_date else None
         end_dt = parse_date(end_date) if end_date else None
+        check_date_range(start_dt, end_dt)
         
         # Get analytics
         analytics_service = AnalyticsService(db)
+        
+        # Compact formats skip the per-period Pydantic models entirely
+        compact_format = negotiate_format(request.headers.get("accept"))
+        if compact_format:
+            columns, meta = analytics_service.get_time_series(
+                profile_id=profile_id,
+                granularity=granularity,
+                start_date=start_dt,
+                end_date=end_dt
+            )
+            if compact_format == "binary":
+                return Response(
+                    content=to_binary(columns),
+                    media_type=BINARY_MEDIA_TYPE,
+                    headers={"Vary": "Accept"}
+                )
+            return JSONResponse(
+                to_columnar(columns, **meta),
+                media_type=COLUMNAR_MEDIA_TYPE,
+                headers={"Vary": "Accept"}
+            )
+        
+        response.headers["Vary"] = "Accept"
         return analytics_service.analyze_time_patterns(
             profile_id=profile_id,
             granularity=granularity,
@@ -123,7 +391,7 @@ async def get_time_analytics(
 async def get_quick_stats(
     profile_id: int,
     days: int = Query(7, description="Number of days to analyze (default: 7)"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_profile_analytics_db)
 ):
     """Get quick stats for the last N days"""
     try:
@@ -139,12 +407,8 @@ async def get_quick_stats(
         # Get analytics
         analytics_service = AnalyticsService(db)
         
-        # Get basic metrics
-        metrics = analytics_service.calculate_basic_metrics(
-            profile_id=profile_id,
-            start_date=start_date,
-            end_date=end_date
-        )
+        # Get basic metrics (from cached hourly aggregates)
+        metrics = window_aggregator.metrics(db, profile_id, start_date, end_date)
         
         # Get top performing link
         links_analytics = analytics_service.get_link_analytics(
@@ -188,7 +452,7 @@ async def compare_periods(
     profile_id: int,
     current_days: int = Query(7, description="Current period days"),
     previous_days: int = Query(7, description="Previous period days"),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_profile_analytics_db)
 ):
     """Compare current period with previous period"""
     try:
@@ -202,29 +466,10 @@ async def compare_periods(
         previous_start = current_start - timedelta(days=previous_days)
         previous_end = current_start
         
-        analytics_service = AnalyticsService(db)
-        
-        # Get current period metrics
-        current_metrics = analytics_service.calculate_basic_metrics(
-            profile_id=profile_id,
-            start_date=current_start,
-            end_date=end_date
-        )
-        
-        # Get previous period metrics
-        previous_metrics = analytics_service.calculate_basic_metrics(
-            profile_id=profile_id,
-            start_date=previous_start,
-            end_date=previous_end
-        )
-        
-        # Calculate changes
-        def calculate_change(current: int, previous: int) -> dict:
-            if previous == 0:
-                return {"absolute": current, "percentage": 100.0 if current > 0 else 0.0}
-            change = current - previous
-            percentage = (change / previous) * 100
-            return {"absolute": change, "percentage": round(percentage, 2)}
+        # Both periods slide cached running windows over hourly buckets, so a refresh
+        # only aggregates the hours that elapsed since the last request
+        current_metrics = window_aggregator.metrics(db, profile_id, current_start, end_date)
+        previous_metrics = window_aggregator.metrics(db, profile_id, previous_start, previous_end)
         
         return {
             "profile_id": profile_id,
@@ -240,17 +485,60 @@ async def compare_periods(
                 "end": previous_end.isoformat(),
                 "metrics": previous_metrics
             },
-            "changes": {
-                "clicks": calculate_change(current_metrics.total_clicks, previous_metrics.total_clicks),
-                "views": calculate_change(current_metrics.total_views, previous_metrics.total_views),
-                "ctr": {
-                    "absolute": round(current_metrics.click_through_rate - previous_metrics.click_through_rate, 2),
-                    "percentage": round(((current_metrics.click_through_rate - previous_metrics.click_through_rate) / previous_metrics.click_through_rate * 100) if previous_metrics.click_through_rate > 0 else 0, 2)
-                }
-            }
+            "changes": compare_metrics(current_metrics, previous_metrics)
         }
         
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error comparing periods: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error comparing periods: {str(e)}")
+
+@router.get("/anomalies/{profile_id}", response_model=AnomalyReport)
+async def get_anomalies(
+    profile_id: int,
+    limit: int = Query(20, ge=1, le=50, description="Maximum number of anomalies to return")
+):
+    """
+    Get recent traffic spikes and drops for a profile.
+
+    Served from the streaming detector fed by the tracking endpoints (no database query);
+    each worker process reports on the traffic it received. New anomalies are also pushed
+    as `anomaly` events on the realtime channel.
+    """
+    return AnomalyReport(
+        profile_id=profile_id,
+        bucket_seconds=anomaly_detector.bucket_seconds,
+        anomalies=[anomaly._asdict() for anomaly in anomaly_detector.anomalies(profile_id, limit)],
+        baselines=anomaly_detector.baselines(profile_id)
+    )
+
+@router.get("/links/{profile_id}/matrix")
+async def get_link_matrix(
+    profile_id: int,
+    days: int = Query(90, ge=1, le=366, description="Number of days to analyze (default: 90)"),
+    db: Session = Depends(get_profile_analytics_db)
+):
+    """Per-link, per-day clicks and CTR plus position-decay curve (row-major links x days arrays)"""
+    try:
+        # Verify profile exists
+        profile = db.query(LinkProfile).filter(LinkProfile.id == profile_id).first()
+        if not profile:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=days - 1)
+        start_date = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
+        
+        analytics_service = AnalyticsService(db)
+        matrix = analytics_service.get_link_day_matrix(
+            profile_id=profile_id,
+            start_date=start_date,
+            end_date=end_date
+        )
+        # Already plain lists of numbers; skip jsonable_encoder's per-cell walk
+        return JSONResponse(matrix)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting link matrix: {str(e)}")
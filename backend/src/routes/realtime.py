@@ -1,44 +1,62 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from sqlalchemy.orm import Session
-from database.connection import get_db
+from fastapi.responses import StreamingResponse
 import asyncio
 import json
-from datetime import datetime
 
-router = APIRouter(prefix="/ws", tags=["websocket"])
+from config import settings
+from services.notifier import profile_hub
 
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections = []
+router = APIRouter(tags=["realtime"])
 
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
+def encode_message(message: dict) -> str:
+    return json.dumps(message, default=str)
 
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+@router.get("/api/realtime/{profile_id}/events")
+async def stream_profile_events(profile_id: int):
+    """
+    Server-Sent Events stream of dashboard updates for a profile.
 
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            await connection.send_text(message)
+    The first event is a full `snapshot`; later `delta` events carry only the sections
+    (summary, changes, time) that changed. Nothing is sent while the profile is idle
+    apart from keep-alive comments.
+    """
+    queue = profile_hub.subscribe(profile_id)
 
-manager = ConnectionManager()
+    async def events():
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=settings.REALTIME_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {message['type']}\ndata: {encode_message(message)}\n\n"
+        finally:
+            profile_hub.unsubscribe(profile_id, queue)
 
-@router.websocket("/analytics/{profile_id}")
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.websocket("/ws/analytics/{profile_id}")
 async def websocket_endpoint(websocket: WebSocket, profile_id: int):
-    await manager.connect(websocket)
+    """Same messages as the SSE stream, for clients that prefer WebSockets"""
+    await websocket.accept()
+    queue = profile_hub.subscribe(profile_id)
+
+    async def forward():
+        while True:
+            await websocket.send_text(encode_message(await queue.get()))
+
+    sender = asyncio.create_task(forward())
     try:
+        # Clients don't send anything; receiving just surfaces the disconnect
         while True:
-            await asyncio.sleep(5)
-            
-            data = {
-                "type": "update",
-                "profile_id": profile_id,
-                "timestamp": datetime.now().isoformat(),
-                "latest_clicks": 0  # Fetch real data here
-            }
-            
-            await websocket.send_text(json.dumps(data))
-            
+            await websocket.receive_text()
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
\ No newline at end of file
+        pass
+    finally:
+        sender.cancel()
+        profile_hub.unsubscribe(profile_id, queue)
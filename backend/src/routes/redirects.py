@@ -0,0 +1,46 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import RedirectResponse
+from starlette.concurrency import run_in_threadpool
+
+from routes.tracking import get_client_ip
+from services.redirects import click_queue, routing_table
+
+router = APIRouter(tags=["redirects"])
+
+@router.get("/r/{link_id}")
+async def redirect_link(link_id: int, request: Request):
+    """
+    Redirect to a link's target URL and record the click.
+
+    The target comes from the in-memory routing table and the click is handed to a
+    background writer, so the 302 goes out without waiting on the database.
+    """
+    route = routing_table.resolve(link_id)
+    if route is None:
+        # Link created since the last table reload (or unknown): one query, then cached
+        route = await run_in_threadpool(routing_table.lookup, link_id)
+        if route is None:
+            if link_id in routing_table.conflicts:
+                # Shards allocated the same id to different profiles' links: redirecting could
+                # send the visitor to another profile's URL
+                raise HTTPException(status_code=409, detail="Link id is ambiguous across shards")
+            raise HTTPException(status_code=404, detail="Link not found")
+    
+    url, profile_id = route
+    click_queue.put(
+        link_id,
+        profile_id,
+        get_client_ip(request),
+        request.headers.get("User-Agent"),
+        request.headers.get("Referer")
+    )
+    # Not cacheable: a browser-cached redirect would skip the click
+    return RedirectResponse(url, status_code=302, headers={"Cache-Control": "no-store"})
+
+@router.get("/api/redirects/stats")
+async def get_redirect_stats():
+    """Get routing table and background click writer counters"""
+    return {
+        "routing_table": routing_table.stats(),
+        "click_queue": click_queue.stats()
+    }
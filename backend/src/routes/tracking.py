@@ -1,17 +1,35 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Optional
+import time
 
-from database.connection import get_db
+from config import settings
+from database.sharding import get_profile_analytics_db, get_profile_db, shard_router
 from database.models import ClickEvent, PageView, Link, LinkProfile
 from models.click import (
-    ClickEventCreate, 
     ClickEventResponse, 
-    PageViewCreate, 
     PageViewResponse, 
-    TrackingResponse
+    TrackingResponse,
+    BatchEventStatus,
+    BatchTrackingResponse
 )
+from services.ingest import (
+    validate_click,
+    validate_page_view,
+    parse_batch_payload,
+    parse_client_timestamp,
+    PayloadTooLarge
+)
+from services.anomaly import anomaly_detector
+from services.enrichment import event_enricher
+from services.ingest_filter import ingest_filter
+from services.referrers import referrer_tracker
+from services.spool import event_spool
+from services.notifier import profile_hub
+from services.window_cache import window_aggregator
 
 router = APIRouter(prefix="/api/track", tags=["tracking"])
 
@@ -22,47 +40,92 @@ def get_client_ip(request: Request) -> str:
         return forwarded.split(",")[0].strip()
     return request.client.host
 
+def spool_event(kind: str, row: dict, timestamp_column: str, label: str) -> TrackingResponse:
+    """Write an event to the local spool for later replay into the database"""
+    timestamp = datetime.now()
+    row[timestamp_column] = timestamp
+    event_spool.append(kind, row)
+    anomaly_detector.record_event(kind, row["profile_id"], row.get("link_id"))
+    referrer_tracker.record(kind, row["profile_id"], row["referrer"])
+    return TrackingResponse(
+        status="queued",
+        message=f"{label} queued for delivery",
+        timestamp=timestamp
+    )
+
+def check_write_latency(started: float) -> None:
+    """Send subsequent events to the spool once writes keep blowing the latency budget"""
+    event_spool.record_write(time.perf_counter() - started)
+
 @router.post("/click", response_model=TrackingResponse)
 async def track_click_event(
     request: Request,
     link_id: int,
     profile_id: int,
     referrer: Optional[str] = None,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_profile_db)
 ):
     """Track a link click event"""
     try:
-        # Verify link exists
-        link = db.query(Link).filter(Link.id == link_id).first()
-        if not link:
-            raise HTTPException(status_code=404, detail="Link not found")
-        
-        # Verify profile exists
-        profile = db.query(LinkProfile).filter(LinkProfile.id == profile_id).first()
-        if not profile:
-            raise HTTPException(status_code=404, detail="Profile not found")
-        
-        # Create click event
-        click_data = ClickEventCreate(
-            link_id=link_id,
-            profile_id=profile_id,
-            ip_address=get_client_ip(request),
-            user_agent=request.headers.get("User-Agent"),
-            referrer=referrer
-        )
+        # Drop bots and rapid repeat clicks before touching the database
+        ip_address = get_client_ip(request)
+        user_agent = request.headers.get("User-Agent")
+        filter_reason = ingest_filter.check_click(link_id, ip_address, user_agent)
+        if filter_reason:
+            return TrackingResponse(
+                status="filtered",
+                message=f"Click ignored ({filter_reason})",
+                timestamp=datetime.now()
+            )
         
-        # Save to database
-        db_click = ClickEvent(**click_data.dict())
-        db.add(db_click)
-        db.commit()
-        db.refresh(db_click)
+        # Validate straight into an insert-ready record (same rules as ClickEventCreate)
+        click = validate_click(link_id, profile_id, ip_address, user_agent, referrer)
         
-        return TrackingResponse(
-            status="success",
-            message="Click tracked successfully",
-            timestamp=db_click.clicked_at,
-            event_id=db_click.id
-        )
+        # Country, device class and browser family are resolved once here, not at query time
+        row = event_enricher.enrich(click._asdict())
+        
+        # Database known to be unhealthy: skip lookups and spool straight away
+        if event_spool.degraded:
+            response = spool_event("click", row, "clicked_at", "Click")
+        else:
+            try:
+                # Verify link exists
+                link = db.query(Link).filter(Link.id == link_id).first()
+                if not link:
+                    raise HTTPException(status_code=404, detail="Link not found")
+                
+                # Verify profile exists
+                profile = db.query(LinkProfile).filter(LinkProfile.id == profile_id).first()
+                if not profile:
+                    raise HTTPException(status_code=404, detail="Profile not found")
+                
+                # Save to database, reading back id and timestamp in the same round trip
+                started = time.perf_counter()
+                event_id, clicked_at = db.execute(
+                    insert(ClickEvent)
+                    .values(row)
+                    .returning(ClickEvent.id, ClickEvent.clicked_at)
+                ).one()
+                db.commit()
+                check_write_latency(started)
+                profile_hub.notify(profile_id)
+                anomaly_detector.record_event("click", profile_id, link_id)
+                referrer_tracker.record("click", profile_id, row["referrer"])
+                response = TrackingResponse(
+                    status="success",
+                    message="Click tracked successfully",
+                    timestamp=clicked_at,
+                    event_id=event_id
+                )
+                
+            except SQLAlchemyError as e:
+                db.rollback()
+                event_spool.mark_degraded(f"click insert failed: {e.__class__.__name__}")
+                response = spool_event("click", row, "clicked_at", "Click")
+        
+        # Only an accepted click opens the duplicate window, so retries after errors still count
+        ingest_filter.record_click(link_id, ip_address)
+        return response
         
     except HTTPException:
         raise
@@ -75,34 +138,60 @@ async def track_page_view(
     request: Request,
     profile_id: int,
     referrer: Optional[str] = None,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_profile_db)
 ):
     """Track a page view event"""
     try:
-        # Verify profile exists
-        profile = db.query(LinkProfile).filter(LinkProfile.id == profile_id).first()
-        if not profile:
-            raise HTTPException(status_code=404, detail="Profile not found")
-        
-        # Create page view
-        view_data = PageViewCreate(
-            profile_id=profile_id,
-            ip_address=get_client_ip(request),
-            user_agent=request.headers.get("User-Agent"),
-            referrer=referrer
-        )
+        # Drop bot traffic before touching the database
+        ip_address = get_client_ip(request)
+        user_agent = request.headers.get("User-Agent")
+        filter_reason = ingest_filter.check_view(user_agent)
+        if filter_reason:
+            return TrackingResponse(
+                status="filtered",
+                message=f"Page view ignored ({filter_reason})",
+                timestamp=datetime.now()
+            )
+        
+        # Validate straight into an insert-ready record (same rules as PageViewCreate)
+        view = validate_page_view(profile_id, ip_address, user_agent, referrer)
+        
+        # Country, device class and browser family are resolved once here, not at query time
+        row = event_enricher.enrich(view._asdict())
         
-        # Save to database
-        db_view = PageView(**view_data.dict())
-        db.add(db_view)
-        db.commit()
-        db.refresh(db_view)
+        # Database known to be unhealthy: skip lookups and spool straight away
+        if event_spool.degraded:
+            return spool_event("view", row, "viewed_at", "Page view")
+        
+        try:
+            # Verify profile exists
+            profile = db.query(LinkProfile).filter(LinkProfile.id == profile_id).first()
+            if not profile:
+                raise HTTPException(status_code=404, detail="Profile not found")
+            
+            # Save to database, reading back id and timestamp in the same round trip
+            started = time.perf_counter()
+            event_id, viewed_at = db.execute(
+                insert(PageView)
+                .values(row)
+                .returning(PageView.id, PageView.viewed_at)
+            ).one()
+            db.commit()
+            check_write_latency(started)
+            profile_hub.notify(profile_id)
+            anomaly_detector.record_event("view", profile_id)
+            referrer_tracker.record("view", profile_id, row["referrer"])
+            
+        except SQLAlchemyError as e:
+            db.rollback()
+            event_spool.mark_degraded(f"page view insert failed: {e.__class__.__name__}")
+            return spool_event("view", row, "viewed_at", "Page view")
         
         return TrackingResponse(
             status="success",
             message="Page view tracked successfully",
-            timestamp=db_view.viewed_at,
-            event_id=db_view.id
+            timestamp=viewed_at,
+            event_id=event_id
         )
         
     except HTTPException:
@@ -111,13 +200,189 @@ async def track_page_view(
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Error tracking page view: {str(e)}")
 
+@router.post("/batch", response_model=BatchTrackingResponse)
+async def track_event_batch(request: Request):
+    """Track many click/view events in one request (JSON array or NDJSON, optionally gzipped)"""
+    try:
+        events = parse_batch_payload(
+            await request.body(),
+            content_type=request.headers.get("Content-Type"),
+            content_encoding=request.headers.get("Content-Encoding"),
+            max_bytes=settings.CLICK_BATCH_MAX_BYTES
+        )
+    except PayloadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if len(events) > settings.CLICK_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large: {len(events)} events (max {settings.CLICK_BATCH_SIZE})"
+        )
+    
+    try:
+        now = datetime.now()
+        max_age = timedelta(hours=settings.TRACKING_MAX_EVENT_AGE_HOURS)
+        results = [None] * len(events)
+        validated = []
+        
+        # Validate every event first so existence checks can be done in bulk
+        for index, event in enumerate(events):
+            try:
+                if not isinstance(event, dict):
+                    raise ValueError("Event must be an object")
+                event_type = event.get("type")
+                if event_type == "click":
+                    record = validate_click(
+                        event.get("link_id"), event.get("profile_id"), event.get("ip_address"),
+                        event.get("user_agent"), event.get("referrer")
+                    )
+                elif event_type == "view":
+                    record = validate_page_view(
+                        event.get("profile_id"), event.get("ip_address"),
+                        event.get("user_agent"), event.get("referrer")
+                    )
+                else:
+                    raise ValueError("type must be 'click' or 'view'")
+                timestamp = parse_client_timestamp(event.get("timestamp"), max_age) or now
+                validated.append((index, event_type, record, timestamp))
+            except ValueError as e:
+                results[index] = BatchEventStatus(index=index, status="rejected", error=str(e))
+        
+        # Look up every referenced link and profile with one query each per shard (skipped while degraded)
+        known_links = known_profiles = None
+        if not event_spool.degraded:
+            known_links, known_profiles = set(), set()
+            try:
+                for shard, items in shard_router.partition(validated, key=lambda item: item[2].profile_id).items():
+                    link_ids = {record.link_id for _, event_type, record, _ in items if event_type == "click"}
+                    profile_ids = {record.profile_id for _, _, record, _ in items}
+                    db = shard.session()
+                    try:
+                        if link_ids:
+                            known_links |= {row.id for row in db.query(Link.id).filter(Link.id.in_(link_ids))}
+                        known_profiles |= {row.id for row in db.query(LinkProfile.id).filter(LinkProfile.id.in_(profile_ids))}
+                    finally:
+                        db.close()
+            except SQLAlchemyError as e:
+                event_spool.mark_degraded(f"batch lookup failed: {e.__class__.__name__}")
+                known_links = known_profiles = None
+        
+        click_rows = []
+        view_rows = []
+        pending_clicks = set()
+        for index, event_type, record, timestamp in validated:
+            if event_type == "click" and known_links is not None and record.link_id not in known_links:
+                results[index] = BatchEventStatus(index=index, status="rejected", error="Link not found")
+                continue
+            if known_profiles is not None and record.profile_id not in known_profiles:
+                results[index] = BatchEventStatus(index=index, status="rejected", error="Profile not found")
+                continue
+            
+            if event_type == "click":
+                filter_reason = ingest_filter.check_click(
+                    record.link_id, record.ip_address, record.user_agent, pending_clicks
+                )
+            else:
+                filter_reason = ingest_filter.check_view(record.user_agent)
+            if filter_reason:
+                results[index] = BatchEventStatus(index=index, status="filtered", error=filter_reason)
+                continue
+            
+            row = event_enricher.enrich(record._asdict())
+            if event_type == "click":
+                row["clicked_at"] = timestamp
+                click_rows.append(row)
+            else:
+                row["viewed_at"] = timestamp
+                view_rows.append(row)
+            results[index] = BatchEventStatus(index=index, status="accepted")
+        
+        # Save with one multi-row INSERT per table and shard; spool whatever a shard can't take
+        unwritten = {"click": [], "view": []}
+        if event_spool.degraded:
+            unwritten = {"click": click_rows, "view": view_rows}
+        else:
+            started = time.perf_counter()
+            click_groups = shard_router.partition(click_rows)
+            view_groups = shard_router.partition(view_rows)
+            for shard in click_groups.keys() | view_groups.keys():
+                shard_clicks = click_groups.get(shard, [])
+                shard_views = view_groups.get(shard, [])
+                db = shard.session()
+                db.info["statement_timeout_ms"] = settings.TRACKING_STATEMENT_TIMEOUT_MS
+                try:
+                    if shard_clicks:
+                        db.execute(insert(ClickEvent), shard_clicks)
+                    if shard_views:
+                        db.execute(insert(PageView), shard_views)
+                    db.commit()
+                    # Client timestamps can land in hours the comparison cache already closed
+                    window_aggregator.invalidate_rows(shard_clicks, "clicked_at")
+                    window_aggregator.invalidate_rows(shard_views, "viewed_at")
+                    for profile_id in {row["profile_id"] for row in shard_clicks + shard_views}:
+                        profile_hub.notify(profile_id)
+                except SQLAlchemyError as e:
+                    db.rollback()
+                    event_spool.mark_degraded(f"batch insert failed: {e.__class__.__name__}")
+                    unwritten["click"] += shard_clicks
+                    unwritten["view"] += shard_views
+                finally:
+                    db.close()
+            check_write_latency(started)
+        spooled = bool(unwritten["click"] or unwritten["view"])
+        for kind, rows in unwritten.items():
+            for row in rows:
+                event_spool.append(kind, row)
+        for row in click_rows:
+            ingest_filter.record_click(row["link_id"], row["ip_address"])
+        
+        # The detector and referrer counts follow ingest, so they include spooled events too
+        for row in click_rows:
+            anomaly_detector.record_event("click", row["profile_id"], row["link_id"], row["clicked_at"])
+            referrer_tracker.record("click", row["profile_id"], row["referrer"], row["clicked_at"])
+        for row in view_rows:
+            anomaly_detector.record_event("view", row["profile_id"], timestamp=row["viewed_at"])
+            referrer_tracker.record("view", row["profile_id"], row["referrer"], row["viewed_at"])
+        
+        counts = {"accepted": 0, "filtered": 0, "rejected": 0}
+        for result in results:
+            counts[result.status] += 1
+        
+        if spooled:
+            status = "queued"
+        else:
+            status = "success" if counts["rejected"] == 0 else "partial"
+        
+        return BatchTrackingResponse(
+            status=status,
+            timestamp=now,
+            results=results,
+            **counts
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error tracking batch: {str(e)}")
+
+@router.get("/filter-stats")
+async def get_filter_stats():
+    """Get counters for the bot and duplicate click filter"""
+    return ingest_filter.stats()
+
+@router.get("/enrichment-stats")
+async def get_enrichment_stats():
+    """Get cache counters for user agent parsing and GeoIP lookups"""
+    return event_enricher.stats()
+
 @router.get("/clicks/{link_id}")
-async def get_link_clicks(
-    link_id: int,
-    db: Session = Depends(get_db)
-):
+async def get_link_clicks(link_id: int):
     """Get all clicks for a specific link"""
-    clicks = db.query(ClickEvent).filter(ClickEvent.link_id == link_id).all()
+    # The link id alone doesn't say which shard holds it: ask them all
+    results = shard_router.scatter(lambda db: db.query(ClickEvent).filter(ClickEvent.link_id == link_id).all())
+    clicks = [click for shard_clicks in results.values() for click in shard_clicks]
     return {
         "link_id": link_id,
         "total_clicks": len(clicks),
@@ -127,7 +392,7 @@ async def get_link_clicks(
 @router.get("/views/{profile_id}")
 async def get_profile_views(
     profile_id: int,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_profile_analytics_db)
 ):
     """Get all page views for a specific profile"""
     views = db.query(PageView).filter(PageView.profile_id == profile_id).all()
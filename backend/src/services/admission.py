@@ -0,0 +1,372 @@
+import asyncio
+import json
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from config import settings
+
+TRACKING = "tracking"
+ANALYTICS = "analytics"
+
+class AIMDLimit:
+    """
+    Concurrency limit adapted from observed latency (additive increase, multiplicative decrease).
+
+    Each request finishing within `target` seconds while at least half the limit was in
+    use raises the limit by 1/limit (about +1 per limit's worth of requests); a slower one
+    multiplies it by `backoff`, at most once per `cooldown` so a single burst of slow
+    requests doesn't collapse it. The limit stays within [minimum, maximum].
+    """
+
+    __slots__ = ("limit", "minimum", "maximum", "target", "backoff", "cooldown", "_last_decrease")
+
+    def __init__(self, initial: float, minimum: float, maximum: float, target: float,
+                 backoff: float = 0.9, cooldown: float = 1.0):
+        self.limit = float(initial)
+        self.minimum = float(minimum)
+        self.maximum = float(maximum)
+        self.target = target
+        self.backoff = backoff
+        self.cooldown = cooldown
+        self._last_decrease = 0.0
+
+    def on_sample(self, latency: float, inflight: int, now: float) -> None:
+        if latency > self.target:
+            self.decrease(now)
+        elif inflight * 2 >= self.limit:
+            # Only grow a limit that is actually being used
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+    def decrease(self, now: float) -> None:
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(self.minimum, self.limit * self.backoff)
+
+class RouteClass:
+    """Budget, wait queue and counters for one class of routes"""
+
+    __slots__ = ("name", "limit", "max_queue", "queue_timeout", "inflight", "waiters",
+                 "admitted", "queued", "shed", "timed_out", "stale_served", "latency")
+
+    def __init__(self, name: str, limit: AIMDLimit, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.inflight = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+
+        self.admitted = 0
+        self.queued = 0
+        self.shed = 0
+        self.timed_out = 0
+        self.stale_served = 0
+        self.latency: Optional[float] = None  # EWMA, seconds
+
+    def has_capacity(self) -> bool:
+        return self.inflight < max(1, int(self.limit.limit))
+
+    def stats(self) -> dict:
+        return {
+            "limit": round(self.limit.limit, 2),
+            "max_limit": self.limit.maximum,
+            "inflight": self.inflight,
+            "queue_depth": len(self.waiters),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "shed": self.shed,
+            "timed_out": self.timed_out,
+            "stale_served": self.stale_served,
+            "avg_latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None
+        }
+
+class AdmissionController:
+    """
+    Per-class concurrency limits with priority between classes.
+
+    Classes are listed highest priority first. A request is admitted while its class is
+    under its limit and no higher-priority request is waiting; otherwise it waits in its
+    class's FIFO queue for up to queue_timeout and is shed when the queue is full or the
+    wait runs out. Freed slots go to the highest-priority waiters first. A latency
+    sample over a class's target also shrinks the limits of every lower-priority class,
+    since they compete for the same workers and connection pools. Runs on the event
+    loop; no locking.
+    """
+
+    def __init__(self, classes: List[RouteClass]):
+        self.classes: Dict[str, RouteClass] = {route_class.name: route_class for route_class in classes}
+        self._order = classes
+
+    def _blocked_by_higher(self, route_class: RouteClass) -> bool:
+        for other in self._order:
+            if other is route_class:
+                return False
+            if other.waiters:
+                return True
+        return False
+
+    async def acquire(self, name: str) -> bool:
+        """Wait for a slot; False if the request should be shed"""
+        route_class = self.classes[name]
+        if route_class.has_capacity() and not route_class.waiters and not self._blocked_by_higher(route_class):
+            route_class.inflight += 1
+            route_class.admitted += 1
+            return True
+        if len(route_class.waiters) >= route_class.max_queue:
+            route_class.shed += 1
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        route_class.waiters.append(waiter)
+        route_class.queued += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), route_class.queue_timeout)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # Granted just as the deadline passed: take the slot
+                route_class.admitted += 1
+                return True
+            waiter.cancel()
+            route_class.timed_out += 1
+            route_class.shed += 1
+            return False
+        except asyncio.CancelledError:
+            # Client went away while waiting; hand over a slot we may have been granted
+            if waiter.done() and not waiter.cancelled():
+                route_class.inflight -= 1
+                self._dispatch()
+            else:
+                waiter.cancel()
+            raise
+        finally:
+            if waiter in route_class.waiters:
+                route_class.waiters.remove(waiter)
+        route_class.admitted += 1
+        return True
+
+    def release(self, name: str, latency: float) -> None:
+        route_class = self.classes[name]
+        route_class.inflight -= 1
+        route_class.latency = latency if route_class.latency is None else route_class.latency * 0.9 + latency * 0.1
+        now = time.monotonic()
+        route_class.limit.on_sample(latency, route_class.inflight + 1, now)
+        if latency > route_class.limit.target:
+            for other in self._order[self._order.index(route_class) + 1:]:
+                other.limit.decrease(now)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Hand free slots to waiters, highest priority class first"""
+        for route_class in self._order:
+            while route_class.waiters and route_class.has_capacity():
+                waiter = route_class.waiters.popleft()
+                if waiter.done():
+                    continue
+                route_class.inflight += 1
+                waiter.set_result(True)
+            if route_class.waiters:
+                # Lower classes wait until this one's queue drains
+                return
+
+    def retry_after(self, name: str) -> int:
+        """Seconds a shed client should wait: the time to work through the current queue"""
+        route_class = self.classes[name]
+        latency = route_class.latency or 1.0
+        backlog = (len(route_class.waiters) + 1) / max(route_class.limit.limit, 1.0)
+        return max(1, min(60, math.ceil(latency * backlog)))
+
+    def stats(self) -> dict:
+        return {name: route_class.stats() for name, route_class in self.classes.items()}
+
+# (status, headers, body, stored at)
+StaleEntry = Tuple[int, List[Tuple[bytes, bytes]], bytes, float]
+
+class StaleResponseCache:
+    """
+    Last successful response per analytics URL, served instead of a 503 when shedding.
+
+    Bounded by entry count (LRU) and per-body size; entries older than max_age are not
+    served. Keys include Accept and Accept-Encoding since the stored body is the final,
+    possibly compressed representation.
+    """
+
+    # Recomputed per response (or meaningless on a replayed one)
+    SKIPPED_HEADERS = {b"content-length", b"date", b"etag"}
+
+    def __init__(self, max_entries: int = 256, max_body_bytes: int = 256 * 1024, max_age: float = 600.0):
+        self.max_entries = max_entries
+        self.max_body_bytes = max_body_bytes
+        self.max_age = max_age
+        self._entries: "OrderedDict[str, StaleEntry]" = OrderedDict()
+
+    @staticmethod
+    def key(scope) -> str:
+        headers = dict(scope["headers"])
+        return "|".join((
+            scope["path"],
+            scope.get("query_string", b"").decode("latin-1"),
+            headers.get(b"accept", b"").decode("latin-1"),
+            headers.get(b"accept-encoding", b"").decode("latin-1")
+        ))
+
+    def store(self, key: str, status: int, headers: List[Tuple[bytes, bytes]], body: bytes) -> None:
+        if self.max_entries <= 0 or len(body) > self.max_body_bytes:
+            return
+        headers = [(name, value) for name, value in headers if name.lower() not in self.SKIPPED_HEADERS]
+        self._entries[key] = (status, headers, body, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key: str) -> Optional[StaleEntry]:
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[3] > self.max_age:
+            return None
+        return entry
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+# Responses of requests carrying credentials are never stored or replayed
+AUTH_HEADERS = (b"authorization", b"cookie", b"x-admin-token")
+
+def cacheable(scope) -> bool:
+    """Whether a request's response may be stored in, and served from, the stale cache"""
+    return (
+        scope["method"] == "GET"
+        and scope["path"].startswith("/api/analytics/")
+        and not any(name.lower() in AUTH_HEADERS for name, _ in scope["headers"])
+    )
+
+# Profiling runs for as long as asked on purpose: it would hold an analytics slot and its
+# latency would shrink the analytics limit on every run
+UNADMITTED_PREFIXES = ("/api/admin/profiling/",)
+
+def classify(scope) -> Optional[str]:
+    """Route class of a request, or None for routes outside admission control"""
+    if scope["type"] != "http":
+        return None
+    path = scope["path"]
+    method = scope["method"]
+    if path.startswith(UNADMITTED_PREFIXES):
+        return None
+    if (method == "POST" and path.startswith("/api/track/")) or path.startswith("/r/"):
+        return TRACKING
+    if path.startswith(("/api/analytics/", "/api/admin/")) or (method == "GET" and path.startswith("/api/track/")):
+        return ANALYTICS
+    # Health checks, docs, profiling and long-lived realtime streams
+    return None
+
+class AdmissionMiddleware:
+    """
+    Applies the admission controller in front of every other middleware.
+
+    Requests over their class's budget queue with a deadline; shed /api/analytics/ GETs
+    without credentials get the last stored response for the same URL (marked with a
+    Warning header) when there is one, everything else a 503 with Retry-After. Latency is measured from admission to
+    the last body chunk and feeds the adaptive limits.
+    """
+
+    def __init__(self, app, controller: AdmissionController, stale_cache: Optional[StaleResponseCache] = None):
+        self.app = app
+        self.controller = controller
+        self.stale_cache = stale_cache
+
+    async def __call__(self, scope, receive, send):
+        name = classify(scope)
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        store = name == ANALYTICS and self.stale_cache is not None and cacheable(scope)
+        if not await self.controller.acquire(name):
+            await self._shed(scope, send, name, store)
+            return
+
+        started = time.monotonic()
+        finished = False
+        capture = {"status": 0, "headers": [], "body": [], "size": 0}
+
+        async def send_wrapper(message):
+            nonlocal finished
+            if store and message["type"] == "http.response.start":
+                capture["status"] = message["status"]
+                capture["headers"] = list(message.get("headers", []))
+            elif store and message["type"] == "http.response.body" and capture["status"] == 200:
+                chunk = message.get("body", b"")
+                capture["size"] += len(chunk)
+                if capture["size"] <= self.stale_cache.max_body_bytes:
+                    capture["body"].append(chunk)
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False) and not finished:
+                finished = True
+                self.controller.release(name, time.monotonic() - started)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if not finished:
+                finished = True
+                self.controller.release(name, time.monotonic() - started)
+        if store and capture["status"] == 200 and capture["size"] <= self.stale_cache.max_body_bytes:
+            self.stale_cache.store(StaleResponseCache.key(scope), 200, capture["headers"], b"".join(capture["body"]))
+
+    async def _shed(self, scope, send, name: str, store: bool) -> None:
+        entry = self.stale_cache.get(StaleResponseCache.key(scope)) if store else None
+        if entry is not None:
+            status, headers, body, stored_at = entry
+            self.controller.classes[name].stale_served += 1
+            headers = headers + [
+                (b"content-length", str(len(body)).encode()),
+                (b"age", str(int(time.monotonic() - stored_at)).encode()),
+                (b"warning", b'110 - "Response is Stale"'),
+                (b"x-admission", b"stale")
+            ]
+            await send({"type": "http.response.start", "status": status, "headers": headers})
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        body = json.dumps({"detail": f"Server busy, {name} request shed; retry later"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(self.controller.retry_after(name)).encode()),
+                (b"x-admission", b"shed")
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
+
+admission_controller = AdmissionController([
+    RouteClass(
+        TRACKING,
+        AIMDLimit(
+            initial=settings.TRACKING_CONCURRENCY_MAX,
+            minimum=max(1, settings.TRACKING_CONCURRENCY_MAX // 8),
+            maximum=settings.TRACKING_CONCURRENCY_MAX,
+            target=settings.TRACKING_LATENCY_TARGET_MS / 1000
+        ),
+        max_queue=settings.TRACKING_QUEUE_SIZE,
+        queue_timeout=settings.TRACKING_QUEUE_TIMEOUT_MS / 1000
+    ),
+    RouteClass(
+        ANALYTICS,
+        AIMDLimit(
+            initial=settings.ANALYTICS_CONCURRENCY_MAX,
+            minimum=1,
+            maximum=settings.ANALYTICS_CONCURRENCY_MAX,
+            target=settings.ANALYTICS_LATENCY_TARGET_MS / 1000
+        ),
+        max_queue=settings.ANALYTICS_QUEUE_SIZE,
+        queue_timeout=settings.ANALYTICS_QUEUE_TIMEOUT_MS / 1000
+    )
+])
+stale_responses = StaleResponseCache(
+    max_entries=settings.STALE_RESPONSE_ENTRIES,
+    max_age=settings.STALE_RESPONSE_MAX_AGE
+)
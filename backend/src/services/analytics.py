@@ -1,14 +1,59 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func, text, and_, distinct
+from sqlalchemy import func, text, and_, case, distinct
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 import re
 
-from database.models import ClickEvent, PageView, Link, LinkProfile
+import numpy as np
+
+from database.models import ClickEvent, PageView, Link, LinkProfile, VisitSession
 from models.analytics import (
     BasicMetrics, LinkAnalytics, ProfileAnalytics, 
-    TrafficSource, TrafficAnalytics, TimeBasedMetrics, TimeAnalytics
+    TrafficSource, TrafficAnalytics, TimeBasedMetrics, TimeAnalytics,
+    DeviceBreakdown, BrowserBreakdown, DeviceAnalytics, CountryBreakdown, GeoAnalytics,
+    SessionAnalytics, TimeToClickBucket, TimeToClickDistribution,
+    ReferrerCount, ReferrerRanking, ReferrerAnalytics,
+    WeeklyVisitors, RetentionCohort, CohortAnalytics,
+    SignificanceTest, ConfidenceInterval, SignificanceAnalytics
+)
+from services.cohorts import week_start, weekly_visitors
+from services.enrichment import BrowserFamily, DeviceClass
+from services.link_matrix import build_link_matrix
+from services.parallel import run_queries
+from services.referrers import referrer_tracker
+from services.significance import (
+    CONFIDENCE_LEVEL, MIN_GROUP_EVENTS, MIN_RATE_EVENTS, SIGNIFICANCE_ALPHA, TIME_SLOTS,
+    BucketStats, TestResult, chi_square_independence, click_rate_interval, group_buckets,
+    kruskal_wallis, load_buckets, mann_whitney, mean_interval, time_slot
 )
+from services.time_series import TimeSeriesColumns, build_columns
+
+# Lower edges (seconds) of the time-to-click histogram buckets; the last bucket is open-ended
+TIME_TO_CLICK_EDGES = [0, 5, 15, 30, 60, 120, 300, 600, 1800]
+
+def format_seconds(seconds: float) -> str:
+    """Compact duration label for histogram buckets: 45s, 5m"""
+    return f"{int(seconds // 60)}m" if seconds >= 60 else f"{int(seconds)}s"
+
+def calculate_change(current: float, previous: float) -> dict:
+    """Absolute and percentage change between two periods"""
+    if previous == 0:
+        return {"absolute": current, "percentage": 100.0 if current > 0 else 0.0}
+    change = current - previous
+    percentage = (change / previous) * 100
+    return {"absolute": change, "percentage": round(percentage, 2)}
+
+def compare_metrics(current: BasicMetrics, previous: BasicMetrics) -> dict:
+    """Period-over-period changes for clicks, views and CTR"""
+    ctr_change = current.click_through_rate - previous.click_through_rate
+    return {
+        "clicks": calculate_change(current.total_clicks, previous.total_clicks),
+        "views": calculate_change(current.total_views, previous.total_views),
+        "ctr": {
+            "absolute": round(ctr_change, 2),
+            "percentage": round((ctr_change / previous.click_through_rate * 100) if previous.click_through_rate > 0 else 0, 2)
+        }
+    }
 
 class AnalyticsService:
     def __init__(self, db: Session):
@@ -52,21 +97,31 @@ class AnalyticsService:
             click_through_rate=round(ctr, 2)
         )
     
+    @staticmethod
+    def _metrics_task(profile_id: int, link_id: Optional[int], start_date: Optional[datetime],
+                      end_date: Optional[datetime]):
+        """calculate_basic_metrics as a task for run_queries"""
+        return lambda db: AnalyticsService(db).calculate_basic_metrics(
+            profile_id=profile_id,
+            link_id=link_id,
+            start_date=start_date,
+            end_date=end_date
+        )
+    
     def get_link_analytics(self, profile_id: int, start_date: Optional[datetime] = None,
                           end_date: Optional[datetime] = None) -> List[LinkAnalytics]:
         """Get analytics for all links in a profile"""
         
         links = self.db.query(Link).filter(Link.profile_id == profile_id).all()
+        link_metrics = run_queries(self.db, [
+            self._metrics_task(profile_id, link.id, start_date, end_date) for link in links
+        ])
+        return self._build_link_analytics(links, link_metrics)
+    
+    def _build_link_analytics(self, links: List[Link], link_metrics: List[BasicMetrics]) -> List[LinkAnalytics]:
         analytics = []
         
-        for link in links:
-            metrics = self.calculate_basic_metrics(
-                profile_id=profile_id,
-                link_id=link.id,
-                start_date=start_date,
-                end_date=end_date
-            )
-            
+        for link, metrics in zip(links, link_metrics):
             analytics.append(LinkAnalytics(
                 link_id=link.id,
                 title=link.title,
@@ -80,6 +135,44 @@ class AnalyticsService:
         analytics.sort(key=lambda x: x.position)
         return analytics
     
+    def get_link_day_matrix(self, profile_id: int, start_date: Optional[datetime] = None,
+                            end_date: Optional[datetime] = None) -> dict:
+        """Per-link, per-day clicks and CTR with position decay, from one grouped pass"""
+        if not end_date:
+            end_date = datetime.now()
+        if not start_date:
+            start_date = end_date - timedelta(days=30)
+        
+        links = self.db.query(Link.id, Link.title, Link.position).filter(
+            Link.profile_id == profile_id
+        ).order_by(Link.position, Link.id).all()
+        
+        click_day = func.date_trunc('day', ClickEvent.clicked_at)
+        click_rows = self.db.query(
+            ClickEvent.link_id, click_day.label('day'), func.count(ClickEvent.id)
+        ).filter(
+            and_(
+                ClickEvent.profile_id == profile_id,
+                ClickEvent.clicked_at >= start_date,
+                ClickEvent.clicked_at <= end_date
+            )
+        ).group_by(ClickEvent.link_id, click_day).all()
+        
+        view_day = func.date_trunc('day', PageView.viewed_at)
+        view_rows = self.db.query(
+            view_day.label('day'), func.count(PageView.id)
+        ).filter(
+            and_(
+                PageView.profile_id == profile_id,
+                PageView.viewed_at >= start_date,
+                PageView.viewed_at <= end_date
+            )
+        ).group_by(view_day).all()
+        
+        matrix = build_link_matrix(links, click_rows, view_rows, start_date, end_date)
+        matrix["profile_id"] = profile_id
+        return matrix
+    
     def get_profile_analytics(self, profile_id: int, start_date: Optional[datetime] = None,
                             end_date: Optional[datetime] = None) -> ProfileAnalytics:
         """Get complete analytics for a profile"""
@@ -89,19 +182,13 @@ class AnalyticsService:
         if not profile:
             raise ValueError("Profile not found")
         
-        # Get overall metrics
-        total_metrics = self.calculate_basic_metrics(
-            profile_id=profile_id,
-            start_date=start_date,
-            end_date=end_date
-        )
-        
-        # Get link analytics
-        links_analytics = self.get_link_analytics(
-            profile_id=profile_id,
-            start_date=start_date,
-            end_date=end_date
-        )
+        # Overall and per-link metrics are independent reads: run them side by side
+        links = self.db.query(Link).filter(Link.profile_id == profile_id).all()
+        results = run_queries(self.db, [self._metrics_task(profile_id, None, start_date, end_date)] + [
+            self._metrics_task(profile_id, link.id, start_date, end_date) for link in links
+        ])
+        total_metrics = results[0]
+        links_analytics = self._build_link_analytics(links, results[1:])
         
         return ProfileAnalytics(
             profile_id=profile.id,
@@ -189,61 +276,397 @@ class AnalyticsService:
             total_views=total_views
         )
     
-    def analyze_time_patterns(self, profile_id: int, granularity: str = 'daily',
-                            start_date: Optional[datetime] = None,
-                            end_date: Optional[datetime] = None) -> TimeAnalytics:
-        """Analyze time-based patterns in clicks and views"""
+    def _grouped_event_counts(self, profile_id: int, columns: List[str],
+                              start_date: Optional[datetime] = None,
+                              end_date: Optional[datetime] = None) -> List[Tuple[Dict, Dict]]:
+        """
+        (click counts, view counts) keyed by value for each ingest-time enrichment column.
+
+        All GROUP BYs run concurrently; NULLs (events stored before enrichment) come back
+        under the None key.
+        """
+        def counts(model, timestamp, column: str):
+            def query(db: Session) -> Dict:
+                group = getattr(model, column)
+                q = db.query(group, func.count(model.id)).filter(model.profile_id == profile_id)
+                if start_date:
+                    q = q.filter(timestamp >= start_date)
+                if end_date:
+                    q = q.filter(timestamp <= end_date)
+                return dict(q.group_by(group).all())
+            return query
+        
+        tasks = []
+        for column in columns:
+            tasks.append(counts(ClickEvent, ClickEvent.clicked_at, column))
+            tasks.append(counts(PageView, PageView.viewed_at, column))
+        results = run_queries(self.db, tasks)
+        return [(results[i], results[i + 1]) for i in range(0, len(results), 2)]
+    
+    @staticmethod
+    def _breakdown(click_counts: Dict, view_counts: Dict, label, total_clicks: int) -> List[dict]:
+        """Merge grouped counts under display labels, sorted by clicks descending"""
+        merged: Dict[str, Dict[str, int]] = {}
+        for counts, kind in ((click_counts, 'clicks'), (view_counts, 'views')):
+            for value, count in counts.items():
+                entry = merged.setdefault(label(value), {'clicks': 0, 'views': 0})
+                entry[kind] += count
+        
+        rows = [
+            {
+                'name': name,
+                'clicks': data['clicks'],
+                'views': data['views'],
+                'percentage': round(data['clicks'] / total_clicks * 100, 2) if total_clicks > 0 else 0
+            }
+            for name, data in merged.items()
+        ]
+        rows.sort(key=lambda x: (x['clicks'], x['views']), reverse=True)
+        return rows
+    
+    def analyze_devices(self, profile_id: int, start_date: Optional[datetime] = None,
+                        end_date: Optional[datetime] = None) -> DeviceAnalytics:
+        """Device class and browser family breakdown from the enrichment columns"""
+        (device_clicks, device_views), (browser_clicks, browser_views) = self._grouped_event_counts(
+            profile_id, ['device_class', 'browser_family'], start_date, end_date
+        )
+        
+        def device_label(value) -> str:
+            return DeviceClass(value).name.lower() if value in DeviceClass._value2member_map_ else 'unknown'
+        
+        def browser_label(value) -> str:
+            return BrowserFamily(value).name.lower() if value in BrowserFamily._value2member_map_ else 'unknown'
+        
+        total_clicks = sum(device_clicks.values())
+        total_views = sum(device_views.values())
         
+        return DeviceAnalytics(
+            profile_id=profile_id,
+            devices=[
+                DeviceBreakdown(device=row['name'], clicks=row['clicks'], views=row['views'], percentage=row['percentage'])
+                for row in self._breakdown(device_clicks, device_views, device_label, total_clicks)
+            ],
+            browsers=[
+                BrowserBreakdown(browser=row['name'], clicks=row['clicks'], views=row['views'], percentage=row['percentage'])
+                for row in self._breakdown(browser_clicks, browser_views, browser_label, total_clicks)
+            ],
+            total_clicks=total_clicks,
+            total_views=total_views
+        )
+    
+    def analyze_geography(self, profile_id: int, start_date: Optional[datetime] = None,
+                          end_date: Optional[datetime] = None) -> GeoAnalytics:
+        """Country breakdown from the enrichment columns"""
+        [(country_clicks, country_views)] = self._grouped_event_counts(
+            profile_id, ['country'], start_date, end_date
+        )
+        
+        total_clicks = sum(country_clicks.values())
+        total_views = sum(country_views.values())
+        
+        return GeoAnalytics(
+            profile_id=profile_id,
+            countries=[
+                CountryBreakdown(country=row['name'], clicks=row['clicks'], views=row['views'], percentage=row['percentage'])
+                for row in self._breakdown(country_clicks, country_views, lambda value: value or 'unknown', total_clicks)
+            ],
+            total_clicks=total_clicks,
+            total_views=total_views
+        )
+    
+    def analyze_referrers(self, profile_id: int, start_date: Optional[datetime] = None,
+                          end_date: Optional[datetime] = None, limit: int = 20) -> ReferrerAnalytics:
+        """Top referrer hosts by clicks and by views, with per-host error bounds"""
         if not end_date:
             end_date = datetime.now()
         if not start_date:
             start_date = end_date - timedelta(days=30)
         
-        # Build queries
-        click_query = self.db.query(ClickEvent).filter(
-            and_(
-                ClickEvent.profile_id == profile_id,
-                ClickEvent.clicked_at >= start_date,
-                ClickEvent.clicked_at <= end_date
+        rankings = {}
+        hours = 0
+        for kind in ('click', 'view'):
+            summary, kind_hours = referrer_tracker.summarize(self.db, profile_id, kind, start_date, end_date)
+            hours = max(hours, kind_hours)
+            rankings[kind] = ReferrerRanking(
+                total=summary.total,
+                error_bound=summary.total // summary.capacity,
+                referrers=[
+                    ReferrerCount(
+                        host=host,
+                        count=count,
+                        lower_bound=count - error,
+                        error=error,
+                        percentage=round(count / summary.total * 100, 2) if summary.total else 0.0
+                    )
+                    for host, count, error in summary.top(limit)
+                ]
             )
+        
+        return ReferrerAnalytics(
+            profile_id=profile_id,
+            sketch_size=referrer_tracker.capacity,
+            hours=hours,
+            clicks=rankings['click'],
+            views=rankings['view']
         )
+    
+    def analyze_cohorts(self, profile_id: int, weeks: int = 8,
+                        end_date: Optional[datetime] = None) -> CohortAnalytics:
+        """Weekly returning visitors and retention curves, computed with bitmap AND/OR"""
+        last_week = week_start(end_date or datetime.now())
+        first_week = last_week - timedelta(weeks=weeks - 1)
+        
+        # One extra week in front so the first reported week has a "previous week"
+        weekly = weekly_visitors(self.db, profile_id, first_week - timedelta(weeks=1), weeks + 1)
+        
+        week_rows = []
+        cohorts = []
+        seen = weekly[0]
+        for index in range(1, weeks + 1):
+            visitors = weekly[index]
+            cohort = visitors - seen
+            seen = seen | visitors
+            total = len(visitors)
+            returning = len(visitors & weekly[index - 1])
+            start = first_week + timedelta(weeks=index - 1)
+            week_rows.append(WeeklyVisitors(
+                week_start=start,
+                visitors=total,
+                returning_visitors=returning,
+                new_visitors=len(cohort),
+                returning_rate=round(returning / total * 100, 2) if total else 0.0
+            ))
+            
+            size = len(cohort)
+            if size:
+                retained = [size] + [len(cohort & later) for later in weekly[index + 1:]]
+            else:
+                retained = [0] * (weeks + 1 - index)
+            cohorts.append(RetentionCohort(
+                week_start=start,
+                size=size,
+                retained=retained,
+                retention=[round(count / size * 100, 2) if size else 0.0 for count in retained]
+            ))
         
-        view_query = self.db.query(PageView).filter(
-            and_(
-                PageView.profile_id == profile_id,
-                PageView.viewed_at >= start_date,
-                PageView.viewed_at <= end_date
-            )
+        return CohortAnalytics(profile_id=profile_id, weeks=week_rows, cohorts=cohorts)
+    
+    @staticmethod
+    def _significance_test(test: str, groups: List[str], result: Optional[TestResult]) -> Optional[SignificanceTest]:
+        if result is None:
+            return None
+        return SignificanceTest(
+            test=test,
+            groups=groups,
+            statistic=round(result.statistic, 4),
+            pvalue=result.pvalue,
+            significant=result.pvalue < SIGNIFICANCE_ALPHA,
+            effect_size=round(result.effect_size, 4) if result.effect_size is not None else None
         )
+    
+    @staticmethod
+    def _confidence_interval(group: str, bucket: BucketStats, bounds) -> Optional[ConfidenceInterval]:
+        if bounds is None:
+            return None
+        estimate, lower, upper = bounds
+        return ConfidenceInterval(group=group, events=bucket.count, estimate=round(estimate, 4),
+                                  lower=round(lower, 4), upper=round(upper, 4))
+    
+    def analyze_significance(self, profile_id: int, start_date: Optional[datetime] = None,
+                             end_date: Optional[datetime] = None) -> SignificanceAnalytics:
+        """
+        The notebook's temporal and traffic source tests and confidence intervals, computed
+        from the hourly per-source counts of build_engagement_stats.py (whole days) instead
+        of a scan of the events
+        """
+        if not end_date:
+            end_date = datetime.now()
+        if not start_date:
+            start_date = end_date - timedelta(days=30)
         
+        rows = load_buckets(self.db, profile_id, start_date.date(), end_date.date())
+        overall = BucketStats()
+        for _, _, _, clicks, views in rows:
+            overall.add(clicks, views)
+        hours = group_buckets(rows, lambda day, hour, source: hour)
+        weekend = group_buckets(rows, lambda day, hour, source: day.weekday() >= 5)
+        slots = group_buckets(rows, lambda day, hour, source: time_slot(hour))
+        sources = sorted(group_buckets(rows, lambda day, hour, source: source).items(),
+                         key=lambda item: item[1].count, reverse=True)
+        
+        # Groups below the notebook's minimum sizes are left out; a test needs three groups
+        hourly = [(hour, bucket) for hour, bucket in sorted(hours.items()) if bucket.count >= MIN_GROUP_EVENTS]
+        slotted = [(name, slots[name]) for name, _, _ in TIME_SLOTS
+                   if name in slots and slots[name].count >= MIN_GROUP_EVENTS]
+        rated = [(source, bucket) for source, bucket in sources[:5] if bucket.count >= MIN_RATE_EVENTS]
+        
+        hourly_test = self._significance_test(
+            "kruskal_wallis", [f"{hour}:00" for hour, _ in hourly],
+            kruskal_wallis([bucket for _, bucket in hourly]) if len(hourly) >= 3 else None
+        )
+        weekend_test = self._significance_test(
+            "mann_whitney_u", ["weekday", "weekend"],
+            mann_whitney(weekend[False], weekend[True]) if False in weekend and True in weekend else None
+        )
+        time_slot_test = self._significance_test(
+            "kruskal_wallis", [name for name, _ in slotted],
+            kruskal_wallis([bucket for _, bucket in slotted]) if len(slotted) >= 3 else None
+        )
+        source_independence_test = self._significance_test(
+            "chi_square", [source for source, _ in sources],
+            chi_square_independence([bucket for _, bucket in sources])
+        )
+        source_click_rate_test = self._significance_test(
+            "kruskal_wallis", [source for source, _ in rated],
+            kruskal_wallis([bucket for _, bucket in rated]) if len(rated) >= 3 else None
+        )
+        
+        return SignificanceAnalytics(
+            profile_id=profile_id,
+            start_date=start_date.date(),
+            end_date=end_date.date(),
+            alpha=SIGNIFICANCE_ALPHA,
+            confidence_level=CONFIDENCE_LEVEL,
+            events=overall.count,
+            hourly_test=hourly_test,
+            weekend_test=weekend_test,
+            time_slot_test=time_slot_test,
+            source_independence_test=source_independence_test,
+            source_click_rate_test=source_click_rate_test,
+            engagement_mean=self._confidence_interval("all", overall, mean_interval(overall, CONFIDENCE_LEVEL)),
+            click_rate=self._confidence_interval("all", overall, click_rate_interval(overall, CONFIDENCE_LEVEL)),
+            time_slot_engagement=[
+                self._confidence_interval(name, bucket, mean_interval(bucket, CONFIDENCE_LEVEL))
+                for name, bucket in slotted
+            ],
+            source_click_rates=[
+                self._confidence_interval(source, bucket, click_rate_interval(bucket, CONFIDENCE_LEVEL))
+                for source, bucket in rated[:4]
+            ],
+            contingency_table={source: {'clicks': bucket.clicks, 'views': bucket.views} for source, bucket in sources}
+        )
+    
+    def _best_time_significance(self, profile_id: int, granularity: str,
+                                start_date: datetime, end_date: datetime) -> Optional[TestResult]:
+        """Whether engagement differs across hours (hourly) or weekdays (daily), from engagement_stats"""
+        rows = load_buckets(self.db, profile_id, start_date.date(), end_date.date())
         if granularity == 'hourly':
-            # Group by hour
-            click_data = self.db.query(
-                func.date_trunc('hour', ClickEvent.clicked_at).label('period'),
-                func.count(ClickEvent.id).label('clicks'),
-                func.count(func.distinct(ClickEvent.ip_address)).label('unique_visitors')
-            ).filter(
-                and_(
-                    ClickEvent.profile_id == profile_id,
-                    ClickEvent.clicked_at >= start_date,
-                    ClickEvent.clicked_at <= end_date
-                )
-            ).group_by('period').all()
-            
-            view_data = self.db.query(
-                func.date_trunc('hour', PageView.viewed_at).label('period'),
-                func.count(PageView.id).label('views')
-            ).filter(
-                and_(
-                    PageView.profile_id == profile_id,
-                    PageView.viewed_at >= start_date,
-                    PageView.viewed_at <= end_date
-                )
-            ).group_by('period').all()
-            
-        else:  # daily
-            click_data = self.db.query(
-                func.date_trunc('day', ClickEvent.clicked_at).label('period'),
+            groups = group_buckets(rows, lambda day, hour, source: hour)
+        else:
+            groups = group_buckets(rows, lambda day, hour, source: day.weekday())
+        tested = [bucket for bucket in groups.values() if bucket.count >= MIN_GROUP_EVENTS]
+        return kruskal_wallis(tested) if len(tested) >= 3 else None
+    
+    def count_rows(self) -> Dict[str, int]:
+        """Profiles, links, clicks and views in this session's database (one shard)"""
+        return {
+            "profiles": self.db.query(func.count(LinkProfile.id)).scalar() or 0,
+            "links": self.db.query(func.count(Link.id)).scalar() or 0,
+            "clicks": self.db.query(func.count(ClickEvent.id)).scalar() or 0,
+            "views": self.db.query(func.count(PageView.id)).scalar() or 0
+        }
+    
+    def top_profiles(self, start_date: datetime, end_date: datetime, limit: int = 20) -> List[Tuple[int, str, int, int]]:
+        """(profile_id, username, clicks, views) of the most clicked profiles in this database"""
+        clicks = self.db.query(ClickEvent.profile_id, func.count(ClickEvent.id).label('clicks')).filter(
+            ClickEvent.clicked_at >= start_date,
+            ClickEvent.clicked_at <= end_date
+        ).group_by(ClickEvent.profile_id).order_by(func.count(ClickEvent.id).desc()).limit(limit).all()
+        if not clicks:
+            return []
+        
+        profile_ids = [profile_id for profile_id, _ in clicks]
+        views = dict(self.db.query(PageView.profile_id, func.count(PageView.id)).filter(
+            PageView.profile_id.in_(profile_ids),
+            PageView.viewed_at >= start_date,
+            PageView.viewed_at <= end_date
+        ).group_by(PageView.profile_id).all())
+        usernames = dict(self.db.query(LinkProfile.id, LinkProfile.username).filter(LinkProfile.id.in_(profile_ids)).all())
+        return [
+            (profile_id, usernames.get(profile_id, ''), count, views.get(profile_id, 0))
+            for profile_id, count in clicks
+        ]
+    
+    def _session_filter(self, query, profile_id: int, start_date: Optional[datetime],
+                        end_date: Optional[datetime]):
+        query = query.filter(VisitSession.profile_id == profile_id)
+        if start_date:
+            query = query.filter(VisitSession.started_at >= start_date)
+        if end_date:
+            query = query.filter(VisitSession.started_at <= end_date)
+        return query
+    
+    def analyze_sessions(self, profile_id: int, start_date: Optional[datetime] = None,
+                         end_date: Optional[datetime] = None) -> SessionAnalytics:
+        """Visit-level click-through from visit_sessions (sessions are dated by their start)"""
+        with_views = VisitSession.page_views > 0
+        converted = VisitSession.first_click_seconds.isnot(None)
+        row = self._session_filter(
+            self.db.query(
+                func.count(VisitSession.id),
+                func.sum(case((with_views, 1), else_=0)),
+                func.sum(case((converted, 1), else_=0)),
+                func.sum(case((and_(VisitSession.page_views == 1, VisitSession.clicks == 0), 1), else_=0)),
+                func.sum(VisitSession.page_views),
+                func.sum(case((converted, VisitSession.clicks), else_=0))
+            ),
+            profile_id, start_date, end_date
+        ).one()
+        total, viewed, converted_count, bounced, views, converted_clicks = (int(value or 0) for value in row)
+        
+        return SessionAnalytics(
+            profile_id=profile_id,
+            total_sessions=total,
+            sessions_with_views=viewed,
+            converted_sessions=converted_count,
+            session_ctr=round(converted_count / viewed * 100, 2) if viewed else 0.0,
+            bounce_rate=round(bounced / viewed * 100, 2) if viewed else 0.0,
+            avg_views_per_session=round(views / total, 2) if total else 0.0,
+            avg_clicks_per_converted_session=round(converted_clicks / converted_count, 2) if converted_count else 0.0
+        )
+    
+    def time_to_click_distribution(self, profile_id: int, start_date: Optional[datetime] = None,
+                                   end_date: Optional[datetime] = None) -> TimeToClickDistribution:
+        """Histogram and percentiles of first view -> first click delays over converted sessions"""
+        rows = self._session_filter(
+            self.db.query(VisitSession.first_click_seconds).filter(VisitSession.first_click_seconds.isnot(None)),
+            profile_id, start_date, end_date
+        ).all()
+        delays = np.fromiter((row[0] for row in rows), dtype=np.float64, count=len(rows))
+        
+        edges = np.array(TIME_TO_CLICK_EDGES + [np.inf])
+        counts = np.histogram(delays, bins=edges)[0] if len(delays) else np.zeros(len(edges) - 1, dtype=np.int64)
+        buckets = []
+        for low, high, count in zip(edges[:-1], edges[1:], counts):
+            buckets.append(TimeToClickBucket(
+                label=f"{format_seconds(low)}-{format_seconds(high)}" if np.isfinite(high) else f"{format_seconds(low)}+",
+                min_seconds=float(low),
+                max_seconds=float(high) if np.isfinite(high) else None,
+                sessions=int(count),
+                percentage=round(int(count) / len(delays) * 100, 2) if len(delays) else 0.0
+            ))
+        
+        percentiles = {}
+        if len(delays):
+            values = np.percentile(delays, [25, 50, 75, 90, 99])
+            percentiles = {f"p{p}": round(float(v), 2) for p, v in zip((25, 50, 75, 90, 99), values)}
+        
+        return TimeToClickDistribution(
+            profile_id=profile_id,
+            converted_sessions=len(delays),
+            mean_seconds=round(float(delays.mean()), 2) if len(delays) else None,
+            percentiles=percentiles,
+            buckets=buckets
+        )
+    
+    def _grouped_time_rows(self, profile_id: int, granularity: str,
+                           start_date: datetime, end_date: datetime):
+        """Clicks (with unique visitors) and views grouped by hour or day, queried concurrently"""
+        unit = 'hour' if granularity == 'hourly' else 'day'
+        
+        def click_rows(db: Session):
+            return db.query(
+                func.date_trunc(unit, ClickEvent.clicked_at).label('period'),
                 func.count(ClickEvent.id).label('clicks'),
                 func.count(func.distinct(ClickEvent.ip_address)).label('unique_visitors')
             ).filter(
@@ -253,9 +676,10 @@ class AnalyticsService:
                     ClickEvent.clicked_at <= end_date
                 )
             ).group_by('period').all()
-            
-            view_data = self.db.query(
-                func.date_trunc('day', PageView.viewed_at).label('period'),
+        
+        def view_rows(db: Session):
+            return db.query(
+                func.date_trunc(unit, PageView.viewed_at).label('period'),
                 func.count(PageView.id).label('views')
             ).filter(
                 and_(
@@ -265,61 +689,121 @@ class AnalyticsService:
                 )
             ).group_by('period').all()
         
-        # Combine data
-        time_metrics = []
-        click_dict = {str(row.period): {'clicks': row.clicks, 'unique': row.unique_visitors} for row in click_data}
-        view_dict = {str(row.period): row.views for row in view_data}
-        
-        # Get all periods
-        all_periods = set(click_dict.keys()) | set(view_dict.keys())
-        
-        for period in sorted(all_periods):
-            click_info = click_dict.get(period, {'clicks': 0, 'unique': 0})
-            views = view_dict.get(period, 0)
-            
-            time_metrics.append(TimeBasedMetrics(
-                period=period,
-                clicks=click_info['clicks'],
-                views=views,
-                unique_visitors=click_info['unique']
-            ))
-        
-        # Find peak times
+        click_data, view_data = run_queries(self.db, [click_rows, view_rows])
+        return click_data, view_data
+    
+    def _find_peaks(self, granularity: str, period_clicks: List[tuple]):
+        """Peak hour or weekday from (period, clicks) pairs, in period order"""
         peak_hour = None
         peak_day = None
         best_time_recommendation = None
         
-        if granularity == 'hourly' and time_metrics:
+        if granularity == 'hourly' and period_clicks:
             # Find peak hour
             hour_totals = {}
-            for metric in time_metrics:
-                hour = datetime.fromisoformat(metric.period).hour
+            for period, clicks in period_clicks:
+                hour = period.hour
                 if hour not in hour_totals:
                     hour_totals[hour] = 0
-                hour_totals[hour] += metric.clicks
+                hour_totals[hour] += clicks
             
             if hour_totals:
                 peak_hour = max(hour_totals.items(), key=lambda x: x[1])[0]
                 best_time_recommendation = f"Best posting time: {peak_hour}:00"
         
-        elif granularity == 'daily' and time_metrics:
+        elif granularity == 'daily' and period_clicks:
             # Find peak day of week
             day_totals = {}
-            for metric in time_metrics:
-                day_name = datetime.fromisoformat(metric.period).strftime('%A').lower()
+            for period, clicks in period_clicks:
+                day_name = period.strftime('%A').lower()
                 if day_name not in day_totals:
                     day_totals[day_name] = 0
-                day_totals[day_name] += metric.clicks
+                day_totals[day_name] += clicks
             
             if day_totals:
                 peak_day = max(day_totals.items(), key=lambda x: x[1])[0]
                 best_time_recommendation = f"Best posting day: {peak_day.title()}"
         
+        return peak_hour, peak_day, best_time_recommendation
+    
+    def analyze_time_patterns(self, profile_id: int, granularity: str = 'daily',
+                            start_date: Optional[datetime] = None,
+                            end_date: Optional[datetime] = None) -> TimeAnalytics:
+        """Analyze time-based patterns in clicks and views"""
+        
+        if not end_date:
+            end_date = datetime.now()
+        if not start_date:
+            start_date = end_date - timedelta(days=30)
+        
+        click_data, view_data = self._grouped_time_rows(profile_id, granularity, start_date, end_date)
+        
+        # Combine data
+        time_metrics = []
+        click_dict = {row.period: {'clicks': row.clicks, 'unique': row.unique_visitors} for row in click_data}
+        view_dict = {row.period: row.views for row in view_data}
+        
+        # Get all periods
+        all_periods = sorted(set(click_dict.keys()) | set(view_dict.keys()))
+        
+        for period in all_periods:
+            click_info = click_dict.get(period, {'clicks': 0, 'unique': 0})
+            views = view_dict.get(period, 0)
+            
+            time_metrics.append(TimeBasedMetrics(
+                period=str(period),
+                clicks=click_info['clicks'],
+                views=views,
+                unique_visitors=click_info['unique']
+            ))
+        
+        # Find peak times
+        peak_hour, peak_day, best_time_recommendation = self._find_peaks(
+            granularity, [(period, click_dict.get(period, {'clicks': 0})['clicks']) for period in all_periods]
+        )
+        significance = None
+        if best_time_recommendation:
+            significance = self._best_time_significance(profile_id, granularity, start_date, end_date)
+        
         return TimeAnalytics(
             profile_id=profile_id,
             granularity=granularity,
             data=time_metrics,
             peak_hour=peak_hour,
             peak_day=peak_day,
-            best_time_recommendation=best_time_recommendation
-        )
\ No newline at end of file
+            best_time_recommendation=best_time_recommendation,
+            best_time_pvalue=significance.pvalue if significance else None,
+            best_time_significant=significance.pvalue < SIGNIFICANCE_ALPHA if significance else None
+        )
+    
+    def get_time_series(self, profile_id: int, granularity: str = 'daily',
+                        start_date: Optional[datetime] = None,
+                        end_date: Optional[datetime] = None) -> Tuple[TimeSeriesColumns, dict]:
+        """Same data as analyze_time_patterns as dense columns, without per-period models"""
+        
+        if not end_date:
+            end_date = datetime.now()
+        if not start_date:
+            start_date = end_date - timedelta(days=30)
+        
+        click_data, view_data = self._grouped_time_rows(profile_id, granularity, start_date, end_date)
+        columns = build_columns(click_data, view_data, granularity, start_date, end_date)
+        
+        click_dict = {row.period: row.clicks for row in click_data}
+        all_periods = sorted(set(click_dict) | {row.period for row in view_data})
+        peak_hour, peak_day, best_time_recommendation = self._find_peaks(
+            granularity, [(period, click_dict.get(period, 0)) for period in all_periods]
+        )
+        significance = None
+        if best_time_recommendation:
+            significance = self._best_time_significance(profile_id, granularity, start_date, end_date)
+        
+        return columns, {
+            "profile_id": profile_id,
+            "granularity": granularity,
+            "peak_hour": peak_hour,
+            "peak_day": peak_day,
+            "best_time_recommendation": best_time_recommendation,
+            "best_time_pvalue": significance.pvalue if significance else None,
+            "best_time_significant": significance.pvalue < SIGNIFICANCE_ALPHA if significance else None
+        }
@@ -0,0 +1,265 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Callable, Deque, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from config import settings
+
+# Rates tracked per entity: a profile's views and clicks, and each link's clicks
+PROFILE_VIEWS = "profile_views"
+PROFILE_CLICKS = "profile_clicks"
+LINK_CLICKS = "link_clicks"
+
+class Anomaly(NamedTuple):
+    profile_id: int
+    link_id: Optional[int]
+    metric: str
+    kind: str  # 'spike' or 'drop'
+    bucket_start: datetime
+    observed: int
+    expected: float
+    z_score: float
+
+class AnomalyDetector:
+    """
+    Streaming spike/drop detector over per-entity event rates.
+
+    Every entity (a profile's views or clicks, a link's clicks) owns one slot in fixed-size
+    NumPy arrays: the event count of the current bucket plus an exponentially weighted
+    mean and variance of past bucket counts. Recording an event is a dict lookup and an
+    increment. Once per bucket, advance() closes the bucket for all slots at once: counts
+    more than `threshold` standard deviations from the mean are flagged, then folded into
+    the baseline (clamped, so one spike doesn't distort it) and reset. Slots are recycled
+    least-recently-used, so memory is fixed at max_entities.
+
+    The EWMA adapts within a few hours, which absorbs the slow daily curve; what gets
+    flagged is a sudden change against the recent level.
+    """
+
+    def __init__(self, max_entities: int = 50000, bucket_seconds: int = 300, alpha: float = 0.1,
+                 threshold: float = 4.0, warmup_buckets: int = 12, min_count: float = 5.0,
+                 history_size: int = 50):
+        self.max_entities = max_entities
+        self.bucket_seconds = max(int(bucket_seconds), 1)
+        self.alpha = alpha
+        self.threshold = threshold
+        self.warmup_buckets = warmup_buckets
+        self.min_count = min_count  # spikes and drops below this many events per bucket are noise
+        self.history_size = history_size
+
+        self.count = np.zeros(max_entities, dtype=np.int64)
+        self.mean = np.zeros(max_entities, dtype=np.float64)
+        self.var = np.zeros(max_entities, dtype=np.float64)
+        self.buckets_seen = np.zeros(max_entities, dtype=np.int32)
+        self.active = np.zeros(max_entities, dtype=bool)
+        self.profile_of = np.zeros(max_entities, dtype=np.int64)
+        self.last_flagged = np.full(max_entities, -2, dtype=np.int64)  # bucket of the latest deviation
+        self._keys: List[Optional[Tuple[str, int]]] = [None] * max_entities
+        self._slots: "OrderedDict[Tuple[str, int], int]" = OrderedDict()
+        self._free = list(range(max_entities - 1, -1, -1))
+
+        self._history: "OrderedDict[int, Deque[Anomaly]]" = OrderedDict()
+        self._bucket = self._bucket_at(time.time())
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+        self.events_recorded = 0
+        self.anomalies_flagged = 0
+        self.evicted = 0
+
+    def _bucket_at(self, timestamp: float) -> int:
+        return int(timestamp // self.bucket_seconds)
+
+    # Ingestion side
+
+    def _slot(self, key: Tuple[str, int], profile_id: int) -> int:
+        slot = self._slots.get(key)
+        if slot is not None:
+            self._slots.move_to_end(key)
+            return slot
+
+        if self._free:
+            slot = self._free.pop()
+        else:
+            _, slot = self._slots.popitem(last=False)
+            self.evicted += 1
+        self.count[slot] = 0
+        self.mean[slot] = 0.0
+        self.var[slot] = 0.0
+        self.buckets_seen[slot] = 0
+        self.active[slot] = True
+        self.profile_of[slot] = profile_id
+        self.last_flagged[slot] = -2
+        self._keys[slot] = key
+        self._slots[key] = slot
+        return slot
+
+    def record_event(self, kind: str, profile_id: int, link_id: Optional[int] = None,
+                     timestamp: Optional[datetime] = None) -> None:
+        """
+        Count one tracked event ('click' or 'view'); constant time.
+
+        Events timestamped before the current bucket (client timestamps in batches) are
+        ignored, since they say nothing about the current rate.
+        """
+        if timestamp is not None and self._bucket_at(timestamp.timestamp()) < self._bucket:
+            return
+        with self._lock:
+            self.events_recorded += 1
+            if kind == "click":
+                self.count[self._slot((PROFILE_CLICKS, profile_id), profile_id)] += 1
+                if link_id is not None:
+                    self.count[self._slot((LINK_CLICKS, link_id), profile_id)] += 1
+            else:
+                self.count[self._slot((PROFILE_VIEWS, profile_id), profile_id)] += 1
+
+    # Bucket rollover
+
+    def _close_bucket(self, bucket: int, flag: bool) -> List[Anomaly]:
+        index = np.flatnonzero(self.active)
+        if len(index) == 0:
+            return []
+
+        observed = self.count[index].astype(np.float64)
+        mean = self.mean[index]
+        var = self.var[index]
+        seen = self.buckets_seen[index]
+
+        # Counts are at least Poisson-noisy, so a flat history must not make sigma ~0
+        sigma = np.sqrt(np.maximum(np.maximum(var, mean), 1.0))
+        z = (observed - mean) / sigma
+        warm = seen >= self.warmup_buckets
+
+        anomalies = []
+        if flag:
+            spikes = warm & (z > self.threshold) & (observed >= self.min_count)
+            drops = warm & (z < -self.threshold) & (mean >= self.min_count)
+            deviating = spikes | drops
+            # Report an episode once, not again for every bucket it lasts
+            new = deviating & (self.last_flagged[index] != bucket - 1)
+            self.last_flagged[index[deviating]] = bucket
+            bucket_start = datetime.fromtimestamp(bucket * self.bucket_seconds)
+            for position in np.flatnonzero(new):
+                slot = index[position]
+                metric, entity_id = self._keys[slot]
+                anomalies.append(Anomaly(
+                    profile_id=int(self.profile_of[slot]),
+                    link_id=entity_id if metric == LINK_CLICKS else None,
+                    metric=metric,
+                    kind="spike" if spikes[position] else "drop",
+                    bucket_start=bucket_start,
+                    observed=int(observed[position]),
+                    expected=round(float(mean[position]), 2),
+                    z_score=round(float(z[position]), 2)
+                ))
+
+        # Fold into the baseline; warm slots are clamped to 2 sigma so an outlier only nudges
+        # the mean and barely inflates the variance (which would mask the next deviation)
+        bound = 2.0 * sigma
+        value = np.where(warm, np.clip(observed, mean - bound, mean + bound), observed)
+        delta = value - mean
+        first = seen == 0
+        self.mean[index] = np.where(first, observed, mean + self.alpha * delta)
+        self.var[index] = np.where(first, 0.0, (1 - self.alpha) * (var + self.alpha * delta * delta))
+        self.buckets_seen[index] = np.minimum(seen + 1, np.iinfo(np.int32).max)
+        self.count[index] = 0
+        return anomalies
+
+    def advance(self, now: Optional[float] = None) -> List[Anomaly]:
+        """Close every bucket that has ended; returns the anomalies found in them"""
+        target = self._bucket_at(time.time() if now is None else now)
+        with self._lock:
+            if target <= self._bucket:
+                return []
+            anomalies = self._close_bucket(self._bucket, flag=True)
+            # Buckets nobody closed (e.g. the loop was stalled) count as empty, unflagged;
+            # past ~100 empty buckets the baselines are decayed to nothing anyway
+            for bucket in range(self._bucket + 1, min(target, self._bucket + 100)):
+                self._close_bucket(bucket, flag=False)
+            self._bucket = target
+
+            for anomaly in anomalies:
+                history = self._history.get(anomaly.profile_id)
+                if history is None:
+                    if len(self._history) >= self.max_entities:
+                        self._history.popitem(last=False)
+                    history = self._history[anomaly.profile_id] = deque(maxlen=self.history_size)
+                else:
+                    self._history.move_to_end(anomaly.profile_id)
+                history.append(anomaly)
+            self.anomalies_flagged += len(anomalies)
+        return anomalies
+
+    # Queries
+
+    def anomalies(self, profile_id: int, limit: Optional[int] = None) -> List[Anomaly]:
+        """Recent anomalies for a profile, newest first"""
+        with self._lock:
+            history = list(self._history.get(profile_id, ()))
+        history.reverse()
+        return history[:limit] if limit is not None else history
+
+    def baselines(self, profile_id: int) -> List[dict]:
+        """Current bucket count and learned per-bucket baseline for each of a profile's entities"""
+        with self._lock:
+            index = np.flatnonzero(self.active & (self.profile_of == profile_id))
+            baselines = []
+            for slot in index:
+                metric, entity_id = self._keys[slot]
+                baselines.append({
+                    "metric": metric,
+                    "link_id": entity_id if metric == LINK_CLICKS else None,
+                    "current": int(self.count[slot]),
+                    "expected": round(float(self.mean[slot]), 2),
+                    "std_dev": round(float(np.sqrt(self.var[slot])), 2),
+                    "warm": bool(self.buckets_seen[slot] >= self.warmup_buckets)
+                })
+        baselines.sort(key=lambda b: (b["metric"], b["link_id"] or 0))
+        return baselines
+
+    # Lifecycle
+
+    async def run(self, publish: Callable[[Anomaly], None]) -> None:
+        while True:
+            # Wake just after each bucket boundary
+            await asyncio.sleep(self.bucket_seconds - time.time() % self.bucket_seconds + 0.05)
+            for anomaly in self.advance():
+                try:
+                    publish(anomaly)
+                except Exception:
+                    pass
+
+    def start(self, publish: Callable[[Anomaly], None]) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self.run(publish))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "tracked_entities": len(self._slots),
+            "max_entities": self.max_entities,
+            "bucket_seconds": self.bucket_seconds,
+            "events_recorded": self.events_recorded,
+            "anomalies_flagged": self.anomalies_flagged,
+            "evicted": self.evicted
+        }
+
+anomaly_detector = AnomalyDetector(
+    max_entities=settings.ANOMALY_MAX_ENTITIES,
+    bucket_seconds=settings.ANOMALY_BUCKET_SECONDS,
+    alpha=settings.ANOMALY_ALPHA,
+    threshold=settings.ANOMALY_THRESHOLD,
+    warmup_buckets=settings.ANOMALY_WARMUP_BUCKETS
+)
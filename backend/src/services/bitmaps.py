@@ -0,0 +1,167 @@
+import struct
+from typing import Dict, Iterable
+
+import numpy as np
+
+# Containers hold the low 16 bits of the values sharing one high 16 bits
+ARRAY_LIMIT = 4096  # past this many values a 8 KB bitset is smaller than a sorted array
+BITSET_WORDS = 1 << 10  # 65536 bits as uint64 words
+
+ARRAY = 0
+BITSET = 1
+
+def _popcount(words: np.ndarray) -> int:
+    return int(np.unpackbits(words.view(np.uint8)).sum())
+
+def _to_bitset(values: np.ndarray) -> np.ndarray:
+    bits = np.zeros(BITSET_WORDS * 64, dtype=bool)
+    bits[values] = True
+    return np.packbits(bits, bitorder="little").view(np.uint64)
+
+def _to_array(words: np.ndarray) -> np.ndarray:
+    return np.flatnonzero(np.unpackbits(words.view(np.uint8), bitorder="little")).astype(np.uint16)
+
+def _sorted_unique(values: np.ndarray) -> np.ndarray:
+    # Sort-based; faster than np.unique for these small integer arrays
+    values = np.sort(values)
+    if len(values) > 1:
+        values = values[np.concatenate(([True], values[1:] != values[:-1]))]
+    return values
+
+def _contains(words: np.ndarray, values: np.ndarray) -> np.ndarray:
+    return (words[values >> 6] >> (values & 63).astype(np.uint64)) & np.uint64(1) == 1
+
+def _normalize(container: np.ndarray):
+    """Pick the smaller representation; None for an empty container"""
+    if container.dtype == np.uint16:
+        if len(container) == 0:
+            return None
+        return container if len(container) <= ARRAY_LIMIT else _to_bitset(container)
+    count = _popcount(container)
+    if count == 0:
+        return None
+    return container if count > ARRAY_LIMIT else _to_array(container)
+
+class RoaringBitmap:
+    """
+    Compressed set of 32-bit integers in the layout of Roaring bitmaps.
+
+    Values are partitioned by their high 16 bits; each partition is stored either as a
+    sorted uint16 array (sparse) or a 65536-bit bitset (dense), whichever is smaller.
+    Union, intersection and difference work container by container with vectorized
+    NumPy operations. Bitmaps are immutable; operators return new ones.
+    """
+
+    __slots__ = ("containers",)
+
+    def __init__(self, containers: Dict[int, np.ndarray] = None):
+        self.containers: Dict[int, np.ndarray] = containers or {}
+
+    @classmethod
+    def from_values(cls, values: Iterable[int]) -> "RoaringBitmap":
+        values = _sorted_unique(np.asarray(values if isinstance(values, np.ndarray) else list(values), dtype=np.uint32))
+        high = values >> 16
+        low = (values & 0xFFFF).astype(np.uint16)
+        containers = {}
+        if len(values):
+            splits = np.flatnonzero(np.diff(high)) + 1
+            for chunk_high, chunk in zip(high[np.concatenate(([0], splits))], np.split(low, splits)):
+                containers[int(chunk_high)] = _normalize(chunk)
+        return cls(containers)
+
+    def __len__(self) -> int:
+        return sum(
+            len(container) if container.dtype == np.uint16 else _popcount(container)
+            for container in self.containers.values()
+        )
+
+    def __bool__(self) -> bool:
+        return bool(self.containers)
+
+    def to_array(self) -> np.ndarray:
+        parts = [
+            (np.uint32(key) << np.uint32(16)) | (container if container.dtype == np.uint16 else _to_array(container)).astype(np.uint32)
+            for key, container in sorted(self.containers.items())
+        ]
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.uint32)
+
+    def __or__(self, other: "RoaringBitmap") -> "RoaringBitmap":
+        containers = dict(self.containers)
+        for key, theirs in other.containers.items():
+            mine = containers.get(key)
+            if mine is None:
+                containers[key] = theirs
+            elif mine.dtype == np.uint16 and theirs.dtype == np.uint16 and len(mine) + len(theirs) <= ARRAY_LIMIT:
+                containers[key] = _sorted_unique(np.concatenate((mine, theirs)))
+            elif mine.dtype == np.uint16 and theirs.dtype == np.uint16:
+                containers[key] = _normalize(_to_bitset(np.concatenate((mine, theirs))))
+            else:
+                mine = mine if mine.dtype == np.uint64 else _to_bitset(mine)
+                theirs = theirs if theirs.dtype == np.uint64 else _to_bitset(theirs)
+                containers[key] = mine | theirs
+        return RoaringBitmap(containers)
+
+    def __and__(self, other: "RoaringBitmap") -> "RoaringBitmap":
+        containers = {}
+        for key in self.containers.keys() & other.containers.keys():
+            mine, theirs = self.containers[key], other.containers[key]
+            if mine.dtype == np.uint16 and theirs.dtype == np.uint16:
+                result = np.intersect1d(mine, theirs, assume_unique=True)
+            elif mine.dtype == np.uint16:
+                result = mine[_contains(theirs, mine)]
+            elif theirs.dtype == np.uint16:
+                result = theirs[_contains(mine, theirs)]
+            else:
+                result = mine & theirs
+            result = _normalize(result)
+            if result is not None:
+                containers[key] = result
+        return RoaringBitmap(containers)
+
+    def __sub__(self, other: "RoaringBitmap") -> "RoaringBitmap":
+        containers = {}
+        for key, mine in self.containers.items():
+            theirs = other.containers.get(key)
+            if theirs is None:
+                containers[key] = mine
+                continue
+            if mine.dtype == np.uint16 and theirs.dtype == np.uint16:
+                result = np.setdiff1d(mine, theirs, assume_unique=True)
+            elif mine.dtype == np.uint16:
+                result = mine[~_contains(theirs, mine)]
+            else:
+                result = mine & ~(theirs if theirs.dtype == np.uint64 else _to_bitset(theirs))
+            result = _normalize(result)
+            if result is not None:
+                containers[key] = result
+        return RoaringBitmap(containers)
+
+    @classmethod
+    def union_all(cls, bitmaps: Iterable["RoaringBitmap"]) -> "RoaringBitmap":
+        result = cls()
+        for bitmap in bitmaps:
+            result = result | bitmap
+        return result
+
+    def to_bytes(self) -> bytes:
+        """Serialized form: container count, then (key, kind, length, payload) per container"""
+        parts = [struct.pack("<I", len(self.containers))]
+        for key, container in sorted(self.containers.items()):
+            kind = ARRAY if container.dtype == np.uint16 else BITSET
+            parts.append(struct.pack("<HBI", key, kind, len(container)))
+            parts.append(container.astype("<u2" if kind == ARRAY else "<u8").tobytes())
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "RoaringBitmap":
+        (count,) = struct.unpack_from("<I", data, 0)
+        offset = 4
+        containers = {}
+        for _ in range(count):
+            key, kind, length = struct.unpack_from("<HBI", data, offset)
+            offset += 7
+            dtype = "<u2" if kind == ARRAY else "<u8"
+            container = np.frombuffer(data, dtype=dtype, count=length, offset=offset)
+            offset += container.nbytes
+            containers[key] = container.astype(np.uint16 if kind == ARRAY else np.uint64)
+        return cls(containers)
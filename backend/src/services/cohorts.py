@@ -0,0 +1,139 @@
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from config import settings
+from database.models import VisitorBitmap, VisitorBitmapCursor, VisitorId
+from services.bitmaps import RoaringBitmap
+from services.event_jobs import EventCursorJob
+
+class VisitorDictionary:
+    """
+    ip_address -> dense integer id, backed by the visitor_ids table.
+
+    Ids are assigned in insertion order, so they stay small and cluster well in the
+    bitmaps. Recently used addresses are cached (LRU, max_size entries); misses are
+    resolved with one SELECT and one INSERT per batch.
+    """
+
+    def __init__(self, max_size: int = 500000):
+        self.max_size = max_size
+        self._cache: "OrderedDict[str, int]" = OrderedDict()
+
+    def encode(self, db: Session, addresses: List[str]) -> np.ndarray:
+        ids = {}
+        missing = []
+        for address in set(addresses):
+            visitor_id = self._cache.get(address)
+            if visitor_id is None:
+                missing.append(address)
+            else:
+                self._cache.move_to_end(address)
+                ids[address] = visitor_id
+
+        for chunk in range(0, len(missing), 1000):
+            part = missing[chunk:chunk + 1000]
+            found = dict(db.query(VisitorId.ip_address, VisitorId.id).filter(VisitorId.ip_address.in_(part)))
+            new = [address for address in part if address not in found]
+            if new:
+                found.update(db.execute(
+                    insert(VisitorId).returning(VisitorId.ip_address, VisitorId.id),
+                    [{"ip_address": address} for address in new]
+                ).all())
+            ids.update(found)
+            for address, visitor_id in found.items():
+                self._cache[address] = visitor_id
+
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+        return np.fromiter((ids[address] for address in addresses), dtype=np.uint32, count=len(addresses))
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+class VisitorBitmapJob(EventCursorJob):
+    """
+    Adds new clicks and page views to per-profile, per-day visitor bitmaps.
+
+    Each batch's IP addresses are encoded and each (profile, day) group is ORed into its
+    stored bitmap. Union is order-independent, so clicks and views need no merging and
+    late events simply land in their own day.
+    """
+
+    cursor_model = VisitorBitmapCursor
+    event_columns = ("profile_id", "ip_address")
+
+    def __init__(self, batch_size: int = 50000, dictionary: Optional[VisitorDictionary] = None):
+        super().__init__(batch_size)
+        self.dictionary = dictionary or VisitorDictionary()
+
+    def _apply(self, db: Session, cursor: VisitorBitmapCursor, clicks: List[tuple], views: List[tuple]) -> dict:
+        return {"bitmaps_written": self._add(db, [row[1:] for row in clicks] + [row[1:] for row in views])}
+
+    def _reset(self) -> None:
+        # Ids inserted in the failed transaction may be cached
+        self.dictionary.clear()
+
+    def _add(self, db: Session, events: List[tuple]) -> int:
+        """OR a batch of (profile_id, ip_address, timestamp) into the daily bitmaps; returns bitmaps written"""
+        events = [event for event in events if event[1]]
+        if not events:
+            return 0
+        visitor_ids = self.dictionary.encode(db, [event[1] for event in events])
+        profiles = np.fromiter((event[0] for event in events), dtype=np.int64, count=len(events))
+        days = np.fromiter((event[2].toordinal() for event in events), dtype=np.int64, count=len(events))
+
+        order = np.lexsort((days, profiles))
+        profiles, days, visitor_ids = profiles[order], days[order], visitor_ids[order]
+        boundaries = np.flatnonzero((np.diff(profiles) != 0) | (np.diff(days) != 0)) + 1
+        starts = np.concatenate(([0], boundaries))
+        groups: Dict[Tuple[int, date], RoaringBitmap] = {}
+        for start, ids in zip(starts, np.split(visitor_ids, boundaries)):
+            groups[(int(profiles[start]), date.fromordinal(int(days[start])))] = RoaringBitmap.from_values(ids)
+
+        profile_ids = sorted({profile_id for profile_id, _ in groups})
+        group_days = sorted({day for _, day in groups})
+        existing = {}
+        for chunk in range(0, len(profile_ids), 1000):
+            rows = db.query(VisitorBitmap).filter(
+                VisitorBitmap.profile_id.in_(profile_ids[chunk:chunk + 1000]),
+                VisitorBitmap.day >= group_days[0],
+                VisitorBitmap.day <= group_days[-1]
+            ).with_for_update().all()
+            existing.update(((row.profile_id, row.day), row) for row in rows)
+
+        for (profile_id, day), bitmap in groups.items():
+            row = existing.get((profile_id, day))
+            if row is None:
+                db.add(VisitorBitmap(profile_id=profile_id, day=day, visitors=len(bitmap), bitmap=bitmap.to_bytes()))
+                continue
+            merged = RoaringBitmap.from_bytes(row.bitmap) | bitmap
+            row.visitors = len(merged)
+            row.bitmap = merged.to_bytes()
+        return len(groups)
+
+def week_start(moment: datetime) -> date:
+    """Monday of the week containing moment"""
+    day = moment.date() if isinstance(moment, datetime) else moment
+    return day - timedelta(days=day.weekday())
+
+def weekly_visitors(db: Session, profile_id: int, first_week: date, weeks: int) -> List[RoaringBitmap]:
+    """Union of the daily bitmaps for each of `weeks` consecutive weeks starting at first_week"""
+    rows = db.query(VisitorBitmap.day, VisitorBitmap.bitmap).filter(
+        VisitorBitmap.profile_id == profile_id,
+        VisitorBitmap.day >= first_week,
+        VisitorBitmap.day < first_week + timedelta(weeks=weeks)
+    ).all()
+    by_week: List[List[RoaringBitmap]] = [[] for _ in range(weeks)]
+    for day, bitmap in rows:
+        by_week[(day - first_week).days // 7].append(RoaringBitmap.from_bytes(bitmap))
+    return [RoaringBitmap.union_all(days) for days in by_week]
+
+visitor_bitmap_job = VisitorBitmapJob(
+    batch_size=settings.COHORT_BATCH_SIZE,
+    dictionary=VisitorDictionary(max_size=settings.VISITOR_ID_CACHE_SIZE)
+)
@@ -0,0 +1,201 @@
+import bisect
+import csv
+import ipaddress
+import os
+from enum import IntEnum
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+try:
+    import maxminddb  # type: ignore
+except ImportError:
+    maxminddb = None
+
+from config import settings
+
+class DeviceClass(IntEnum):
+    UNKNOWN = 0
+    DESKTOP = 1
+    MOBILE = 2
+    TABLET = 3
+    BOT = 4
+
+class BrowserFamily(IntEnum):
+    UNKNOWN = 0
+    CHROME = 1
+    SAFARI = 2
+    FIREFOX = 3
+    EDGE = 4
+    OPERA = 5
+    SAMSUNG = 6
+    INSTAGRAM = 7
+    FACEBOOK = 8
+    TIKTOK = 9
+    OTHER = 10
+
+# Checked in order: in-app browsers and Chromium forks first, since their UAs also say Chrome/Safari
+BROWSER_MARKERS = (
+    ("instagram", BrowserFamily.INSTAGRAM),
+    ("fban", BrowserFamily.FACEBOOK),
+    ("fbav", BrowserFamily.FACEBOOK),
+    ("musical_ly", BrowserFamily.TIKTOK),
+    ("bytedancewebview", BrowserFamily.TIKTOK),
+    ("edg/", BrowserFamily.EDGE),
+    ("edga/", BrowserFamily.EDGE),
+    ("edgios/", BrowserFamily.EDGE),
+    ("opr/", BrowserFamily.OPERA),
+    ("samsungbrowser", BrowserFamily.SAMSUNG),
+    ("firefox/", BrowserFamily.FIREFOX),
+    ("fxios/", BrowserFamily.FIREFOX),
+    ("crios/", BrowserFamily.CHROME),
+    ("chrome/", BrowserFamily.CHROME),
+    ("safari/", BrowserFamily.SAFARI),
+)
+
+BOT_MARKERS = ("bot", "crawler", "spider", "slurp", "curl/", "python-requests", "headless")
+
+def _classify_device(ua: str) -> DeviceClass:
+    if any(marker in ua for marker in BOT_MARKERS):
+        return DeviceClass.BOT
+    if "ipad" in ua or "tablet" in ua or ("android" in ua and "mobile" not in ua):
+        return DeviceClass.TABLET
+    if "mobi" in ua or "iphone" in ua or "ipod" in ua or "android" in ua:
+        return DeviceClass.MOBILE
+    if "windows" in ua or "macintosh" in ua or "x11" in ua or "cros" in ua:
+        return DeviceClass.DESKTOP
+    return DeviceClass.UNKNOWN
+
+def _classify_browser(ua: str) -> BrowserFamily:
+    for marker, family in BROWSER_MARKERS:
+        if marker in ua:
+            return family
+    return BrowserFamily.OTHER if ua else BrowserFamily.UNKNOWN
+
+@lru_cache(maxsize=settings.UA_CACHE_SIZE)
+def parse_user_agent(user_agent: Optional[str]) -> Tuple[int, int]:
+    """(device_class, browser_family) for a UA string; cached since UAs repeat heavily"""
+    if not user_agent:
+        return DeviceClass.UNKNOWN, BrowserFamily.UNKNOWN
+    ua = user_agent.lower()
+    return _classify_device(ua), _classify_browser(ua)
+
+# Referrer substrings per traffic source, in the notebook's precedence order (extract_traffic_source)
+SOURCE_PATTERNS = (
+    ("Instagram", ("instagram",)),
+    ("TikTok", ("tiktok",)),
+    ("Facebook", ("facebook",)),
+    ("Twitter", ("twitter",)),
+    ("Google", ("google",)),
+    ("WhatsApp", ("whatsapp", "wa.me")),
+)
+DIRECT_TRAFFIC = "Trafic Direct"
+OTHER_SOURCES = "Autres Sources"
+TRAFFIC_SOURCES = [name for name, _ in SOURCE_PATTERNS] + [DIRECT_TRAFFIC, OTHER_SOURCES]
+
+@lru_cache(maxsize=4096)
+def traffic_source(referrer: Optional[str]) -> str:
+    """The notebook's traffic source (PLATFORM_MAPPING name) of a referrer"""
+    if not referrer:
+        return DIRECT_TRAFFIC
+    lowered = referrer.lower()
+    for name, patterns in SOURCE_PATTERNS:
+        if any(pattern in lowered for pattern in patterns):
+            return name
+    return OTHER_SOURCES
+
+class GeoIPDatabase:
+    """
+    Offline IP -> ISO country lookup.
+
+    Reads either a MaxMind .mmdb file (needs the optional maxminddb package) or a CSV of
+    `start_ip,end_ip,country_code` ranges (DB-IP / IP2Location LITE layout; addresses may
+    be dotted or integers). CSV ranges are kept as sorted integer lists and searched with
+    bisect; lookups are cached per address.
+    """
+
+    def __init__(self, path: Optional[str] = None, cache_size: int = 65536):
+        self.path = path
+        self._reader = None
+        self._starts: List[int] = []
+        self._ends: List[int] = []
+        self._countries: List[str] = []
+        self.lookup = lru_cache(maxsize=cache_size)(self._lookup)
+
+        if path and os.path.exists(path):
+            if path.endswith(".mmdb"):
+                if maxminddb is None:
+                    raise ImportError("maxminddb is required to read .mmdb GeoIP databases")
+                self._reader = maxminddb.open_database(path)
+            else:
+                self._load_csv(path)
+
+    @property
+    def loaded(self) -> bool:
+        return self._reader is not None or bool(self._starts)
+
+    @staticmethod
+    def _address_to_int(value: str) -> int:
+        value = value.strip()
+        return int(value) if value.isdigit() else int(ipaddress.ip_address(value))
+
+    def _load_csv(self, path: str) -> None:
+        ranges = []
+        with open(path, newline="") as f:
+            for row in csv.reader(f):
+                if len(row) < 3 or not row[2].strip() or row[2].strip() == "-":
+                    continue
+                try:
+                    ranges.append((self._address_to_int(row[0]), self._address_to_int(row[1]), row[2].strip().upper()[:2]))
+                except ValueError:
+                    continue  # header line or malformed range
+        ranges.sort()
+        self._starts = [start for start, _, _ in ranges]
+        self._ends = [end for _, end, _ in ranges]
+        self._countries = [country for _, _, country in ranges]
+
+    def _lookup(self, ip_address: str) -> Optional[str]:
+        if self._reader is not None:
+            try:
+                record = self._reader.get(ip_address)
+            except ValueError:
+                return None
+            country = (record or {}).get("country") or (record or {}).get("registered_country") or {}
+            return country.get("iso_code")
+
+        if not self._starts:
+            return None
+        try:
+            address = int(ipaddress.ip_address(ip_address))
+        except ValueError:
+            return None
+        index = bisect.bisect_right(self._starts, address) - 1
+        if index >= 0 and address <= self._ends[index]:
+            return self._countries[index]
+        return None
+
+class EventEnricher:
+    """Adds country, device_class and browser_family columns to event rows at ingest"""
+
+    def __init__(self, geoip: GeoIPDatabase):
+        self.geoip = geoip
+
+    def enrich(self, row: dict) -> dict:
+        ip_address = row.get("ip_address")
+        row["country"] = self.geoip.lookup(ip_address) if ip_address else None
+        row["device_class"], row["browser_family"] = (
+            int(value) for value in parse_user_agent(row.get("user_agent"))
+        )
+        return row
+
+    def stats(self) -> dict:
+        ua_cache = parse_user_agent.cache_info()
+        geo_cache = self.geoip.lookup.cache_info()
+        return {
+            "geoip_loaded": self.geoip.loaded,
+            "ua_cache_hits": ua_cache.hits,
+            "ua_cache_misses": ua_cache.misses,
+            "geo_cache_hits": geo_cache.hits,
+            "geo_cache_misses": geo_cache.misses
+        }
+
+event_enricher = EventEnricher(GeoIPDatabase(settings.GEOIP_DATABASE, cache_size=settings.GEOIP_CACHE_SIZE))
@@ -0,0 +1,116 @@
+import argparse
+import time
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+from sqlalchemy.orm import Session
+
+from database.models import ClickEvent, PageView
+from database.sharding import shard_router
+
+CURSOR_ID = 1
+
+class EventCursorJob:
+    """
+    Base of the jobs folding new clicks and page views into a derived table, a batch at a time.
+
+    The cursor row (cursor_model, one per database) stores the highest click and page view
+    ids processed. Each run reads the next batch of each table by id as
+    (id, *event_columns, timestamp) rows, hands them to _apply and advances the cursor in
+    the same transaction. Run a single job per database.
+    """
+
+    cursor_model = None
+    event_columns: Tuple[str, ...] = ()
+
+    def __init__(self, batch_size: int = 50000):
+        self.batch_size = batch_size
+
+    def _cursor(self, db: Session):
+        cursor = db.query(self.cursor_model).filter(self.cursor_model.id == CURSOR_ID).with_for_update().first()
+        if cursor is None:
+            cursor = self.cursor_model(id=CURSOR_ID, last_click_id=0, last_view_id=0)
+            db.add(cursor)
+            db.flush()
+        return cursor
+
+    def _fetch(self, db: Session, model, timestamp_column, after_id: int) -> List[tuple]:
+        columns = [getattr(model, name) for name in self.event_columns]
+        return db.query(model.id, *columns, timestamp_column).filter(
+            model.id > after_id
+        ).order_by(model.id).limit(self.batch_size).all()
+
+    def _take(self, clicks: List[tuple], views: List[tuple]) -> Tuple[List[tuple], List[tuple]]:
+        """Leading part of each batch to process now (the cursor stops after it); all of it by default"""
+        return clicks, views
+
+    def _apply(self, db: Session, cursor, clicks: List[tuple], views: List[tuple]) -> dict:
+        """Fold a batch into the derived table (not committed); returns the job's counters"""
+        raise NotImplementedError
+
+    def _reset(self) -> None:
+        """Drop in-memory state that may no longer match the database after a failed run"""
+
+    def run_once(self, db: Session) -> dict:
+        """Process one batch; returns counters (events == 0 means caught up)"""
+        try:
+            cursor = self._cursor(db)
+            clicks = self._fetch(db, ClickEvent, ClickEvent.clicked_at, cursor.last_click_id)
+            views = self._fetch(db, PageView, PageView.viewed_at, cursor.last_view_id)
+            clicks, views = self._take(clicks, views)
+            stats = self._apply(db, cursor, clicks, views)
+
+            if clicks:
+                cursor.last_click_id = clicks[-1][0]
+            if views:
+                cursor.last_view_id = views[-1][0]
+            cursor.updated_at = datetime.now()
+            db.commit()
+        except Exception:
+            db.rollback()
+            self._reset()
+            raise
+        return {"clicks": len(clicks), "views": len(views), **stats}
+
+    def run(self, session_factory, follow: bool = False, interval: float = 30.0, log=print) -> None:
+        """Process batches until caught up; with follow, keep polling for new events"""
+        while True:
+            db = session_factory()
+            try:
+                stats = self.run_once(db)
+            finally:
+                db.close()
+            log(stats)
+            if stats["clicks"] + stats["views"] > 0:
+                continue
+            if not follow:
+                return
+            time.sleep(interval)
+
+def run_job_cli(job: EventCursorJob, description: str, describe: Callable[[dict], str]) -> None:
+    """
+    Command line of the job scripts (sessionize.py, build_cohorts.py, build_engagement_stats.py).
+
+    Without --follow, processes all new events and exits (cron-friendly). The cursor keeps
+    the progress, so runs can be interrupted and resumed. With SHARD_DATABASE_URLS set, run
+    one job per shard (--shard NAME); each keeps its own cursor in its shard. Run
+    `python migrate.py` first to create the tables. describe turns a batch's counters into
+    a log line.
+    """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--follow", action="store_true", help="keep polling for new events")
+    parser.add_argument("--interval", type=float, default=30.0, help="seconds between polls with --follow")
+    parser.add_argument("--shard", help="shard to process (required when several are configured)")
+    args = parser.parse_args()
+    try:
+        shard = shard_router.get(args.shard)
+    except ValueError as e:
+        parser.error(str(e))
+
+    def log(stats: dict) -> None:
+        print(f"{stats['views']:,} views, {stats['clicks']:,} clicks -> {describe(stats)}", flush=True)
+
+    try:
+        job.run(shard.session, follow=args.follow, interval=args.interval, log=log)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,103 @@
+import hashlib
+import re
+import time
+from typing import Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import Response
+
+from database.sharding import shard_router
+from database.models import ClickEvent, PageView
+
+# First numeric path segment under /api/analytics/ is the profile id
+PROFILE_PATH = re.compile(r"^/api/analytics/(?:[a-z-]+/)+?(\d+)(?:/[a-z-]+)*$")
+
+# Served from in-memory state that changes without new events, so the watermark can't validate them
+UNCACHED_PREFIXES = ("/api/analytics/anomalies/",)
+
+def profile_watermark(db: Session, profile_id: int) -> Tuple[int, int]:
+    """Highest click and page view ids for a profile; changes whenever an event lands"""
+    last_click = db.query(func.max(ClickEvent.id)).filter(ClickEvent.profile_id == profile_id).scalar()
+    last_view = db.query(func.max(PageView.id)).filter(PageView.profile_id == profile_id).scalar()
+    return last_click or 0, last_view or 0
+
+def read_watermark(profile_id: int) -> Tuple[int, int]:
+    db = shard_router.session(profile_id, analytics=True)
+    try:
+        return profile_watermark(db, profile_id)
+    finally:
+        db.close()
+
+def build_etag(request: Request, watermark: Tuple[int, int], bucket: int) -> str:
+    query = "&".join(sorted(request.url.query.split("&"))) if request.url.query else ""
+    key = "|".join((
+        request.url.path,
+        query,
+        request.headers.get("accept", ""),
+        f"{watermark[0]}:{watermark[1]}",
+        str(bucket)
+    ))
+    # Weak: the same representation may be sent gzipped or not
+    return f'W/"{hashlib.sha1(key.encode()).hexdigest()[:20]}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:]
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(","))
+
+class AnalyticsETagMiddleware(BaseHTTPMiddleware):
+    """
+    Conditional GETs for per-profile analytics endpoints.
+
+    The ETag combines the path, query, Accept header, the profile's event watermark and
+    a time bucket (rolling windows still move when no new events arrive). A matching
+    If-None-Match is answered with 304 after the two watermark lookups, before the route
+    (and any AnalyticsService query) runs.
+    """
+
+    def __init__(self, app, bucket_seconds: int = 300):
+        super().__init__(app)
+        self.bucket_seconds = max(int(bucket_seconds), 1)
+
+    @staticmethod
+    def applies_to(method: str, path: str) -> bool:
+        return method == "GET" and PROFILE_PATH.match(path) is not None and not path.startswith(UNCACHED_PREFIXES)
+
+    async def __call__(self, scope, receive, send):
+        # Everything else (tracking, redirects, streams) skips BaseHTTPMiddleware's per-request overhead
+        if scope["type"] != "http" or not self.applies_to(scope["method"], scope["path"]):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+    async def dispatch(self, request: Request, call_next):
+        match = PROFILE_PATH.match(request.url.path)
+
+        try:
+            watermark = await run_in_threadpool(read_watermark, int(match.group(1)))
+        except Exception:
+            # Caching is best effort; let the route report database problems
+            return await call_next(request)
+
+        etag = build_etag(request, watermark, int(time.time() // self.bucket_seconds))
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers={**headers, "Vary": "Accept"})
+
+        response = await call_next(request)
+        if response.status_code == 200:
+            response.headers.update(headers)
+            vary = response.headers.get("vary")
+            if not vary:
+                response.headers["Vary"] = "Accept"
+            elif "accept" not in [v.strip().lower() for v in vary.split(",")]:
+                response.headers["Vary"] = f"{vary}, Accept"
+        return response
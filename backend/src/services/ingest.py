@@ -0,0 +1,159 @@
+import ipaddress
+import json
+import zlib
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import List, NamedTuple, Optional
+
+MAX_USER_AGENT_LENGTH = 1000
+MAX_REFERRER_LENGTH = 1000
+
+# Client-side timestamps further in the future than this are rejected
+MAX_CLOCK_SKEW = timedelta(minutes=5)
+
+# Decompressed size limit of a batch body (about 4 KB per event at the default batch size)
+MAX_BATCH_BYTES = 4 * 1024 * 1024
+
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+class PayloadTooLarge(ValueError):
+    """Batch body over the size limit once decompressed"""
+
+class ClickRecord(NamedTuple):
+    """Validated click event, column-ordered for bulk insert into click_events"""
+    link_id: int
+    profile_id: int
+    ip_address: Optional[str]
+    user_agent: Optional[str]
+    referrer: Optional[str]
+
+class PageViewRecord(NamedTuple):
+    """Validated page view, column-ordered for bulk insert into page_views"""
+    profile_id: int
+    ip_address: Optional[str]
+    user_agent: Optional[str]
+    referrer: Optional[str]
+
+@lru_cache(maxsize=65536)
+def _is_valid_ip(value: str) -> bool:
+    # Visitor IPs repeat heavily, so parse each distinct address only once
+    try:
+        ipaddress.ip_address(value)
+        return True
+    except ValueError:
+        return False
+
+def _as_int(value, field: str) -> int:
+    if type(value) is int:
+        return value
+    if isinstance(value, str) and value.strip().lstrip("+-").isdigit():
+        return int(value)
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    raise ValueError(f"{field} must be an integer")
+
+def _as_optional_str(value, field: str) -> Optional[str]:
+    if value is None or type(value) is str:
+        return value
+    raise ValueError(f"{field} must be a string")
+
+def _validate_ip_address(value) -> Optional[str]:
+    value = _as_optional_str(value, "ip_address")
+    if value is not None and not _is_valid_ip(value):
+        raise ValueError('Invalid IP address format')
+    return value
+
+def validate_click(link_id, profile_id, ip_address=None, user_agent=None,
+                   referrer=None) -> ClickRecord:
+    """Fast equivalent of ClickEventCreate(...) without building a Pydantic model"""
+    user_agent = _as_optional_str(user_agent, "user_agent")
+    referrer = _as_optional_str(referrer, "referrer")
+    return ClickRecord(
+        _as_int(link_id, "link_id"),
+        _as_int(profile_id, "profile_id"),
+        _validate_ip_address(ip_address),
+        user_agent[:MAX_USER_AGENT_LENGTH] if user_agent is not None else None,
+        referrer[:MAX_REFERRER_LENGTH] if referrer is not None else None
+    )
+
+def validate_page_view(profile_id, ip_address=None, user_agent=None,
+                       referrer=None) -> PageViewRecord:
+    """Fast equivalent of PageViewCreate(...) without building a Pydantic model"""
+    return PageViewRecord(
+        _as_int(profile_id, "profile_id"),
+        _validate_ip_address(ip_address),
+        _as_optional_str(user_agent, "user_agent"),
+        _as_optional_str(referrer, "referrer")
+    )
+
+def parse_client_timestamp(value, max_age: Optional[timedelta] = None) -> Optional[datetime]:
+    """
+    Parse an event timestamp (ISO 8601 or epoch seconds) into a local naive datetime.
+    Timestamps more than MAX_CLOCK_SKEW ahead, or older than max_age, are rejected.
+    """
+    if value is None:
+        return None
+    if not isinstance(value, (int, float, str)) or isinstance(value, bool):
+        raise ValueError("timestamp must be an ISO 8601 string or epoch seconds")
+    try:
+        if isinstance(value, str):
+            timestamp = datetime.fromisoformat(value.replace("Z", "+00:00"))
+            if timestamp.tzinfo is not None:
+                timestamp = timestamp.astimezone().replace(tzinfo=None)
+        else:
+            timestamp = datetime.fromtimestamp(value)
+    except (OverflowError, OSError, ValueError):
+        # Out of range epochs raise OverflowError/OSError (nan a ValueError), not just bad strings
+        raise ValueError(f"Invalid timestamp: {str(value)[:64]}")
+
+    now = datetime.now()
+    if timestamp > now + MAX_CLOCK_SKEW:
+        raise ValueError("timestamp is in the future")
+    if max_age is not None and timestamp < now - max_age:
+        raise ValueError("timestamp is too old")
+    return timestamp
+
+def _gunzip(body: bytes, max_bytes: int) -> bytes:
+    """Decompress (possibly multi-member) gzip without ever inflating past max_bytes"""
+    chunks = []
+    size = 0
+    while body:
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            chunk = decompressor.decompress(body, max_bytes - size + 1)
+        except zlib.error:
+            raise ValueError("Invalid gzip payload")
+        size += len(chunk)
+        if size > max_bytes or decompressor.unconsumed_tail:
+            raise PayloadTooLarge(f"Decompressed payload over {max_bytes} bytes")
+        if not decompressor.eof:
+            raise ValueError("Invalid gzip payload")
+        chunks.append(chunk)
+        body = decompressor.unused_data.lstrip(b"\x00")
+    return b"".join(chunks)
+
+def parse_batch_payload(body: bytes, content_type: Optional[str] = None,
+                        content_encoding: Optional[str] = None,
+                        max_bytes: int = MAX_BATCH_BYTES) -> List[dict]:
+    """
+    Decode a batch body (JSON array, {"events": [...]} or NDJSON, optionally gzipped).
+    Raises PayloadTooLarge when the (decompressed) body exceeds max_bytes.
+    """
+    if (content_encoding or "").lower() == "gzip" or body[:2] == b"\x1f\x8b":
+        body = _gunzip(body, max_bytes)
+    elif len(body) > max_bytes:
+        raise PayloadTooLarge(f"Payload over {max_bytes} bytes")
+
+    try:
+        if (content_type or "").split(";")[0].strip().lower() in NDJSON_CONTENT_TYPES:
+            events = [json.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            events = json.loads(body)
+    except ValueError:
+        raise ValueError("Invalid JSON payload")
+
+    if isinstance(events, dict):
+        events = events.get("events")
+    if not isinstance(events, list):
+        raise ValueError("Payload must be a JSON array of events or NDJSON")
+    return events
@@ -0,0 +1,152 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Hashable, Optional, Set
+
+from config import settings
+
+# Compiled once at import; matches crawlers, link unfurlers, monitors and HTTP libraries.
+# Applied to the lowercased user agent, which is much faster than re.IGNORECASE here.
+BOT_USER_AGENT_PATTERN = re.compile(
+    r"bot|crawl|spider|slurp|scrape|fetch|preview|monitor|lighthouse|headless"
+    r"|facebookexternalhit|embedly|quora link|whatsapp|vkshare|w3c_validator"
+    r"|curl|wget|python-requests|python-urllib|aiohttp|httpx|okhttp|go-http-client"
+    r"|java/|libwww|apache-httpclient|postman"
+)
+
+FILTER_REASON_BOT = "bot"
+FILTER_REASON_DUPLICATE = "duplicate"
+
+class BotMatcher:
+    """User agent classifier backed by a single precompiled regex"""
+
+    def __init__(self, pattern: re.Pattern = BOT_USER_AGENT_PATTERN, cache_size: int = 4096):
+        self._search = pattern.search
+        # User agent strings repeat heavily, so remember recent verdicts
+        self._classify = lru_cache(maxsize=cache_size)(self._match)
+
+    def _match(self, user_agent: str) -> bool:
+        return self._search(user_agent.lower()) is not None
+
+    def is_bot(self, user_agent: Optional[str]) -> bool:
+        if not user_agent:
+            return False
+        return self._classify(user_agent)
+
+class DuplicateWindow:
+    """Bounded set of recently seen keys that expire after window_seconds"""
+
+    def __init__(self, window_seconds: float, max_entries: int):
+        self.window_seconds = window_seconds
+        self.max_entries = max_entries
+        self._seen: "OrderedDict[Hashable, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float) -> None:
+        # Keys are kept in insertion (= time) order, so expired ones sit at the front
+        cutoff = now - self.window_seconds
+        seen = self._seen
+        while seen:
+            oldest_key = next(iter(seen))
+            if seen[oldest_key] > cutoff:
+                break
+            del seen[oldest_key]
+
+    def seen_recently(self, key: Hashable, now: Optional[float] = None) -> bool:
+        """Return True if key was recorded inside the window (does not record it)"""
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            return key in self._seen
+
+    def record(self, key: Hashable, now: Optional[float] = None) -> None:
+        """Start (or restart) the window for key"""
+        if now is None:
+            now = time.monotonic()
+        seen = self._seen
+        with self._lock:
+            self._expire(now)
+            seen.pop(key, None)
+            seen[key] = now
+            if len(seen) > self.max_entries:
+                seen.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+class IngestFilter:
+    """
+    Drops bot traffic and rapid repeat clicks before they reach the database.
+
+    check_click only looks for a repeat; callers record_click once the click is accepted
+    (inserted or spooled), so a retry after a failed request isn't taken for a repeat.
+    """
+
+    def __init__(self, enabled: bool = True, dedup_window_seconds: float = 10.0,
+                 dedup_max_entries: int = 100000):
+        self.enabled = enabled
+        self.bots = BotMatcher()
+        self.duplicates = DuplicateWindow(dedup_window_seconds, dedup_max_entries)
+        self.counters: Dict[str, int] = {
+            "accepted": 0,
+            FILTER_REASON_BOT: 0,
+            FILTER_REASON_DUPLICATE: 0
+        }
+
+    def check_click(self, link_id: int, ip_address: Optional[str], user_agent: Optional[str],
+                    pending: Optional[Set[tuple]] = None) -> Optional[str]:
+        """
+        Return the reason a click should be dropped, or None to keep it. `pending` holds the
+        (ip_address, link_id) keys of clicks kept earlier in the same batch, not yet recorded.
+        """
+        if not self.enabled:
+            return None
+
+        if self.bots.is_bot(user_agent):
+            self.counters[FILTER_REASON_BOT] += 1
+            return FILTER_REASON_BOT
+
+        if ip_address:
+            key = (ip_address, link_id)
+            if (pending is not None and key in pending) or self.duplicates.seen_recently(key):
+                self.counters[FILTER_REASON_DUPLICATE] += 1
+                return FILTER_REASON_DUPLICATE
+            if pending is not None:
+                pending.add(key)
+
+        self.counters["accepted"] += 1
+        return None
+
+    def record_click(self, link_id: int, ip_address: Optional[str]) -> None:
+        """Start the duplicate window for an accepted click"""
+        if self.enabled and ip_address:
+            self.duplicates.record((ip_address, link_id))
+
+    def check_view(self, user_agent: Optional[str]) -> Optional[str]:
+        """Return the reason a page view should be dropped, or None to keep it"""
+        if not self.enabled:
+            return None
+
+        if self.bots.is_bot(user_agent):
+            self.counters[FILTER_REASON_BOT] += 1
+            return FILTER_REASON_BOT
+
+        self.counters["accepted"] += 1
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "dedup_window_seconds": self.duplicates.window_seconds,
+            "dedup_entries": len(self.duplicates),
+            **self.counters
+        }
+
+ingest_filter = IngestFilter(
+    enabled=settings.INGEST_FILTER_ENABLED,
+    dedup_window_seconds=settings.DEDUP_WINDOW_SECONDS,
+    dedup_max_entries=settings.DEDUP_MAX_ENTRIES
+)
@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+from typing import Sequence, Tuple
+
+import numpy as np
+
+def position_decay(link_clicks: np.ndarray) -> dict:
+    """
+    Click share by position rank (links already ordered by position).
+
+    decay_rate is the average fraction of clicks lost per step down the list, from a
+    log-linear fit over positions that received clicks.
+    """
+    total = link_clicks.sum()
+    share = link_clicks / total if total > 0 else np.zeros(len(link_clicks))
+    top = link_clicks[0] if len(link_clicks) else 0
+    relative = link_clicks / top if top > 0 else np.zeros(len(link_clicks))
+
+    decay_rate = None
+    ranks = np.flatnonzero(link_clicks > 0)
+    if len(ranks) >= 2:
+        slope, _ = np.polyfit(ranks, np.log(link_clicks[ranks]), 1)
+        decay_rate = round(float(1 - np.exp(slope)), 4)
+
+    return {
+        "click_share": np.round(share * 100, 2).tolist(),
+        "relative_to_top": np.round(relative, 4).tolist(),
+        "decay_rate": decay_rate
+    }
+
+def ctr_trend(ctr: np.ndarray) -> np.ndarray:
+    """Least-squares slope of each row's daily CTR, in percentage points per day"""
+    days = ctr.shape[1]
+    if days < 2:
+        return np.zeros(ctr.shape[0])
+    t = np.arange(days, dtype=np.float64)
+    t -= t.mean()
+    return (ctr - ctr.mean(axis=1, keepdims=True)) @ t / (t @ t)
+
+def build_link_matrix(links: Sequence, click_rows: Sequence[Tuple[int, datetime, int]],
+                      view_rows: Sequence[Tuple[datetime, int]], start_date: datetime,
+                      end_date: datetime) -> dict:
+    """
+    Assemble the links x days clicks/CTR matrices from grouped rows.
+
+    links: (id, title, position) ordered by position
+    click_rows: (link_id, day, clicks) grouped by link and day
+    view_rows: (day, views) grouped by day
+    """
+    first_day = start_date.date()
+    day_count = (end_date.date() - first_day).days + 1
+    days = [first_day + timedelta(days=i) for i in range(day_count)]
+
+    row_of = {link[0]: i for i, link in enumerate(links)}
+    clicks = np.zeros((len(links), day_count), dtype=np.int64)
+    if click_rows:
+        link_ids, click_days, counts = zip(*click_rows)
+        rows = np.fromiter((row_of.get(link_id, -1) for link_id in link_ids), dtype=np.int64, count=len(link_ids))
+        cols = np.fromiter(((day.date() - first_day).days for day in click_days), dtype=np.int64, count=len(click_days))
+        known = rows >= 0  # clicks on links deleted since
+        np.add.at(clicks, (rows[known], cols[known]), np.asarray(counts, dtype=np.int64)[known])
+
+    views = np.zeros(day_count, dtype=np.int64)
+    for day, count in view_rows:
+        views[(day.date() - first_day).days] += count
+
+    # Page views are per profile, so each link's daily CTR is its clicks over that day's views
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ctr = np.where(views > 0, clicks / views * 100, 0.0)
+
+    link_clicks = clicks.sum(axis=1)
+    total_views = int(views.sum())
+    link_ctr = link_clicks / total_views * 100 if total_views else np.zeros(len(links))
+
+    return {
+        "period": {
+            "start": start_date.isoformat(),
+            "end": end_date.isoformat()
+        },
+        "days": [day.isoformat() for day in days],
+        "links": [
+            {"link_id": link_id, "title": title, "position": position}
+            for link_id, title, position in links
+        ],
+        "views": views.tolist(),
+        "clicks": clicks.tolist(),
+        "ctr": np.round(ctr, 2).tolist(),
+        "totals": {
+            "clicks": link_clicks.tolist(),
+            "ctr": np.round(link_ctr, 2).tolist(),
+            "ctr_trend": np.round(ctr_trend(ctr), 4).tolist()
+        },
+        "position_decay": position_decay(link_clicks)
+    }
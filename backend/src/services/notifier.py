@@ -0,0 +1,205 @@
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Set, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from config import settings
+from database.sharding import shard_router
+from services.analytics import AnalyticsService, compare_metrics
+from services.http_cache import profile_watermark, read_watermark
+from services.time_series import to_columnar
+from services.window_cache import window_aggregator
+
+class ProfileHub:
+    """
+    Push channel for live dashboards, shared by every subscriber of a profile.
+
+    Ingestion calls notify(profile_id), which only marks the profile dirty. A single loop
+    wakes every coalesce_interval, recomputes each dirty profile that has subscribers once,
+    and fans out only the parts of the snapshot that changed. Events written by other
+    workers are picked up by a per-profile watermark sweep every watermark_interval.
+    """
+
+    def __init__(self, coalesce_interval: float = 1.0, watermark_interval: float = 5.0,
+                 window_days: int = 7, queue_size: int = 16):
+        self.coalesce_interval = coalesce_interval
+        self.watermark_interval = watermark_interval
+        self.window_days = window_days
+        self.queue_size = queue_size
+
+        self.snapshots_computed = 0
+        self.messages_sent = 0
+
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = {}
+        self._snapshots: Dict[int, dict] = {}
+        self._watermarks: Dict[int, Tuple[int, int]] = {}
+        self._dirty: Set[int] = set()
+        self._lock = threading.Lock()  # notify() is also called from worker threads
+        self._task: Optional[asyncio.Task] = None
+
+    # Ingestion side
+
+    def notify(self, profile_id: int) -> None:
+        """Record that a profile received events; cheap and safe from any thread"""
+        if profile_id in self._subscribers:
+            with self._lock:
+                self._dirty.add(profile_id)
+
+    # Subscriber side
+
+    def subscribe(self, profile_id: int) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(profile_id, set()).add(queue)
+        snapshot = self._snapshots.get(profile_id)
+        if snapshot is not None:
+            queue.put_nowait(self._message("snapshot", profile_id, snapshot))
+        else:
+            with self._lock:
+                self._dirty.add(profile_id)
+        return queue
+
+    def unsubscribe(self, profile_id: int, queue: asyncio.Queue) -> None:
+        queues = self._subscribers.get(profile_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            # Nobody is watching: stop tracking the profile entirely
+            del self._subscribers[profile_id]
+            self._snapshots.pop(profile_id, None)
+            self._watermarks.pop(profile_id, None)
+
+    # Computation
+
+    def compute_snapshot(self, profile_id: int) -> Tuple[dict, Tuple[int, int]]:
+        """Everything a dashboard shows live, computed once per change for all subscribers"""
+        db = shard_router.session(profile_id, analytics=True)
+        try:
+            # Read the watermark first so events landing mid-computation trigger another pass
+            watermark = profile_watermark(db, profile_id)
+            end_date = datetime.now()
+            current_start = end_date - timedelta(days=self.window_days)
+            previous_start = current_start - timedelta(days=self.window_days)
+
+            current = window_aggregator.metrics(db, profile_id, current_start, end_date)
+            previous = window_aggregator.metrics(db, profile_id, previous_start, current_start)
+            columns, meta = AnalyticsService(db).get_time_series(profile_id, granularity='daily')
+        finally:
+            db.close()
+
+        snapshot = {
+            "summary": {
+                "total_clicks": current.total_clicks,
+                "total_views": current.total_views,
+                "click_through_rate": current.click_through_rate,
+                "unique_visitors": current.unique_views
+            },
+            "changes": compare_metrics(current, previous),
+            "time": to_columnar(columns, **meta)
+        }
+        return snapshot, watermark
+
+    @staticmethod
+    def _message(kind: str, profile_id: int, payload: dict) -> dict:
+        return {"type": kind, "profile_id": profile_id, "timestamp": datetime.now().isoformat(), **payload}
+
+    def _publish(self, profile_id: int, snapshot: dict) -> None:
+        queues = self._subscribers.get(profile_id)
+        if not queues:
+            return
+        previous = self._snapshots.get(profile_id)
+        self._snapshots[profile_id] = snapshot
+
+        if previous is None:
+            message = self._message("snapshot", profile_id, snapshot)
+        else:
+            changed = {key: value for key, value in snapshot.items() if previous.get(key) != value}
+            if not changed:
+                return
+            message = self._message("delta", profile_id, changed)
+
+        for queue in queues:
+            if queue.full():
+                # Slow consumer: replace its backlog with one full snapshot
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(self._message("snapshot", profile_id, snapshot))
+            else:
+                queue.put_nowait(message)
+            self.messages_sent += 1
+
+    def broadcast(self, profile_id: int, kind: str, payload: dict) -> None:
+        """Send a one-off event (e.g. an anomaly alert) to a profile's subscribers; call from the event loop"""
+        message = self._message(kind, profile_id, payload)
+        for queue in self._subscribers.get(profile_id, ()):
+            # A full queue is about to be replaced by a snapshot; the alert is also on the REST endpoint
+            if not queue.full():
+                queue.put_nowait(message)
+                self.messages_sent += 1
+
+    async def _sweep_watermarks(self) -> None:
+        for profile_id in list(self._subscribers):
+            try:
+                watermark = await run_in_threadpool(read_watermark, profile_id)
+            except Exception:
+                continue
+            if watermark != self._watermarks.get(profile_id):
+                with self._lock:
+                    self._dirty.add(profile_id)
+
+    async def run(self) -> None:
+        last_sweep = time.monotonic()
+        while True:
+            await asyncio.sleep(self.coalesce_interval)
+            if not self._subscribers:
+                continue
+
+            if time.monotonic() - last_sweep >= self.watermark_interval:
+                last_sweep = time.monotonic()
+                await self._sweep_watermarks()
+
+            with self._lock:
+                dirty, self._dirty = self._dirty, set()
+
+            for profile_id in dirty:
+                if profile_id not in self._subscribers:
+                    continue
+                try:
+                    snapshot, watermark = await run_in_threadpool(self.compute_snapshot, profile_id)
+                except Exception:
+                    # Leave the profile for the next sweep; the database may be degraded
+                    continue
+                self.snapshots_computed += 1
+                self._watermarks[profile_id] = watermark
+                self._publish(profile_id, snapshot)
+
+    # Lifecycle
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "profiles": len(self._subscribers),
+            "subscribers": sum(len(queues) for queues in self._subscribers.values()),
+            "snapshots_computed": self.snapshots_computed,
+            "messages_sent": self.messages_sent
+        }
+
+profile_hub = ProfileHub(
+    coalesce_interval=settings.REALTIME_COALESCE_MS / 1000,
+    watermark_interval=settings.REALTIME_WATERMARK_INTERVAL
+)
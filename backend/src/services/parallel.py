@@ -0,0 +1,65 @@
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Sequence, TypeVar
+
+from sqlalchemy.orm import Session
+
+from config import settings
+
+T = TypeVar("T")
+
+# Shared by all requests, so total extra connections stay bounded as well
+_query_executor = ThreadPoolExecutor(
+    max_workers=settings.ANALYTICS_QUERY_THREADS,
+    thread_name_prefix="analytics-query"
+)
+
+def run_queries(db: Session, tasks: Sequence[Callable[[Session], T]],
+                max_parallel: Optional[int] = None) -> List[T]:
+    """
+    Run independent read-only tasks concurrently and return their results in order.
+
+    Each task receives a Session. Up to max_parallel workers (per call) each open their own
+    session on db's engine (so a request pinned to a replica stays on it, with the same
+    statement timeout) and pull tasks until none are left. With one task or
+    max_parallel <= 1 everything runs sequentially on db.
+    """
+    if max_parallel is None:
+        max_parallel = settings.ANALYTICS_MAX_PARALLEL_QUERIES
+    if max_parallel <= 1 or len(tasks) <= 1:
+        return [task(db) for task in tasks]
+
+    bind = db.get_bind()
+    info = dict(db.info)
+    results: List = [None] * len(tasks)
+    pending = iter(enumerate(tasks))
+    lock = threading.Lock()
+    failed = threading.Event()
+
+    def worker() -> None:
+        session = Session(bind=bind, autoflush=False)
+        session.info.update(info)
+        try:
+            while not failed.is_set():
+                with lock:
+                    item = next(pending, None)
+                if item is None:
+                    return
+                index, task = item
+                try:
+                    results[index] = task(session)
+                except Exception:
+                    failed.set()
+                    raise
+        finally:
+            session.close()
+
+    # Each worker runs in a copy of the caller's context (request-scoped state such as the SQL log)
+    futures = [
+        _query_executor.submit(contextvars.copy_context().run, worker)
+        for _ in range(min(max_parallel, len(tasks)))
+    ]
+    for future in futures:
+        future.result()
+    return results
@@ -0,0 +1,305 @@
+import contextvars
+import cProfile
+import io
+import itertools
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from functools import lru_cache
+from typing import Deque, Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config import settings
+
+SOURCE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Leaf frames of threads that are only waiting (dropped from samples unless idle=True)
+IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),
+    ("queue.py", "get"),
+    ("base_events.py", "_run_once"),
+}
+
+@lru_cache(maxsize=4096)
+def short_path(filename: str) -> str:
+    """Source path relative to the app, site-packages or the standard library"""
+    if filename.startswith(SOURCE_ROOT):
+        return os.path.relpath(filename, SOURCE_ROOT)
+    marker = filename.rfind("site-packages" + os.sep)
+    if marker >= 0:
+        return filename[marker + len("site-packages") + 1:]
+    return os.path.basename(filename)
+
+def frame_label(code) -> str:
+    return f"{code.co_name} ({short_path(code.co_filename)}:{code.co_firstlineno})"
+
+class StackSampler:
+    """
+    Wall-clock sampling profiler for the whole worker process.
+
+    Every `interval` a background thread reads the current stack of every other thread
+    (sys._current_frames) and counts identical stacks, so nothing is instrumented and the
+    sampled code runs at full speed. Results are collapsed stacks (root first, frames
+    separated by ';', then the sample count) as read by flamegraph.pl, speedscope and
+    inferno. One run at a time per worker.
+    """
+
+    def __init__(self, max_seconds: float = 60.0):
+        self.max_seconds = max_seconds
+        self._lock = threading.Lock()
+        self.runs = 0
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def sample(self, seconds: float, interval: float = 0.01, idle: bool = False) -> Tuple[Counter, int]:
+        """Sample for `seconds`; returns (collapsed stack -> samples, number of sampling passes)"""
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("a sampling run is already in progress in this worker")
+        try:
+            me = threading.get_ident()
+            stacks: Counter = Counter()
+            passes = 0
+            deadline = time.monotonic() + min(seconds, self.max_seconds)
+            while time.monotonic() < deadline:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == me:
+                        continue
+                    code = frame.f_code
+                    if not idle and (os.path.basename(code.co_filename), code.co_name) in IDLE_LEAVES:
+                        continue
+                    labels = []
+                    while frame is not None:
+                        labels.append(frame_label(frame.f_code))
+                        frame = frame.f_back
+                    labels.append(names.get(ident, f"thread-{ident}"))
+                    stacks[";".join(reversed(labels))] += 1
+                passes += 1
+                time.sleep(interval)
+            self.runs += 1
+            return stacks, passes
+        finally:
+            self._lock.release()
+
+def collapsed(stacks: Counter) -> str:
+    return "".join(f"{stack} {samples}\n" for stack, samples in stacks.most_common())
+
+class QueryLog:
+    """SQL statements executed on behalf of one request (bounded)"""
+
+    __slots__ = ("max_queries", "queries", "count", "total_ms")
+
+    def __init__(self, max_queries: int = 200):
+        self.max_queries = max_queries
+        self.queries: List[Tuple[str, float, bool]] = []  # (statement, milliseconds, executemany)
+        self.count = 0
+        self.total_ms = 0.0
+
+    def add(self, statement: str, elapsed_ms: float, executemany: bool) -> None:
+        # Appends from several threads (parallel analytics queries) are safe under the GIL
+        self.count += 1
+        self.total_ms += elapsed_ms
+        if len(self.queries) < self.max_queries:
+            self.queries.append((statement[:2000], round(elapsed_ms, 3), executemany))
+
+# Set by SlowRequestMiddleware; copied into threadpool and query worker threads with the context
+current_queries: contextvars.ContextVar = contextvars.ContextVar("current_queries", default=None)
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    if current_queries.get() is not None:
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _record_query(conn, cursor, statement, parameters, context, executemany):
+    log = current_queries.get()
+    started = conn.info.get("query_started")
+    if log is None or not started:
+        return
+    log.add(statement, (time.perf_counter() - started.pop()) * 1000, executemany)
+
+@event.listens_for(Engine, "handle_error")
+def _drop_query_timer(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_started"):
+        connection.info["query_started"].pop()
+
+class SlowRequest(NamedTuple):
+    id: int
+    started_at: datetime
+    method: str
+    path: str
+    query: str
+    route: str
+    status: int
+    duration_ms: float
+    sql_count: int
+    sql_ms: float
+    queries: List[Tuple[str, float, bool]]
+    profile: Optional[str]  # cProfile report (cumulative time), when the request was profiled
+
+# Numeric path segments (profile and link ids) collapse into one route key
+ID_SEGMENT = re.compile(r"/\d+(?=/|$)")
+
+def route_key(method: str, path: str) -> str:
+    return f"{method} {ID_SEGMENT.sub('/{id}', path)}"
+
+class SlowRequestRecorder:
+    """
+    Keeps the most recent requests slower than `threshold` in a ring buffer.
+
+    Every request records its SQL statements (a timer per statement); the list is kept
+    only when the request turns out slow. cProfile is too expensive to run on every
+    request, so it runs on a `profile_rate` fraction of them and, once a route has been
+    slow, on its next `arm_count` requests, which catches a regression on its second
+    occurrence. cProfile follows the event loop thread, so coroutines of other requests
+    interleaving at await points show up in a profile too; one request is profiled at a
+    time. Memory is bounded by buffer_size captures of at most max_queries statements
+    and profile_lines report lines each.
+    """
+
+    def __init__(self, threshold: float = 2.0, buffer_size: int = 50, profile_rate: float = 0.0,
+                 arm_count: int = 5, max_queries: int = 200, profile_lines: int = 40):
+        self.threshold = threshold
+        self.profile_rate = profile_rate
+        self.arm_count = arm_count
+        self.max_queries = max_queries
+        self.profile_lines = profile_lines
+
+        self.captures: Deque[SlowRequest] = deque(maxlen=buffer_size)
+        self._armed: Dict[str, int] = {}
+        self._profiling = False
+        self._ids = itertools.count(1)
+
+        self.requests = 0
+        self.slow_requests = 0
+        self.profiled = 0
+
+    def start_profile(self, key: str) -> Optional[cProfile.Profile]:
+        """An enabled profiler if this request should be profiled, else None"""
+        if self._profiling:
+            return None
+        armed = self._armed.get(key, 0)
+        if armed:
+            if armed == 1:
+                del self._armed[key]
+            else:
+                self._armed[key] = armed - 1
+        elif not (self.profile_rate and random.random() < self.profile_rate):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler (a debugger, or a sampling tool using the same hook) is active
+            return None
+        self._profiling = True
+        self.profiled += 1
+        return profiler
+
+    def stop_profile(self, profiler: cProfile.Profile) -> None:
+        profiler.disable()
+        self._profiling = False
+
+    def _report(self, profiler: cProfile.Profile) -> str:
+        stream = io.StringIO()
+        stats = pstats.Stats(profiler, stream=stream)
+        stats.sort_stats("cumulative").print_stats(self.profile_lines)
+        return stream.getvalue().strip()
+
+    def finish(self, scope, key: str, status: int, duration: float, log: QueryLog,
+               profiler: Optional[cProfile.Profile]) -> None:
+        self.requests += 1
+        if duration < self.threshold:
+            return
+        self.slow_requests += 1
+        if self.arm_count:
+            self._armed[key] = self.arm_count
+        self.captures.append(SlowRequest(
+            id=next(self._ids),
+            started_at=datetime.fromtimestamp(time.time() - duration),
+            method=scope["method"],
+            path=scope["path"],
+            query=scope.get("query_string", b"").decode("latin-1"),
+            route=key,
+            status=status,
+            duration_ms=round(duration * 1000, 1),
+            sql_count=log.count,
+            sql_ms=round(log.total_ms, 1),
+            queries=log.queries,
+            profile=self._report(profiler) if profiler is not None else None
+        ))
+
+    def recent(self, limit: int = 50) -> List[SlowRequest]:
+        return list(self.captures)[::-1][:limit]
+
+    def get(self, capture_id: int) -> Optional[SlowRequest]:
+        return next((capture for capture in self.captures if capture.id == capture_id), None)
+
+    def stats(self) -> dict:
+        return {
+            "threshold_ms": round(self.threshold * 1000),
+            "requests": self.requests,
+            "slow_requests": self.slow_requests,
+            "profiled": self.profiled,
+            "captured": len(self.captures),
+            "armed_routes": len(self._armed)
+        }
+
+# Long-lived streams and the sampling endpoint itself are slow by design
+UNRECORDED_PREFIXES = ("/api/realtime/", "/api/admin/profiling/")
+
+class SlowRequestMiddleware:
+    """Times /api/ requests and hands slow ones (with their SQL and any profile) to the recorder"""
+
+    def __init__(self, app, recorder: SlowRequestRecorder):
+        self.app = app
+        self.recorder = recorder
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if scope["type"] != "http" or not path.startswith("/api/") or path.startswith(UNRECORDED_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+
+        key = route_key(scope["method"], path)
+        log = QueryLog(self.recorder.max_queries)
+        token = current_queries.set(log)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        profiler = self.recorder.start_profile(key)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - started
+            if profiler is not None:
+                self.recorder.stop_profile(profiler)
+            current_queries.reset(token)
+            self.recorder.finish(scope, key, status["code"], duration, log, profiler)
+
+stack_sampler = StackSampler(max_seconds=settings.PROFILE_MAX_SECONDS)
+slow_requests = SlowRequestRecorder(
+    threshold=settings.SLOW_REQUEST_THRESHOLD_MS / 1000,
+    buffer_size=settings.SLOW_REQUEST_BUFFER_SIZE,
+    profile_rate=settings.SLOW_REQUEST_PROFILE_RATE,
+    arm_count=settings.SLOW_REQUEST_ARM_COUNT
+)
@@ -0,0 +1,330 @@
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from config import settings
+from database.models import ClickEvent, Link, LinkProfile
+from database.sharding import shard_router
+from services.anomaly import anomaly_detector
+from services.enrichment import event_enricher
+from services.ingest import validate_click
+from services.ingest_filter import ingest_filter
+from services.notifier import profile_hub
+from services.referrers import referrer_tracker
+from services.spool import event_spool
+
+# link_id -> (target url, profile_id)
+Route = Tuple[str, int]
+# (shard name, url, profile_id, username) of one shard's row for a link
+LinkCopy = Tuple[str, str, int, str]
+
+class LinkRoutingTable:
+    """
+    In-memory link_id -> target URL map behind the /r/ redirects.
+
+    The whole table is reloaded in the background every refresh_interval and swapped in
+    atomically, so lookups never take a lock or touch the database. Links created since the
+    last reload are resolved with one query on first use and cached; unknown ids are
+    remembered (bounded) until the next reload so scanners can't hammer the database.
+    Changed or deleted links (e.g. by rebalance.py, in another process) keep their old
+    route for up to refresh_interval.
+
+    Shards allocate link ids from disjoint ranges (see migrate.py), but rows created before
+    that may share ids. An id held by different profiles (by id or username) on several
+    shards is never routed (it is listed in conflicts instead); the same link on two shards
+    is a profile in the middle of a move and routes to the copy on the profile's shard.
+    """
+
+    def __init__(self, refresh_interval: float = 30.0, max_missing: int = 10000):
+        self.refresh_interval = refresh_interval
+        self.max_missing = max_missing
+
+        self._routes: Dict[int, Route] = {}
+        self._missing: Set[int] = set()
+        self.conflicts: Set[int] = set()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.loaded_at: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+        self.cold_lookups = 0
+
+    def resolve(self, link_id: int) -> Optional[Route]:
+        """Hot path: a single dict lookup"""
+        return self._routes.get(link_id)
+
+    def lookup(self, link_id: int) -> Optional[Route]:
+        """Cold path for ids not in the table (blocking; run in a threadpool)"""
+        if link_id in self._missing or link_id in self.conflicts:
+            return None
+        self.cold_lookups += 1
+        # The link id doesn't say which shard holds it: ask all of them
+        found = {name: row for name, row in shard_router.scatter(
+            lambda db: self._links(db).filter(Link.id == link_id).first(),
+            analytics=False
+        ).items() if row is not None}
+        if not found:
+            if len(self._missing) >= self.max_missing:
+                self._missing.clear()
+            self._missing.add(link_id)
+            return None
+        route = self._pick(link_id, [(name, row.url, row.profile_id, row.username) for name, row in found.items()])
+        if route is not None:
+            self._routes[link_id] = route
+        return route
+
+    @staticmethod
+    def _links(db):
+        return db.query(Link.id, Link.url, Link.profile_id, LinkProfile.username).join(
+            LinkProfile, LinkProfile.id == Link.profile_id
+        )
+
+    def _pick(self, link_id: int, copies: List[LinkCopy]) -> Optional[Route]:
+        """Route for a link from its copies on several shards; None (and a conflict) unless they share a profile"""
+        if len({(profile_id, username) for _, _, profile_id, username in copies}) > 1:
+            self.conflicts.add(link_id)
+            return None
+        home = shard_router.shard_for(copies[0][2]).name
+        _, url, profile_id, _ = next((copy for copy in copies if copy[0] == home), copies[0])
+        return url, profile_id
+
+    def load(self) -> int:
+        """Replace the table with a fresh snapshot of all links (from every shard); returns the number of routes"""
+        routes = {}
+        first_copy: Dict[int, LinkCopy] = {}
+        duplicated: Dict[int, List[LinkCopy]] = {}
+        results = shard_router.scatter(lambda db: self._links(db).all(), analytics=False)
+        for name, rows in results.items():
+            for link_id, url, profile_id, username in rows:
+                if link_id not in routes:
+                    routes[link_id] = (url, profile_id)
+                    first_copy[link_id] = (name, url, profile_id, username)
+                    continue
+                # Rare: a profile in the middle of a move, or colliding ids
+                duplicated.setdefault(link_id, [first_copy[link_id]]).append((name, url, profile_id, username))
+
+        self.conflicts = set()
+        for link_id, copies in duplicated.items():
+            route = self._pick(link_id, copies)
+            if route is None:
+                del routes[link_id]
+            else:
+                routes[link_id] = route
+        self._routes = routes
+        self._missing = set()
+        self.loaded_at = datetime.now()
+        self.last_error = None
+        return len(routes)
+
+    def _refresh_loop(self) -> None:
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                self.load()
+            except Exception as e:
+                # Keep serving the previous snapshot
+                self.last_error = str(e)
+
+    def start(self) -> None:
+        """Load the table and start the refresh thread; a failed load is retried by the thread"""
+        if self._thread is not None:
+            return
+        try:
+            self.load()
+        except Exception as e:
+            self.last_error = str(e)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._refresh_loop, name="routing-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            "routes": len(self._routes),
+            "conflicting_ids": sorted(self.conflicts)[:100],
+            "loaded_at": self.loaded_at,
+            "cold_lookups": self.cold_lookups,
+            "last_error": self.last_error
+        }
+
+# (link_id, profile_id, ip_address, user_agent, referrer, clicked_at) as captured by the redirect
+RawClick = Tuple[int, int, Optional[str], Optional[str], Optional[str], datetime]
+
+class ClickQueue:
+    """
+    Hands redirect clicks to a background writer so the redirect never waits on the database.
+
+    put() is a deque append. The writer thread wakes every flush_interval, filters,
+    validates and enriches the pending clicks exactly like /api/track/click, and writes
+    them with one multi-row INSERT per shard (or to the spool while the database is degraded).
+    Past max_pending, clicks are spooled directly by the caller instead of queued. Rows that
+    reach neither the database nor the spool are kept (up to max_pending) and retried first
+    by the next flush.
+    """
+
+    def __init__(self, flush_interval: float = 0.05, batch_size: int = 1000, max_pending: int = 100000):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+
+        self._pending: Deque[RawClick] = deque()
+        self._unstored: List[dict] = []  # prepared rows a failed flush couldn't store
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._flush_lock = threading.Lock()
+
+        self.queued = 0
+        self.written = 0
+        self.spooled = 0
+        self.filtered = 0
+        self.invalid = 0
+        self.dropped = 0
+        self.last_error: Optional[str] = None
+
+    def put(self, link_id: int, profile_id: int, ip_address: Optional[str],
+            user_agent: Optional[str], referrer: Optional[str]) -> None:
+        click = (link_id, profile_id, ip_address, user_agent, referrer, datetime.now())
+        self.queued += 1
+        if len(self._pending) >= self.max_pending:
+            # Writer can't keep up: still record the click, just via the spool
+            rows = self._prepare([click])
+            for row in rows:
+                event_spool.append("click", row)
+            self.spooled += len(rows)
+            return
+        self._pending.append(click)
+
+    def _prepare(self, clicks: List[RawClick]) -> List[dict]:
+        rows = []
+        for link_id, profile_id, ip_address, user_agent, referrer, clicked_at in clicks:
+            if ingest_filter.check_click(link_id, ip_address, user_agent):
+                self.filtered += 1
+                continue
+            try:
+                record = validate_click(link_id, profile_id, ip_address, user_agent, referrer)
+            except ValueError:
+                self.invalid += 1
+                continue
+            # Prepared rows are always written or spooled
+            ingest_filter.record_click(link_id, ip_address)
+            row = event_enricher.enrich(record._asdict())
+            row["clicked_at"] = clicked_at
+            rows.append(row)
+        return rows
+
+    def flush(self) -> int:
+        """Write everything pending; returns the number of clicks stored or spooled"""
+        with self._flush_lock:
+            stored = 0
+            if self._unstored:
+                rows, self._unstored = self._unstored, []
+                stored += self._write(rows)
+            while self._pending:
+                batch = []
+                while self._pending and len(batch) < self.batch_size:
+                    batch.append(self._pending.popleft())
+                try:
+                    rows = self._prepare(batch)
+                except Exception:
+                    # Partly recorded by the duplicate filter already, so a retry would drop them anyway
+                    self.dropped += len(batch)
+                    raise
+                if rows:
+                    stored += self._write(rows)
+            return stored
+
+    def _keep_unstored(self, rows: List[dict]) -> None:
+        self._unstored.extend(rows)
+        excess = len(self._unstored) - self.max_pending
+        if excess > 0:
+            del self._unstored[:excess]
+            self.dropped += excess
+
+    def _write(self, rows: List[dict]) -> int:
+        """Insert (or spool) prepared rows; those neither stored nor spooled are kept for the next flush"""
+        unwritten = rows if event_spool.degraded else []
+        if not event_spool.degraded:
+            for shard, shard_rows in shard_router.partition(rows).items():
+                db = shard.session()
+                try:
+                    started = time.perf_counter()
+                    db.execute(insert(ClickEvent), shard_rows)
+                    db.commit()
+                    event_spool.record_write(time.perf_counter() - started)
+                    self.written += len(shard_rows)
+                except SQLAlchemyError as e:
+                    db.rollback()
+                    event_spool.mark_degraded(f"redirect click insert failed on shard {shard.name}: {e.__class__.__name__}")
+                    unwritten = unwritten + shard_rows
+                finally:
+                    db.close()
+        failed: List[dict] = []
+        try:
+            for index, row in enumerate(unwritten):
+                event_spool.append("click", row)
+        except Exception:
+            failed = unwritten[index:]
+            self._keep_unstored(failed)
+            raise
+        finally:
+            self.spooled += len(unwritten) - len(failed)
+            failed_rows = {id(row) for row in failed}
+            rows = [row for row in rows if id(row) not in failed_rows]
+            for row in rows:
+                anomaly_detector.record_event("click", row["profile_id"], row["link_id"])
+                referrer_tracker.record("click", row["profile_id"], row["referrer"], row["clicked_at"])
+            for profile_id in {row["profile_id"] for row in rows}:
+                profile_hub.notify(profile_id)
+        return len(rows)
+
+    def _writer_loop(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+                self.last_error = None
+            except Exception as e:
+                # Unexpected failure (not a database error, e.g. the spool disk): retried next flush
+                self.last_error = f"{e.__class__.__name__}: {e}"
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._writer_loop, name="redirect-clicks", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the writer and store whatever is still queued"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "queued": self.queued,
+            "written": self.written,
+            "spooled": self.spooled,
+            "filtered": self.filtered,
+            "invalid": self.invalid,
+            "unstored": len(self._unstored),
+            "dropped": self.dropped,
+            "last_error": self.last_error
+        }
+
+routing_table = LinkRoutingTable(refresh_interval=settings.ROUTING_REFRESH_SECONDS)
+click_queue = ClickQueue(
+    flush_interval=settings.REDIRECT_FLUSH_MS / 1000,
+    batch_size=settings.CLICK_BATCH_SIZE
+)
@@ -0,0 +1,272 @@
+import json
+import threading
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from config import settings
+from database.models import ReferrerSketch
+from database.sharding import shard_router
+from services.window_cache import floor_hour
+
+DIRECT = "(direct)"
+UNPARSEABLE = "(unknown)"
+
+@lru_cache(maxsize=16384)
+def referrer_host(referrer: Optional[str]) -> str:
+    """Host of a referrer URL, lower-cased without a leading www. ('(direct)' when empty)"""
+    if referrer is None or not referrer.strip():
+        return DIRECT
+    value = referrer.strip().lower()
+    try:
+        # Bare hosts ("instagram.com/foo") have no scheme; parse them as network locations
+        host = urlsplit(value if "//" in value else "//" + value).hostname
+    except ValueError:
+        return UNPARSEABLE
+    if not host:
+        return UNPARSEABLE
+    if host.startswith("www."):
+        host = host[4:]
+    return host[:253]
+
+class SpaceSaving:
+    """
+    Space-Saving heavy-hitter summary (Metwally et al.) over at most `capacity` items.
+
+    An item not yet tracked replaces the one with the smallest count and inherits that
+    count as its error, so every estimate is an overestimate by at most its error, and
+    by at most total / capacity overall. Any item with a true count above
+    total / capacity is guaranteed to be tracked. Two summaries merge into one with the
+    same guarantees (missing items are assumed to sit at the other summary's minimum),
+    which is how hourly summaries from several workers are combined.
+    """
+
+    __slots__ = ("capacity", "counts", "errors", "total")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.total = 0
+
+    def add(self, item: str, count: int = 1) -> None:
+        self.total += count
+        counts = self.counts
+        if item in counts:
+            counts[item] += count
+        elif len(counts) < self.capacity:
+            counts[item] = count
+            self.errors[item] = 0
+        else:
+            # O(capacity) scan, only on a miss with a full summary; capacity is small
+            victim = min(counts, key=counts.get)
+            floor = counts.pop(victim)
+            del self.errors[victim]
+            counts[item] = floor + count
+            self.errors[item] = floor
+
+    def min_count(self) -> int:
+        """Count an untracked item may have had at most (0 until the summary is full)"""
+        if len(self.counts) < self.capacity:
+            return 0
+        return min(self.counts.values())
+
+    def merge(self, other: "SpaceSaving") -> "SpaceSaving":
+        """Combined summary of both streams; neither input is modified"""
+        merged = SpaceSaving(max(self.capacity, other.capacity))
+        floor_self = self.min_count()
+        floor_other = other.min_count()
+        combined = []
+        for item in self.counts.keys() | other.counts.keys():
+            count = self.counts.get(item, floor_self) + other.counts.get(item, floor_other)
+            error = self.errors.get(item, floor_self) + other.errors.get(item, floor_other)
+            combined.append((count, error, item))
+        combined.sort(key=lambda entry: entry[0], reverse=True)
+        for count, error, item in combined[:merged.capacity]:
+            merged.counts[item] = count
+            merged.errors[item] = error
+        merged.total = self.total + other.total
+        return merged
+
+    def top(self, limit: Optional[int] = None) -> List[Tuple[str, int, int]]:
+        """(item, estimated count, error) by estimated count, descending"""
+        entries = sorted(self.counts.items(), key=lambda entry: entry[1], reverse=True)
+        return [(item, count, self.errors[item]) for item, count in entries[:limit]]
+
+    def to_json(self) -> str:
+        return json.dumps([[item, count, self.errors[item]] for item, count in self.counts.items()],
+                          separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, data: str, capacity: int, total: int) -> "SpaceSaving":
+        summary = cls(capacity)
+        for item, count, error in json.loads(data):
+            summary.counts[item] = count
+            summary.errors[item] = error
+        summary.total = total
+        return summary
+
+# (profile_id, 'click' or 'view', hour start)
+SketchKey = Tuple[int, str, datetime]
+
+class ReferrerTracker:
+    """
+    Per-profile top referrer hosts, counted at ingest with Space-Saving summaries.
+
+    Each worker keeps one small summary per (profile, event kind, hour) it has seen since
+    its last flush. Every flush_interval they are merged into the referrer_sketches row
+    for that hour, so memory per profile is fixed by `capacity` and the stored hourly
+    summaries combine exactly like the in-memory ones: a query merges the hours in range
+    plus whatever this worker has not flushed yet.
+    """
+
+    def __init__(self, capacity: int = 64, flush_interval: float = 60.0):
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+
+        self._pending: Dict[SketchKey, SpaceSaving] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.recorded = 0
+        self.flushed_sketches = 0
+        self.last_error: Optional[str] = None
+
+    def record(self, kind: str, profile_id: int, referrer: Optional[str],
+               timestamp: Optional[datetime] = None) -> None:
+        """Count one event's referrer host; constant time apart from a full summary's miss"""
+        key = (profile_id, kind, floor_hour(timestamp or datetime.now()))
+        host = referrer_host(referrer)
+        with self._lock:
+            sketch = self._pending.get(key)
+            if sketch is None:
+                sketch = self._pending[key] = SpaceSaving(self.capacity)
+            sketch.add(host)
+            self.recorded += 1
+
+    def _requeue(self, sketches: Dict[SketchKey, SpaceSaving]) -> None:
+        with self._lock:
+            for key, sketch in sketches.items():
+                current = self._pending.get(key)
+                self._pending[key] = sketch if current is None else sketch.merge(current)
+
+    def flush(self) -> int:
+        """Merge pending summaries into referrer_sketches on each profile's shard; returns the number of rows written"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+
+            written = 0
+            errors = []
+            groups = shard_router.partition(pending.items(), key=lambda entry: entry[0][0])
+            for shard, entries in groups.items():
+                sketches = dict(entries)
+                db = shard.session()
+                try:
+                    self._write(db, sketches)
+                    db.commit()
+                    written += len(sketches)
+                except SQLAlchemyError as e:
+                    # Includes another worker inserting the same hour first: retry on the next flush
+                    db.rollback()
+                    errors.append(f"{shard.name}: {e}")
+                    self._requeue(sketches)
+                finally:
+                    db.close()
+
+            self.flushed_sketches += written
+            self.last_error = "; ".join(errors) or None
+            return written
+
+    def _write(self, db: Session, pending: Dict[SketchKey, SpaceSaving]) -> None:
+        by_hour: Dict[Tuple[str, datetime], List[int]] = {}
+        for profile_id, kind, hour in pending:
+            by_hour.setdefault((kind, hour), []).append(profile_id)
+
+        for (kind, hour), profile_ids in by_hour.items():
+            for chunk in range(0, len(profile_ids), 1000):
+                ids = profile_ids[chunk:chunk + 1000]
+                rows = db.query(ReferrerSketch).filter(
+                    ReferrerSketch.kind == kind,
+                    ReferrerSketch.hour_start == hour,
+                    ReferrerSketch.profile_id.in_(ids)
+                ).with_for_update().all()
+                existing = {row.profile_id: row for row in rows}
+                for profile_id in ids:
+                    sketch = pending[(profile_id, kind, hour)]
+                    row = existing.get(profile_id)
+                    if row is None:
+                        db.add(ReferrerSketch(profile_id=profile_id, kind=kind, hour_start=hour,
+                                              total=sketch.total, sketch=sketch.to_json()))
+                        continue
+                    merged = SpaceSaving.from_json(row.sketch, self.capacity, row.total).merge(sketch)
+                    row.total = merged.total
+                    row.sketch = merged.to_json()
+
+    def summarize(self, db: Session, profile_id: int, kind: str, start_date: datetime,
+                  end_date: datetime) -> Tuple[SpaceSaving, int]:
+        """Merged summary of a profile's hours in range (stored and unflushed); also returns the hour count"""
+        rows = db.query(ReferrerSketch.sketch, ReferrerSketch.total).filter(
+            ReferrerSketch.profile_id == profile_id,
+            ReferrerSketch.kind == kind,
+            ReferrerSketch.hour_start >= floor_hour(start_date),
+            ReferrerSketch.hour_start <= end_date
+        ).all()
+        sketches = [SpaceSaving.from_json(sketch, self.capacity, total) for sketch, total in rows]
+        with self._lock:
+            unflushed = [
+                sketch.merge(SpaceSaving(self.capacity))  # copy; record() keeps mutating the original
+                for (pid, pkind, hour), sketch in self._pending.items()
+                if pid == profile_id and pkind == kind and floor_hour(start_date) <= hour <= end_date
+            ]
+        merged = SpaceSaving(self.capacity)
+        for sketch in sketches + unflushed:
+            merged = merged.merge(sketch)
+        return merged, len(rows)
+
+    def _flush_loop(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                self.last_error = str(e)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._flush_loop, name="referrer-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the flush thread and write what is still pending"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        try:
+            self.flush()
+        except Exception as e:
+            self.last_error = str(e)
+
+    def stats(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "pending_sketches": len(self._pending),
+            "recorded": self.recorded,
+            "flushed_sketches": self.flushed_sketches,
+            "last_error": self.last_error
+        }
+
+referrer_tracker = ReferrerTracker(
+    capacity=settings.REFERRER_SKETCH_SIZE,
+    flush_interval=settings.REFERRER_FLUSH_SECONDS
+)
@@ -1,7 +1,8 @@
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-
 class ReportGenerator:
     def generate_analytics_report(self, profile_id, start_date, end_date):
+        # reportlab is only needed here, so keep it out of worker startup
+        from reportlab.lib.pagesizes import letter
+        from reportlab.pdfgen import canvas
+
         # Generate professional PDF reports
-        pass
\ No newline at end of file
+        pass
@@ -0,0 +1,242 @@
+import hashlib
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+
+from config import settings
+from database.models import SessionizerCursor, VisitSession
+from services.event_jobs import EventCursorJob
+
+def visitor_key(ip_address: Optional[str], user_agent: Optional[str]) -> int:
+    """Signed 64-bit hash of (ip, user agent), small enough for a BIGINT column"""
+    digest = hashlib.blake2b(f"{ip_address or ''}|{user_agent or ''}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+class SessionState:
+    """Running summary of one visit; mirrors a visit_sessions row"""
+
+    __slots__ = ("id", "profile_id", "visitor_key", "started_at", "ended_at", "page_views",
+                 "clicks", "first_view_at", "first_click_at")
+
+    def __init__(self, profile_id: int, visitor_key: int, timestamp: datetime):
+        self.id: Optional[int] = None
+        self.profile_id = profile_id
+        self.visitor_key = visitor_key
+        self.started_at = timestamp
+        self.ended_at = timestamp
+        self.page_views = 0
+        self.clicks = 0
+        self.first_view_at: Optional[datetime] = None
+        self.first_click_at: Optional[datetime] = None
+
+    def add(self, kind: str, timestamp: datetime) -> None:
+        self.started_at = min(self.started_at, timestamp)
+        self.ended_at = max(self.ended_at, timestamp)
+        if kind == "view":
+            self.page_views += 1
+            if self.first_view_at is None or timestamp < self.first_view_at:
+                self.first_view_at = timestamp
+        else:
+            self.clicks += 1
+            if self.first_click_at is None or timestamp < self.first_click_at:
+                self.first_click_at = timestamp
+
+    def to_row(self, is_open: bool) -> dict:
+        first_click_seconds = None
+        if self.first_view_at is not None and self.first_click_at is not None and self.first_click_at >= self.first_view_at:
+            first_click_seconds = (self.first_click_at - self.first_view_at).total_seconds()
+        row = {
+            "profile_id": self.profile_id,
+            "visitor_key": self.visitor_key,
+            "started_at": self.started_at,
+            "ended_at": self.ended_at,
+            "page_views": self.page_views,
+            "clicks": self.clicks,
+            "first_view_at": self.first_view_at,
+            "first_click_at": self.first_click_at,
+            "first_click_seconds": first_click_seconds,
+            "is_open": is_open
+        }
+        if self.id is not None:
+            row["id"] = self.id
+        return row
+
+    @classmethod
+    def from_row(cls, row: VisitSession) -> "SessionState":
+        state = cls(row.profile_id, row.visitor_key, row.started_at)
+        state.id = row.id
+        state.ended_at = row.ended_at
+        state.page_views = row.page_views
+        state.clicks = row.clicks
+        state.first_view_at = row.first_view_at
+        state.first_click_at = row.first_click_at
+        return state
+
+class Sessionizer:
+    """
+    Groups events into visits by (profile, visitor) with an inactivity timeout.
+
+    Events should arrive in timestamp order. Open sessions live in an OrderedDict kept in
+    order of last activity, so expiring idle sessions only looks at the front. Time is
+    event time: a session closes once the latest event seen is more than `timeout` past
+    its last event, so a backfill over old data behaves exactly like live processing. At
+    most max_open sessions stay open; beyond that the least recently active is closed early.
+    """
+
+    def __init__(self, timeout: timedelta, max_open: int = 200000):
+        self.timeout = timeout
+        self.max_open = max_open
+        self.open: "OrderedDict[Tuple[int, int], SessionState]" = OrderedDict()
+        self.closed: List[SessionState] = []
+        self.dirty = set()  # keys of open sessions changed since the last write
+        self.watermark: Optional[datetime] = None
+        self.forced_closes = 0
+
+    def add(self, kind: str, profile_id: int, ip_address: Optional[str], user_agent: Optional[str],
+            timestamp: datetime) -> None:
+        key = (profile_id, visitor_key(ip_address, user_agent))
+        session = self.open.get(key)
+
+        if session is not None and timestamp - session.ended_at > self.timeout:
+            self._close(key)
+            session = None
+        elif session is not None and session.started_at - timestamp > self.timeout:
+            # Late event from well before the open visit: it was its own visit
+            late = SessionState(profile_id, key[1], timestamp)
+            late.add(kind, timestamp)
+            self.closed.append(late)
+            return
+
+        if session is None:
+            session = self.open[key] = SessionState(profile_id, key[1], timestamp)
+        else:
+            self.open.move_to_end(key)
+        session.add(kind, timestamp)
+        self.dirty.add(key)
+
+        if self.watermark is None or timestamp > self.watermark:
+            self.watermark = timestamp
+        if len(self.open) > self.max_open:
+            self._close(next(iter(self.open)))
+            self.forced_closes += 1
+
+    def _close(self, key: Tuple[int, int]) -> None:
+        self.closed.append(self.open.pop(key))
+        self.dirty.discard(key)
+
+    def expire(self) -> int:
+        """Close sessions idle for longer than the timeout (in event time); returns how many"""
+        if self.watermark is None:
+            return 0
+        cutoff = self.watermark - self.timeout
+        expired = 0
+        while self.open:
+            key, session = next(iter(self.open.items()))
+            if session.ended_at >= cutoff:
+                break
+            self._close(key)
+            expired += 1
+        return expired
+
+    def restore(self, sessions: Iterable[SessionState], watermark: Optional[datetime]) -> None:
+        """Reload open sessions persisted by a previous run (oldest activity first)"""
+        for session in sessions:
+            self.open[(session.profile_id, session.visitor_key)] = session
+        self.watermark = watermark
+
+class SessionizerJob(EventCursorJob):
+    """
+    Folds new click and page view rows into visit_sessions.
+
+    Each run keeps only the events up to the point where the click and view batches
+    overlap in time (so they are merged in timestamp order), updates the sessions and
+    writes closed plus changed open sessions with the cursor. Open sessions are persisted
+    with is_open = true and reloaded on start, so the in-memory state is bounded and
+    survives restarts.
+    """
+
+    cursor_model = SessionizerCursor
+    event_columns = ("profile_id", "ip_address", "user_agent")
+
+    def __init__(self, timeout_minutes: float = 30, batch_size: int = 50000, max_open: int = 200000):
+        super().__init__(batch_size)
+        self.timeout = timedelta(minutes=timeout_minutes)
+        self.max_open = max_open
+        self.sessionizer: Optional[Sessionizer] = None
+
+    def _load(self, db: Session, cursor: SessionizerCursor) -> Sessionizer:
+        sessionizer = Sessionizer(self.timeout, self.max_open)
+        rows = db.query(VisitSession).filter(VisitSession.is_open.is_(True)).order_by(VisitSession.ended_at)
+        sessionizer.restore((SessionState.from_row(row) for row in rows), cursor.event_time_watermark)
+        return sessionizer
+
+    def _take(self, clicks: List[tuple], views: List[tuple]) -> Tuple[List[tuple], List[tuple]]:
+        # A full batch may stop mid-way through time; don't run the other table past it
+        full_batch_ends = [max(row[4] for row in rows) for rows in (clicks, views) if len(rows) >= self.batch_size]
+        if not full_batch_ends:
+            return clicks, views
+        cutoff = min(full_batch_ends)
+        return self._until(clicks, cutoff), self._until(views, cutoff)
+
+    @staticmethod
+    def _until(rows: List[tuple], cutoff: datetime) -> List[tuple]:
+        """Rows in id order up to the first one past cutoff"""
+        taken = []
+        for row in rows:
+            if row[4] > cutoff:
+                break
+            taken.append(row)
+        return taken
+
+    def _write(self, db: Session, sessionizer: Sessionizer) -> int:
+        states = [(state, False) for state in sessionizer.closed]
+        states += [(sessionizer.open[key], True) for key in sessionizer.dirty]
+
+        new = [(state, is_open) for state, is_open in states if state.id is None]
+        existing = [state.to_row(is_open) for state, is_open in states if state.id is not None]
+        if new:
+            ids = db.execute(
+                insert(VisitSession).returning(VisitSession.id, sort_by_parameter_order=True),
+                [state.to_row(is_open) for state, is_open in new]
+            ).scalars().all()
+            for (state, _), session_id in zip(new, ids):
+                state.id = session_id
+        if existing:
+            db.execute(update(VisitSession), existing)
+        return len(states)
+
+    def _apply(self, db: Session, cursor: SessionizerCursor, clicks: List[tuple], views: List[tuple]) -> dict:
+        if self.sessionizer is None:
+            self.sessionizer = self._load(db, cursor)
+        sessionizer = self.sessionizer
+
+        events = [("view",) + row[1:] for row in views] + [("click",) + row[1:] for row in clicks]
+        events.sort(key=lambda event: (event[4], event[0] == "click"))
+        for kind, profile_id, ip_address, user_agent, timestamp in events:
+            sessionizer.add(kind, profile_id, ip_address, user_agent, timestamp)
+        closed = len(sessionizer.closed) + sessionizer.expire()
+        written = self._write(db, sessionizer)
+        cursor.event_time_watermark = sessionizer.watermark
+
+        # Written with the cursor; if the commit fails, _reset reloads the sessions instead
+        sessionizer.closed = []
+        sessionizer.dirty = set()
+        return {
+            "sessions_written": written,
+            "sessions_closed": closed,
+            "open_sessions": len(sessionizer.open),
+            "forced_closes": sessionizer.forced_closes
+        }
+
+    def _reset(self) -> None:
+        # In-memory sessions no longer match the database; reload them next run
+        self.sessionizer = None
+
+sessionizer_job = SessionizerJob(
+    timeout_minutes=settings.SESSION_TIMEOUT_MINUTES,
+    batch_size=settings.SESSIONIZER_BATCH_SIZE,
+    max_open=settings.SESSIONIZER_MAX_OPEN
+)
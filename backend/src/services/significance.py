@@ -0,0 +1,221 @@
+import math
+from datetime import date
+from typing import Callable, Dict, Hashable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from config import settings
+from database.models import EngagementStat, EngagementStatCursor
+from services.enrichment import traffic_source
+from services.event_jobs import EventCursorJob
+
+# The notebook's engagement_value of an event
+CLICK_ENGAGEMENT = 1.0
+VIEW_ENGAGEMENT = 0.1
+
+# (name, first hour, end hour) as in the notebook's classify_time_slot
+TIME_SLOTS = (("Matin", 6, 12), ("Après-midi", 12, 18), ("Soirée", 18, 24), ("Nuit", 0, 6))
+
+# The notebook's PROJECT_CONFIG ALPHA and CONFIDENCE_LEVEL, and its minimum group sizes
+SIGNIFICANCE_ALPHA = 0.05
+CONFIDENCE_LEVEL = 0.95
+MIN_GROUP_EVENTS = 10  # per hour, weekday or time slot
+MIN_RATE_EVENTS = 30  # per traffic source, for the click rate test and intervals
+
+def time_slot(hour: int) -> str:
+    return next(name for name, first, last in TIME_SLOTS if first <= hour < last)
+
+class EngagementStatsJob(EventCursorJob):
+    """
+    Adds new clicks and page views to the per-profile counts in engagement_stats.
+
+    Each batch is counted per (profile, day, hour, traffic source) and added to the stored
+    rows. Counts only grow, so late events simply land in their own hour.
+    """
+
+    cursor_model = EngagementStatCursor
+    event_columns = ("profile_id", "referrer")
+
+    def _apply(self, db: Session, cursor: EngagementStatCursor, clicks: List[tuple], views: List[tuple]) -> dict:
+        """Add a batch of (id, profile_id, referrer, timestamp) events to the counts"""
+        counts: Dict[Tuple[int, date, int, str], List[int]] = {}
+        for events, column in ((clicks, 0), (views, 1)):
+            for _, profile_id, referrer, timestamp in events:
+                key = (profile_id, timestamp.date(), timestamp.hour, traffic_source(referrer))
+                counts.setdefault(key, [0, 0])[column] += 1
+        if not counts:
+            return {"rows_written": 0}
+
+        profile_ids = sorted({key[0] for key in counts})
+        days = sorted({key[1] for key in counts})
+        existing = {}
+        for chunk in range(0, len(profile_ids), 1000):
+            rows = db.query(EngagementStat).filter(
+                EngagementStat.profile_id.in_(profile_ids[chunk:chunk + 1000]),
+                EngagementStat.day >= days[0],
+                EngagementStat.day <= days[-1]
+            ).with_for_update().all()
+            existing.update(((row.profile_id, row.day, row.hour, row.source), row) for row in rows)
+
+        for key, (click_count, view_count) in counts.items():
+            row = existing.get(key)
+            if row is None:
+                profile_id, day, hour, source = key
+                db.add(EngagementStat(profile_id=profile_id, day=day, hour=hour, source=source,
+                                      clicks=click_count, views=view_count))
+                continue
+            row.clicks += click_count
+            row.views += view_count
+        return {"rows_written": len(counts)}
+
+class BucketStats:
+    """
+    Sufficient statistics of engagement_value over a group of events.
+
+    The value takes two levels (a click or a view), so the click and view counts fix the
+    count, sum and sum of squares, and also the ranks: the rank tests below give the same
+    statistics as scipy on the per-event values.
+    """
+
+    __slots__ = ("clicks", "views")
+
+    def __init__(self, clicks: int = 0, views: int = 0):
+        self.clicks = clicks
+        self.views = views
+
+    def add(self, clicks: int, views: int) -> None:
+        self.clicks += clicks
+        self.views += views
+
+    @property
+    def count(self) -> int:
+        return self.clicks + self.views
+
+    @property
+    def total(self) -> float:
+        return self.clicks * CLICK_ENGAGEMENT + self.views * VIEW_ENGAGEMENT
+
+    @property
+    def total_sq(self) -> float:
+        return self.clicks * CLICK_ENGAGEMENT ** 2 + self.views * VIEW_ENGAGEMENT ** 2
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count
+
+    @property
+    def variance(self) -> float:
+        """Sample variance (n - 1 denominator)"""
+        return max(self.total_sq - self.total ** 2 / self.count, 0.0) / (self.count - 1)
+
+class TestResult(NamedTuple):
+    statistic: float
+    pvalue: float
+    effect_size: Optional[float] = None
+
+def group_buckets(rows: List[tuple], key: Callable[[date, int, str], Hashable]) -> Dict[Hashable, BucketStats]:
+    """Sum (day, hour, source, clicks, views) rows into one BucketStats per key(day, hour, source)"""
+    groups: Dict[Hashable, BucketStats] = {}
+    for day, hour, source, clicks, views in rows:
+        groups.setdefault(key(day, hour, source), BucketStats()).add(clicks, views)
+    return groups
+
+def _pearson_chi_square(groups: List[BucketStats], yates: bool = False) -> float:
+    """
+    Pearson chi-square of the groups x (clicks, views) table (no empty groups, clicks and views
+    both present); with yates, each |observed - expected| shrinks by up to 0.5 as in scipy
+    """
+    total = sum(group.count for group in groups)
+    clicks = sum(group.clicks for group in groups)
+    views = total - clicks
+    chi_square = 0.0
+    for group in groups:
+        for observed, expected in ((group.clicks, group.count * clicks / total),
+                                   (group.views, group.count * views / total)):
+            difference = abs(observed - expected)
+            if yates:
+                difference -= min(0.5, difference)
+            chi_square += difference ** 2 / expected
+    return chi_square
+
+def kruskal_wallis(groups: List[BucketStats]) -> Optional[TestResult]:
+    """
+    Kruskal-Wallis H with the tie correction (scipy.stats.kruskal). For two-level data it
+    equals (N - 1) / N times the Pearson chi-square of the groups x (clicks, views) table.
+    """
+    # scipy costs about a second of import time: only load it once a test runs
+    from scipy.stats import chi2
+
+    groups = [group for group in groups if group.count]
+    if len(groups) < 2 or not any(group.clicks for group in groups) or not any(group.views for group in groups):
+        return None  # every value identical: H is undefined
+    total = sum(group.count for group in groups)
+    h = (total - 1) / total * _pearson_chi_square(groups)
+    return TestResult(float(h), float(chi2.sf(h, len(groups) - 1)))
+
+def mann_whitney(first: BucketStats, second: BucketStats) -> Optional[TestResult]:
+    """
+    Two-sided Mann-Whitney U of the first group, with scipy's normal approximation (tie and
+    continuity corrections); the effect size is Rosenthal's r = |z| / sqrt(N).
+    """
+    from scipy.stats import norm
+
+    n1, n2 = first.count, second.count
+    total = n1 + n2
+    clicks, views = first.clicks + second.clicks, first.views + second.views
+    if not n1 or not n2:
+        return None
+    ties = (clicks ** 3 - clicks + views ** 3 - views) / (total * (total - 1))
+    sigma = math.sqrt(n1 * n2 / 12 * (total + 1 - ties))
+    if sigma == 0:
+        return None
+    u1 = first.clicks * second.views + 0.5 * (first.clicks * second.clicks + first.views * second.views)
+    z = (max(u1, n1 * n2 - u1) - n1 * n2 / 2 - 0.5) / sigma
+    return TestResult(float(u1), float(min(1.0, 2 * norm.sf(z))), float(abs(z) / math.sqrt(total)))
+
+def chi_square_independence(groups: List[BucketStats]) -> Optional[TestResult]:
+    """
+    Chi-square test of event type (click/view) against the groups (scipy.stats.chi2_contingency);
+    effect size is Cramér's V
+    """
+    from scipy.stats import chi2
+
+    groups = [group for group in groups if group.count]
+    if len(groups) < 2 or not any(group.clicks for group in groups) or not any(group.views for group in groups):
+        return None
+    # Two rows: len(groups) - 1 degrees of freedom, Cramér's V divides by N, and scipy
+    # applies Yates' correction only to a 2x2 table
+    chi_square = _pearson_chi_square(groups, yates=len(groups) == 2)
+    total = sum(group.count for group in groups)
+    return TestResult(float(chi_square), float(chi2.sf(chi_square, len(groups) - 1)), math.sqrt(chi_square / total))
+
+def mean_interval(bucket: BucketStats, confidence: float) -> Optional[Tuple[float, float, float]]:
+    """(mean engagement, lower, upper): Student t interval from the sufficient statistics"""
+    from scipy.stats import t as student_t
+
+    if bucket.count < 2:
+        return None
+    margin = student_t.ppf(1 - (1 - confidence) / 2, df=bucket.count - 1) * math.sqrt(bucket.variance / bucket.count)
+    return bucket.mean, bucket.mean - margin, bucket.mean + margin
+
+def click_rate_interval(bucket: BucketStats, confidence: float) -> Optional[Tuple[float, float, float]]:
+    """(share of events that are clicks, lower, upper): normal approximation"""
+    from scipy.stats import norm
+
+    if not bucket.count:
+        return None
+    rate = bucket.clicks / bucket.count
+    margin = norm.ppf(1 - (1 - confidence) / 2) * math.sqrt(rate * (1 - rate) / bucket.count)
+    return rate, max(0.0, rate - margin), min(1.0, rate + margin)
+
+def load_buckets(db: Session, profile_id: int, first_day: date, last_day: date) -> List[tuple]:
+    """(day, hour, source, clicks, views) rows of a profile for the days [first_day, last_day]"""
+    return db.query(
+        EngagementStat.day, EngagementStat.hour, EngagementStat.source, EngagementStat.clicks, EngagementStat.views
+    ).filter(
+        EngagementStat.profile_id == profile_id,
+        EngagementStat.day >= first_day,
+        EngagementStat.day <= last_day
+    ).all()
+
+engagement_stats_job = EngagementStatsJob(batch_size=settings.ENGAGEMENT_STATS_BATCH_SIZE)
@@ -0,0 +1,381 @@
+import fcntl
+import json
+import mmap
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import insert, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from config import settings
+from database.models import ClickEvent, PageView
+from database.sharding import Shard, shard_router
+from services.enrichment import event_enricher
+from services.notifier import profile_hub
+from services.window_cache import window_aggregator
+
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".log"
+
+# Event kind -> (table, timestamp column)
+EVENT_TABLES = {
+    "click": (ClickEvent, "clicked_at"),
+    "view": (PageView, "viewed_at")
+}
+
+class EventSpool:
+    """
+    Append-only local spool for tracking events that could not be written to the database.
+
+    Events are appended as JSON lines to numbered segment files. Appends go straight to the
+    OS with os.write and are fsync'ed in batches by a background thread, so a crash loses at
+    most fsync_interval of events. A replayer thread drains sealed segments back into the
+    database and removes them. Delivery is at-least-once: a crash between the replay commit
+    and the segment delete replays that segment again.
+
+    Workers share the directory. Each segment is created exclusively and flock'ed by the
+    worker appending to it until it is sealed, so a replayer only takes segments whose
+    lock it can get: sealed ones and those of workers that have exited.
+    """
+
+    def __init__(self, directory: str, segment_max_bytes: int = 16 * 1024 * 1024,
+                 fsync_interval: float = 0.05, latency_budget: float = 0.25, slow_write_limit: int = 5):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.fsync_interval = fsync_interval
+        self.latency_budget = latency_budget
+        self.slow_write_limit = slow_write_limit
+
+        self.degraded = False
+        self.degraded_reason: Optional[str] = None
+        self.spooled_events = 0
+        self.replayed_events = 0
+        self.dropped_events = 0
+        self.last_replay_at: Optional[datetime] = None
+        self.last_replay_error: Optional[str] = None
+
+        self._lock = threading.Lock()
+        self._fd: Optional[int] = None
+        self._segment_seq = 0
+        self._segment_bytes = 0
+        self._dirty = False
+        self._slow_writes = 0
+        self._first_event_at: Dict[int, float] = {}
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    # Writing
+
+    def _segment_path(self, seq: int) -> str:
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{seq:08d}{SEGMENT_SUFFIX}")
+
+    def _existing_segments(self) -> List[int]:
+        if not os.path.isdir(self.directory):
+            return []
+        seqs = (
+            name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]
+            for name in os.listdir(self.directory)
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)
+        )
+        # Skip anything else matching the pattern (editor backups, copies)
+        return sorted(int(seq) for seq in seqs if seq.isdigit())
+
+    def _open_next_segment(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        while True:
+            existing = self._existing_segments()
+            self._segment_seq = max(existing[-1] if existing else 0, self._segment_seq) + 1
+            path = self._segment_path(self._segment_seq)
+            try:
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND, 0o644)
+            except FileExistsError:
+                continue  # another worker took this number
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            # A replayer may have taken the empty file before the lock: start over if it was removed
+            if os.fstat(fd).st_nlink > 0:
+                break
+            os.close(fd)
+        self._fd = fd
+        self._segment_bytes = 0
+
+    def _close_segment(self) -> None:
+        if self._fd is not None:
+            os.fsync(self._fd)
+            if self._segment_bytes == 0:
+                os.remove(self._segment_path(self._segment_seq))
+            # Closing releases the lock: the segment is sealed and any replayer may take it
+            os.close(self._fd)
+            self._fd = None
+            self._dirty = False
+
+    def append(self, kind: str, row: dict) -> None:
+        """Append one event row (as it would be inserted) to the active segment"""
+        line = json.dumps({"kind": kind, "row": row}, default=datetime.isoformat).encode() + b"\n"
+        with self._lock:
+            if self._fd is None or self._segment_bytes >= self.segment_max_bytes:
+                self._close_segment()
+                self._open_next_segment()
+            os.write(self._fd, line)
+            self._segment_bytes += len(line)
+            self._dirty = True
+            self._first_event_at.setdefault(self._segment_seq, time.time())
+            self.spooled_events += 1
+
+    def flush(self) -> None:
+        """fsync the active segment if anything was appended since the last flush"""
+        with self._lock:
+            if self._fd is not None and self._dirty:
+                os.fsync(self._fd)
+                self._dirty = False
+
+    def mark_degraded(self, reason: str) -> None:
+        """Route new events to the spool until the replayer has drained it"""
+        self.degraded = True
+        self.degraded_reason = reason
+
+    def record_write(self, latency: float) -> None:
+        """Go degraded after slow_write_limit consecutive writes over the latency budget"""
+        with self._lock:
+            if latency <= self.latency_budget:
+                self._slow_writes = 0
+                return
+            self._slow_writes += 1
+            slow_writes = self._slow_writes
+        if slow_writes >= self.slow_write_limit:
+            self.mark_degraded(f"{slow_writes} consecutive writes over the latency budget")
+
+    # Replaying
+
+    @staticmethod
+    def read_segment(f) -> Iterator[dict]:
+        """Yield spooled events from an open segment file, skipping a torn trailing write"""
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start = 0
+            while True:
+                end = mm.find(b"\n", start)
+                if end == -1:
+                    break
+                try:
+                    yield json.loads(mm[start:end])
+                except ValueError:
+                    pass
+                start = end + 1
+
+    def _sealed_segments(self) -> List[int]:
+        """Segments a replayer may try: all but this worker's active one (sealed first if non-empty)"""
+        with self._lock:
+            if self._fd is not None and self._segment_bytes > 0:
+                # Seal the active segment so everything spooled so far can be replayed
+                self._close_segment()
+            active = self._segment_seq if self._fd is not None else None
+        return [seq for seq in self._existing_segments() if seq != active]
+
+    def _insert_batch(self, db, kind: str, rows: List[dict]) -> int:
+        table, _ = EVENT_TABLES[kind]
+        try:
+            with db.begin_nested():
+                db.execute(insert(table), rows)
+            return len(rows)
+        except IntegrityError:
+            # Retry row by row so one orphaned event (e.g. deleted link) can't block the spool
+            inserted = 0
+            for row in rows:
+                try:
+                    with db.begin_nested():
+                        db.execute(insert(table), [row])
+                    inserted += 1
+                except IntegrityError:
+                    self.dropped_events += 1
+            return inserted
+
+    def _replay_file(self, f, batch_size: int) -> int:
+        batches: Dict[tuple, List[dict]] = {}
+        sessions: Dict[Shard, Session] = {}
+        late_hours = set()
+        replayed = 0
+
+        def insert_rows(shard: Shard, kind: str, rows: List[dict]) -> int:
+            db = sessions.get(shard)
+            if db is None:
+                db = sessions[shard] = shard.session()
+            late_hours.update(window_aggregator.late_hours(rows, EVENT_TABLES[kind][1]))
+            return self._insert_batch(db, kind, rows)
+
+        try:
+            for event in self.read_segment(f):
+                kind = event.get("kind")
+                if kind not in EVENT_TABLES:
+                    continue
+                row = event["row"]
+                _, timestamp_column = EVENT_TABLES[kind]
+                if row.get(timestamp_column):
+                    row[timestamp_column] = datetime.fromisoformat(row[timestamp_column])
+                if "device_class" not in row:
+                    # Spooled before ingest-time enrichment existed
+                    event_enricher.enrich(row)
+                key = (shard_router.shard_for(row["profile_id"]), kind)
+                batch = batches.setdefault(key, [])
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    replayed += insert_rows(*key, batch)
+                    batches[key] = []
+            for (shard, kind), rows in batches.items():
+                if rows:
+                    replayed += insert_rows(shard, kind, rows)
+            # One transaction per segment and shard, so a failure leaves the segment intact for
+            # retry (with several shards, ones that already committed would see those rows twice)
+            for db in sessions.values():
+                db.commit()
+            # Replayed events are late by definition; drop any cached hours they touch
+            for profile_id, hour in late_hours:
+                window_aggregator.invalidate(profile_id, hour)
+                profile_hub.notify(profile_id)
+        except Exception:
+            for db in sessions.values():
+                db.rollback()
+            raise
+        finally:
+            for db in sessions.values():
+                db.close()
+        return replayed
+
+    def _replay_segment(self, seq: int, batch_size: int) -> Optional[int]:
+        """Replay and remove one segment; None while another live worker still appends to it"""
+        path = self._segment_path(seq)
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return 0  # another worker replayed it
+        with f:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+            if os.fstat(f.fileno()).st_nlink == 0:
+                return 0  # replayed and removed while we waited to open it
+            replayed = self._replay_file(f, batch_size)
+            # Removed under the lock, so no other replayer can pick it up again
+            os.remove(path)
+        with self._lock:
+            self._first_event_at.pop(seq, None)
+        return replayed
+
+    def _probe(self) -> bool:
+        """Whether every shard answers a trivial query within the latency budget"""
+        for shard in shard_router.shards.values():
+            db = shard.session()
+            try:
+                started = time.perf_counter()
+                db.execute(text("SELECT 1"))
+                if time.perf_counter() - started > self.latency_budget:
+                    return False
+            finally:
+                db.close()
+        return True
+
+    def replay(self, batch_size: int = 5000) -> int:
+        """Drain all sealed segments into the database; returns the number of events replayed"""
+        replayed = 0
+        try:
+            for seq in self._sealed_segments():
+                count = self._replay_segment(seq, batch_size)
+                if count is not None:
+                    replayed += count
+            self.last_replay_error = None
+            # Sealed backlog drained (only other workers' active segments remain) and the
+            # database is responsive again, so new events can go straight to it
+            if self.degraded and self._probe():
+                with self._lock:
+                    self._slow_writes = 0
+                self.degraded = False
+                self.degraded_reason = None
+        except Exception as e:
+            self.last_replay_error = str(e)
+        finally:
+            self.replayed_events += replayed
+            self.last_replay_at = datetime.now()
+        return replayed
+
+    # Background threads
+
+    def _flush_loop(self) -> None:
+        while not self._stop.wait(self.fsync_interval):
+            self.flush()
+
+    def _replay_loop(self, interval: float, batch_size: int) -> None:
+        while not self._stop.wait(interval):
+            if self.degraded or self._existing_segments():
+                self.replay(batch_size)
+
+    def start(self, replay_interval: float = 5.0, replay_batch_size: int = 5000) -> None:
+        """Start the fsync and replay threads"""
+        if self._threads:
+            return
+        # Segments left over from a previous run are replayed first; date them by mtime
+        for seq in self._existing_segments():
+            try:
+                mtime = os.path.getmtime(self._segment_path(seq))
+            except FileNotFoundError:
+                continue  # replayed by another worker meanwhile
+            with self._lock:
+                self._first_event_at.setdefault(seq, mtime)
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._flush_loop, name="spool-fsync", daemon=True),
+            threading.Thread(
+                target=self._replay_loop, args=(replay_interval, replay_batch_size),
+                name="spool-replayer", daemon=True
+            )
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self) -> None:
+        """Stop background threads and make everything appended so far durable"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+        with self._lock:
+            self._close_segment()
+
+    def stats(self) -> dict:
+        segments = self._existing_segments()
+        size = 0
+        for seq in segments:
+            try:
+                size += os.path.getsize(self._segment_path(seq))
+            except FileNotFoundError:
+                pass  # replayed by another worker since the listing
+        with self._lock:
+            # Segments replayed by other workers are never popped here
+            for seq in set(self._first_event_at) - set(segments) - {self._segment_seq}:
+                del self._first_event_at[seq]
+            first_event_at = list(self._first_event_at.values())
+        oldest = min(first_event_at) if first_event_at else None
+        return {
+            "degraded": self.degraded,
+            "degraded_reason": self.degraded_reason,
+            "segments": len(segments),
+            "size_bytes": size,
+            "replay_lag_seconds": round(time.time() - oldest, 1) if oldest and size else 0.0,
+            "spooled_events": self.spooled_events,
+            "replayed_events": self.replayed_events,
+            "dropped_events": self.dropped_events,
+            "last_replay_at": self.last_replay_at,
+            "last_replay_error": self.last_replay_error
+        }
+
+event_spool = EventSpool(
+    directory=settings.SPOOL_DIR,
+    segment_max_bytes=settings.SPOOL_SEGMENT_BYTES,
+    fsync_interval=settings.SPOOL_FSYNC_INTERVAL_MS / 1000,
+    latency_budget=settings.SPOOL_LATENCY_BUDGET_MS / 1000,
+    slow_write_limit=settings.SPOOL_SLOW_WRITE_LIMIT
+)
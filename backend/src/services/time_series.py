@@ -0,0 +1,105 @@
+import calendar
+import struct
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Opt-in representations of TimeAnalytics, negotiated via the Accept header
+COLUMNAR_MEDIA_TYPE = "application/vnd.linkpro.timeseries+json"
+BINARY_MEDIA_TYPE = "application/vnd.linkpro.timeseries"
+
+STEP_SECONDS = {"hourly": 3600, "daily": 86400}
+
+# Binary layout (little-endian): magic, version, column count, start (wall-clock epoch
+# seconds), step seconds, length; followed by clicks, views, unique_visitors as int32[length]
+BINARY_MAGIC = b"LPTS"
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct("<4sHHqiI")
+
+class TimeSeriesColumns(NamedTuple):
+    """Dense time series: value i belongs to the period starting at start + i * step"""
+    start: datetime
+    step: int
+    clicks: np.ndarray
+    views: np.ndarray
+    unique_visitors: np.ndarray
+
+def negotiate_format(accept: Optional[str]) -> Optional[str]:
+    """Return 'binary' or 'columnar' if the client asked for a compact format, else None"""
+    if not accept:
+        return None
+    media_types = [part.split(";")[0].strip().lower() for part in accept.split(",")]
+    if BINARY_MEDIA_TYPE in media_types:
+        return "binary"
+    if COLUMNAR_MEDIA_TYPE in media_types:
+        return "columnar"
+    return None
+
+def truncate(moment: datetime, granularity: str) -> datetime:
+    moment = moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0) if granularity == "daily" else moment
+
+def build_columns(click_rows: Sequence[Tuple[datetime, int, int]],
+                  view_rows: Sequence[Tuple[datetime, int]], granularity: str,
+                  start_date: datetime, end_date: datetime) -> TimeSeriesColumns:
+    """
+    Densify grouped rows into zero-filled int32 columns.
+
+    click_rows: (period, clicks, unique_visitors); view_rows: (period, views)
+    """
+    step = STEP_SECONDS[granularity]
+    start = truncate(start_date, granularity)
+    length = int((truncate(end_date, granularity) - start).total_seconds()) // step + 1
+
+    clicks = np.zeros(length, dtype=np.int32)
+    views = np.zeros(length, dtype=np.int32)
+    uniques = np.zeros(length, dtype=np.int32)
+
+    for period, click_count, unique_count in click_rows:
+        index = int((period - start).total_seconds()) // step
+        clicks[index] = click_count
+        uniques[index] = unique_count
+    for period, view_count in view_rows:
+        views[int((period - start).total_seconds()) // step] = view_count
+
+    return TimeSeriesColumns(start, step, clicks, views, uniques)
+
+def to_columnar(columns: TimeSeriesColumns, **meta) -> dict:
+    """Columnar JSON body: one array per metric instead of one object per period"""
+    return {
+        **meta,
+        "start": columns.start.isoformat(),
+        "step": columns.step,
+        "length": len(columns.clicks),
+        "clicks": columns.clicks.tolist(),
+        "views": columns.views.tolist(),
+        "unique_visitors": columns.unique_visitors.tolist()
+    }
+
+def to_binary(columns: TimeSeriesColumns) -> bytes:
+    """Packed int32 body; the 24-byte header keeps the arrays 4-byte aligned for typed-array views"""
+    header = BINARY_HEADER.pack(
+        BINARY_MAGIC, BINARY_VERSION, 3,
+        calendar.timegm(columns.start.timetuple()),
+        columns.step,
+        len(columns.clicks)
+    )
+    return b"".join((
+        header,
+        columns.clicks.astype("<i4").tobytes(),
+        columns.views.astype("<i4").tobytes(),
+        columns.unique_visitors.astype("<i4").tobytes()
+    ))
+
+def from_binary(body: bytes) -> TimeSeriesColumns:
+    """Decode a packed body (used by the benchmark and by Python clients)"""
+    magic, version, column_count, start, step, length = BINARY_HEADER.unpack_from(body)
+    if magic != BINARY_MAGIC or version != BINARY_VERSION:
+        raise ValueError("Not a time series payload")
+    values = np.frombuffer(body, dtype="<i4", offset=BINARY_HEADER.size, count=column_count * length)
+    values = values.reshape(column_count, length)
+    return TimeSeriesColumns(
+        datetime(1970, 1, 1) + timedelta(seconds=start), step,
+        values[0], values[1], values[2]
+    )
@@ -0,0 +1,545 @@
+"""
+Headless retraining of the models built in recommendation_system/RecommendationSystem.ipynb.
+
+Every feature of the notebook depends only on the hour, the day and the traffic source of
+an event, and the targets only on whether it is a click. A day of events therefore reduces
+to counts per (hour, traffic source, click/view), at most 24 x 8 x 2 rows, and the models
+train on those rows with the counts as sample weights, which gives the same fit as the
+per-event DataFrame. The counts of each complete day are extracted once into a feature
+store; later runs only query the days after it.
+
+The traffic source encoder and the feature scaler are fitted incrementally (scaler
+partial_fit on each new training day) and cached with SGD learners that are also updated
+with partial_fit, so they never revisit old days. The notebook's batch models (linear
+models, random forests, gradient boosting) are refitted on the aggregated training days,
+with the hyperparameter search folds (TimeSeriesSplit) run in a process pool.
+"""
+import json
+import multiprocessing
+import os
+import re
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+from functools import partial
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import joblib
+import numpy as np
+from sklearn.ensemble import (
+    GradientBoostingClassifier,
+    GradientBoostingRegressor,
+    RandomForestClassifier,
+    RandomForestRegressor
+)
+from sklearn.linear_model import Lasso, LinearRegression, LogisticRegression, Ridge, SGDClassifier, SGDRegressor
+from sklearn.metrics import r2_score, roc_auc_score
+from sklearn.model_selection import ParameterGrid, TimeSeriesSplit
+from sklearn.preprocessing import LabelEncoder, StandardScaler
+from sqlalchemy import DateTime, case, func, literal_column, or_, select
+
+from database.models import ClickEvent, PageView
+from database.sharding import shard_router
+from services.enrichment import DIRECT_TRAFFIC, OTHER_SOURCES, SOURCE_PATTERNS, TRAFFIC_SOURCES
+from services.significance import CLICK_ENGAGEMENT, TIME_SLOTS, VIEW_ENGAGEMENT
+
+RECOMMENDATION_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))),
+    "recommendation_system"
+)
+
+RANDOM_STATE = 10
+SGD_EPOCHS = 5  # partial_fit passes over each new day
+
+def traffic_source_expression(referrer):
+    """SQL CASE mapping a referrer column to its traffic source"""
+    lowered = func.lower(referrer)
+    return case(
+        (or_(referrer.is_(None), referrer == ""), DIRECT_TRAFFIC),
+        *((or_(*(lowered.contains(pattern) for pattern in patterns)), name) for name, patterns in SOURCE_PATTERNS),
+        else_=OTHER_SOURCES
+    )
+
+def count_events(db, start: Optional[datetime], end: datetime) -> List[Tuple[datetime, str, int, int]]:
+    """(hour, traffic source, is_click, events) for events in [start, end)"""
+    rows = []
+    for model, timestamp, is_click in ((ClickEvent, ClickEvent.clicked_at, 1), (PageView, PageView.viewed_at, 0)):
+        query = select(
+            func.date_trunc('hour', timestamp, type_=DateTime),
+            traffic_source_expression(model.referrer),
+            func.count()
+        ).where(timestamp < end)
+        if start is not None:
+            query = query.where(timestamp >= start)
+        # Grouping by position: the CASE carries bind parameters, repeated ones would not match
+        query = query.group_by(literal_column("1"), literal_column("2"))
+        rows.extend((hour, source, is_click, count) for hour, source, count in db.execute(query))
+    return rows
+
+class FeatureStore:
+    """
+    Event counts per (hour, traffic source, click/view) of each complete day, one .npz file
+    per day under `path`. manifest.json records the last extracted day; days without events
+    have no file. Events that reach the database after their day was extracted (a late spool
+    replay) are not picked up until the store is rebuilt.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.manifest_path = os.path.join(path, "manifest.json")
+        self.state_path = os.path.join(path, "state.joblib")
+
+    def through(self) -> Optional[date]:
+        if not os.path.exists(self.manifest_path):
+            return None
+        with open(self.manifest_path) as f:
+            return date.fromisoformat(json.load(f)["through"])
+
+    def extend(self, end: date) -> List[date]:
+        """Extract the days after through() and before `end`; returns the days that had events"""
+        os.makedirs(self.path, exist_ok=True)
+        through = self.through()
+        start = datetime.combine(through + timedelta(days=1), datetime.min.time()) if through else None
+        if start is not None and start.date() >= end:
+            return []
+
+        until = datetime.combine(end, datetime.min.time())
+        counts: Dict[date, Counter] = {}
+        for rows in shard_router.scatter(lambda db: count_events(db, start, until)).values():
+            for hour, source, is_click, events in rows:
+                counts.setdefault(hour.date(), Counter())[(hour.hour, source, is_click)] += events
+
+        for day, day_counts in counts.items():
+            keys = sorted(day_counts)
+            staging = os.path.join(self.path, f".{day.isoformat()}.npz")
+            np.savez(
+                staging,
+                hour=np.array([hour for hour, _, _ in keys], dtype=np.int8),
+                source=np.array([source for _, source, _ in keys], dtype=str),
+                is_click=np.array([is_click for _, _, is_click in keys], dtype=np.int8),
+                count=np.array([day_counts[key] for key in keys], dtype=np.int64)
+            )
+            os.replace(staging, os.path.join(self.path, f"{day.isoformat()}.npz"))
+        self._write_json(self.manifest_path, {"through": (end - timedelta(days=1)).isoformat()})
+        return sorted(counts)
+
+    def load(self) -> Dict[str, np.ndarray]:
+        """All stored rows, in time order (day, then hour)"""
+        parts = []
+        for filename in sorted(os.listdir(self.path)) if os.path.isdir(self.path) else []:
+            match = re.fullmatch(r"(\d{4}-\d{2}-\d{2})\.npz", filename)
+            if not match:
+                continue
+            with np.load(os.path.join(self.path, filename)) as stored:
+                part = {name: stored[name] for name in stored.files}
+            # Rows were written sorted by hour
+            part["day"] = np.full(len(part["hour"]), np.datetime64(match.group(1), "D"))
+            parts.append(part)
+        if not parts:
+            return {}
+        return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+    def clear(self) -> None:
+        if not os.path.isdir(self.path):
+            return
+        for filename in os.listdir(self.path):
+            if filename.endswith(".npz") or filename in ("manifest.json", "state.joblib"):
+                os.remove(os.path.join(self.path, filename))
+
+    @staticmethod
+    def _write_json(path: str, data: dict) -> None:
+        staging = f"{path}.tmp"
+        with open(staging, "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(staging, path)
+
+def build_features(day: np.ndarray, hour: np.ndarray, source: np.ndarray, encoder: LabelEncoder,
+                   feature_names: List[str]) -> np.ndarray:
+    """The notebook's feature matrix (prepare_modeling_features), columns in feature_names order"""
+    days = day.astype("datetime64[D]")
+    day_of_week = (days.astype(np.int64) + 3) % 7  # 1970-01-01 was a Thursday; Monday = 0
+    hour = hour.astype(np.int64)
+    columns = {
+        "hour": hour,
+        "hour_sin": np.sin(2 * np.pi * hour / 24),
+        "hour_cos": np.cos(2 * np.pi * hour / 24),
+        "day_of_week": day_of_week,
+        "day_sin": np.sin(2 * np.pi * day_of_week / 7),
+        "day_cos": np.cos(2 * np.pi * day_of_week / 7),
+        "is_weekend_num": day_of_week >= 5,
+        "month": days.astype("datetime64[M]").astype(np.int64) % 12 + 1,
+        "traffic_source_encoded": encoder.transform(source),
+    }
+    for name, first, last in TIME_SLOTS:
+        columns[f"timeslot_{name}"] = (hour >= first) & (hour < last)
+    unknown = [name for name in feature_names if name not in columns]
+    if unknown:
+        raise ValueError(f"Unknown features in system_config.json: {', '.join(unknown)}")
+    return np.column_stack([np.asarray(columns[name], dtype=np.float64) for name in feature_names])
+
+class IncrementalState:
+    """Cached encoder and scaler plus the partial_fit learners, carried from run to run"""
+
+    __slots__ = ("encoder", "scaler", "regressor", "classifier", "trained_through")
+
+    def __init__(self):
+        # Fitted on every source the SQL CASE can return, so codes never shift between versions
+        self.encoder = LabelEncoder().fit(TRAFFIC_SOURCES)
+        self.scaler = StandardScaler()
+        self.regressor = SGDRegressor(random_state=RANDOM_STATE)
+        self.classifier = SGDClassifier(loss="log_loss", random_state=RANDOM_STATE)
+        self.trained_through: Optional[date] = None
+
+    @classmethod
+    def load(cls, path: str) -> "IncrementalState":
+        return joblib.load(path) if os.path.exists(path) else cls()
+
+    def save(self, path: str) -> None:
+        staging = f"{path}.tmp"
+        joblib.dump(self, staging)
+        os.replace(staging, path)
+
+    def update(self, days: List[Tuple[date, np.ndarray, np.ndarray, np.ndarray, np.ndarray]]) -> None:
+        """Learn from new training days: (day, features, engagement, is_click, weight), in order"""
+        for _, X, _, _, weight in days:
+            self.scaler.partial_fit(X, sample_weight=weight)
+        for day, X, engagement, is_click, weight in days:
+            scaled = self.scaler.transform(X)
+            # Relative weights: raw counts would multiply the SGD step size
+            relative = weight / weight.mean()
+            for _ in range(SGD_EPOCHS):
+                self.regressor.partial_fit(scaled, engagement, sample_weight=relative)
+                self.classifier.partial_fit(scaled, is_click, classes=np.array([0, 1]), sample_weight=relative)
+            self.trained_through = day
+
+class Candidate(NamedTuple):
+    name: str
+    estimator: Callable[..., object]
+    grid: Dict[str, list]
+    ensemble: bool = False
+
+# The notebook's models and grids (build_baseline_* and build_advanced_*_models)
+CANDIDATES: Dict[str, List[Candidate]] = {
+    "regression": [
+        Candidate("LinearRegression", LinearRegression, {}),
+        Candidate("Ridge", partial(Ridge, random_state=RANDOM_STATE), {"alpha": [0.1, 1.0, 10.0]}),
+        Candidate("Lasso", partial(Lasso, random_state=RANDOM_STATE, max_iter=2000), {"alpha": [0.0001, 0.001, 0.01]}),
+        Candidate("RandomForestRegressor", partial(RandomForestRegressor, random_state=RANDOM_STATE), {
+            "n_estimators": [100, 200],
+            "max_depth": [10, 20, None],
+            "min_samples_split": [2, 5],
+            "min_samples_leaf": [1, 2],
+            "max_features": ["sqrt", "log2"]
+        }, ensemble=True),
+        Candidate("GradientBoostingRegressor", partial(GradientBoostingRegressor, random_state=RANDOM_STATE), {
+            "n_estimators": [100, 200],
+            "learning_rate": [0.05, 0.1, 0.15],
+            "max_depth": [3, 5, 7],
+            "subsample": [0.8, 1.0]
+        }, ensemble=True),
+    ],
+    "classification": [
+        Candidate("LogisticRegression", partial(LogisticRegression, random_state=RANDOM_STATE, max_iter=1000,
+                                                solver="liblinear"), {
+            "penalty": ["l1", "l2"],
+            "C": [0.1, 1.0, 10.0],
+            "class_weight": [None, "balanced"]
+        }),
+        Candidate("RandomForestClassifier", partial(RandomForestClassifier, random_state=RANDOM_STATE), {
+            "n_estimators": [100, 200],
+            "max_depth": [10, 20, None],
+            "min_samples_split": [2, 5],
+            "min_samples_leaf": [1, 2],
+            "max_features": ["sqrt", "log2"],
+            "class_weight": ["balanced", None]
+        }, ensemble=True),
+        Candidate("GradientBoostingClassifier", partial(GradientBoostingClassifier, random_state=RANDOM_STATE), {
+            "n_estimators": [100, 200],
+            "learning_rate": [0.05, 0.1, 0.15],
+            "max_depth": [3, 5, 7],
+            "subsample": [0.8, 1.0]
+        }, ensemble=True),
+    ],
+}
+
+def score(kind: str, model, X: np.ndarray, y: np.ndarray, weight: np.ndarray) -> float:
+    """Weighted test R² (regression) or ROC AUC (classification); NaN when AUC is undefined"""
+    if kind == "regression":
+        return float(r2_score(y, model.predict(X), sample_weight=weight))
+    if len(np.unique(y)) < 2:
+        return float("nan")
+    return float(roc_auc_score(y, model.predict_proba(X)[:, 1], sample_weight=weight))
+
+# Training matrix of each pool worker, set once by init_worker instead of pickled per task
+_X = _targets = _weight = None
+
+def init_worker(X: np.ndarray, targets: Dict[str, np.ndarray], weight: np.ndarray) -> None:
+    global _X, _targets, _weight
+    _X, _targets, _weight = X, targets, weight
+
+def fit_rows(kind: str, index: int, params: dict, stop: int):
+    model = CANDIDATES[kind][index].estimator(**params)
+    model.fit(_X[:stop], _targets[kind][:stop], sample_weight=_weight[:stop])
+    return model
+
+def run_fold(task: Tuple[str, int, int, dict, int, int]) -> Tuple[str, int, int, float]:
+    """Fit one parameter set on a fold's training rows and score it on the following rows"""
+    kind, index, params_index, params, train_stop, test_stop = task
+    model = fit_rows(kind, index, params, train_stop)
+    rows = slice(train_stop, test_stop)
+    return kind, index, params_index, score(kind, model, _X[rows], _targets[kind][rows], _weight[rows])
+
+def refit(task: Tuple[str, int, dict]):
+    kind, index, params = task
+    return fit_rows(kind, index, params, len(_X))
+
+class SearchResult(NamedTuple):
+    name: str
+    params: dict
+    cv_score: float
+    model: object
+
+def search(X: np.ndarray, targets: Dict[str, np.ndarray], weight: np.ndarray, folds: int, workers: int,
+           ensembles: bool = True) -> Dict[str, List[SearchResult]]:
+    """
+    Grid search of every candidate with TimeSeriesSplit folds, each (parameters, fold) pair
+    a separate task in a process pool, then a refit of the best parameters on all rows.
+    """
+    splits = [(len(train), int(test[-1]) + 1) for train, test in TimeSeriesSplit(n_splits=folds).split(X)]
+    grids = {
+        (kind, index): list(ParameterGrid(candidate.grid))
+        for kind, candidates in CANDIDATES.items()
+        for index, candidate in enumerate(candidates)
+        if ensembles or not candidate.ensemble
+    }
+    tasks = [
+        (kind, index, params_index, params, train_stop, test_stop)
+        for (kind, index), grid in grids.items()
+        for params_index, params in enumerate(grid)
+        for train_stop, test_stop in splits
+    ]
+
+    initargs = (X, targets, weight)
+    if workers <= 1:
+        init_worker(*initargs)
+        pool = None
+        mapper = map
+    else:
+        pool = multiprocessing.Pool(workers, initializer=init_worker, initargs=initargs)
+        mapper = partial(pool.imap_unordered, chunksize=1)
+    try:
+        fold_scores: Dict[Tuple[str, int, int], List[float]] = {}
+        for kind, index, params_index, fold_score in mapper(run_fold, tasks):
+            fold_scores.setdefault((kind, index, params_index), []).append(fold_score)
+
+        best = {}
+        for (kind, index), grid in grids.items():
+            means = [
+                np.nanmean(scores) if not np.all(np.isnan(scores)) else -np.inf
+                for scores in (fold_scores[(kind, index, params_index)] for params_index in range(len(grid)))
+            ]
+            params_index = int(np.argmax(means))
+            best[(kind, index)] = (grid[params_index], float(means[params_index]))
+
+        keys = list(best)
+        # pool.map keeps the order of the tasks
+        models = (pool.map if pool is not None else map)(refit, [(kind, index, best[(kind, index)][0]) for kind, index in keys])
+        results: Dict[str, List[SearchResult]] = {kind: [] for kind in CANDIDATES}
+        for (kind, index), model in zip(keys, models):
+            params, cv_score = best[(kind, index)]
+            results[kind].append(SearchResult(CANDIDATES[kind][index].name, params, cv_score, model))
+        return results
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+def split_days(days: np.ndarray, events: np.ndarray, test_size: float, trained_through: Optional[date]) -> date:
+    """
+    Last training day of a temporal split at day boundaries: the earliest days holding
+    1 - test_size of the events, extended past the days the incremental learners have
+    already seen so none of them is scored on its own training data.
+    """
+    if len(days) < 2:
+        raise ValueError("Need events on at least two days to hold some out for testing")
+    cumulative = np.cumsum(events)
+    cut = min(int(np.searchsorted(cumulative, (1 - test_size) * cumulative[-1])), len(days) - 2)
+    train_through = days[cut].astype(object)
+    if trained_through is not None and trained_through > train_through:
+        train_through = trained_through
+    if train_through >= days[-1].astype(object):
+        raise ValueError(f"No day after {train_through} to test on; run with --rebuild to retrain from scratch")
+    return train_through
+
+def response_time(regressor, classifier, scaler: StandardScaler, encoder: LabelEncoder,
+                  feature_names: List[str], horizon_days: int) -> float:
+    """Slowest prediction of every hour of the horizon for one traffic source, in seconds"""
+    start = np.datetime64(date.today(), "D")
+    day = np.repeat(start + np.arange(horizon_days), 24)
+    hour = np.tile(np.arange(24), horizon_days)
+    slowest = 0.0
+    for source in TRAFFIC_SOURCES:
+        started = time.perf_counter()
+        X = scaler.transform(build_features(day, hour, np.full(len(day), source), encoder, feature_names))
+        regressor.predict(X)
+        classifier.predict_proba(X)
+        slowest = max(slowest, time.perf_counter() - started)
+    return slowest
+
+def check_benchmarks(benchmarks: dict, test_r2: float, test_auc: float, response_seconds: float,
+                     training_seconds: float) -> Dict[str, dict]:
+    """system_config.json performance_benchmarks, each with the measured value and whether it passed"""
+    measured = {
+        "min_r2_score": (test_r2, lambda value, limit: value >= limit),
+        "min_auc_score": (test_auc, lambda value, limit: value >= limit),
+        "max_response_time_seconds": (response_seconds, lambda value, limit: value <= limit),
+        "max_training_seconds": (training_seconds, lambda value, limit: value <= limit),
+    }
+    checks = {}
+    for name, limit in benchmarks.items():
+        if name in measured:
+            value, passes = measured[name]
+            checks[name] = {"threshold": limit, "value": round(value, 4), "passed": bool(passes(value, limit))}
+    return checks
+
+def next_version(output: str) -> str:
+    versions = [int(name[1:]) for name in os.listdir(output) if re.fullmatch(r"v\d+", name)]
+    return f"v{max(versions, default=0) + 1}"
+
+def publish(output: str, model_files: Dict[str, str], artifacts: Dict[str, object], metadata: dict,
+            promote: bool) -> str:
+    """Write output/vN (model_files names plus metadata.json); LATEST names it when promoted"""
+    os.makedirs(output, exist_ok=True)
+    version = next_version(output)
+    metadata["version"] = version
+    staging = os.path.join(output, f".{version}.tmp")
+    os.makedirs(staging)
+    for key, artifact in artifacts.items():
+        joblib.dump(artifact, os.path.join(staging, model_files[key]))
+    with open(os.path.join(staging, "metadata.json"), "w", encoding="utf-8") as f:
+        json.dump(metadata, f, indent=2, ensure_ascii=False, default=str)
+    os.rename(staging, os.path.join(output, version))
+    if promote:
+        with open(os.path.join(output, "LATEST.tmp"), "w") as f:
+            f.write(version + "\n")
+        os.replace(os.path.join(output, "LATEST.tmp"), os.path.join(output, "LATEST"))
+    return version
+
+def train(config_path: str, store_path: str, output: str, folds: int = 5, test_size: float = 0.2,
+          workers: int = 1, ensembles: bool = True, rebuild: bool = False, log=print) -> dict:
+    """Extract new days, update the incremental state, search and publish; returns the version metadata"""
+    started = time.perf_counter()
+    with open(config_path, encoding="utf-8") as f:
+        config = json.load(f)
+    feature_names = config["feature_names"]
+
+    store = FeatureStore(store_path)
+    if rebuild:
+        store.clear()
+    new_days = store.extend(date.today())
+    extract_seconds = time.perf_counter() - started
+    log(f"Feature store: {len(new_days)} new days with events (through {store.through()}) in {extract_seconds:.1f}s")
+
+    data = store.load()
+    if not data:
+        raise ValueError("No events to train on")
+    state = IncrementalState.load(store.state_path)
+    X = build_features(data["day"], data["hour"], data["source"], state.encoder, feature_names)
+    is_click = data["is_click"].astype(np.int64)
+    engagement = np.where(is_click == 1, CLICK_ENGAGEMENT, VIEW_ENGAGEMENT)
+    weight = data["count"].astype(np.float64)
+
+    days, first_rows = np.unique(data["day"], return_index=True)
+    day_events = np.add.reduceat(weight, first_rows)
+    train_through = split_days(days, day_events, test_size, state.trained_through)
+    in_train = data["day"] <= np.datetime64(train_through, "D")
+
+    # Incremental learners and scaler: only training days they have not seen yet
+    incremental_started = time.perf_counter()
+    learn = []
+    for day in days.astype(object):
+        if (state.trained_through is None or day > state.trained_through) and day <= train_through:
+            rows = data["day"] == np.datetime64(day, "D")
+            learn.append((day, X[rows], engagement[rows], is_click[rows], weight[rows]))
+    state.update(learn)
+    state.save(store.state_path)
+    incremental_seconds = time.perf_counter() - incremental_started
+    log(f"Incremental learners updated with {len(learn)} days (trained through {state.trained_through})")
+
+    X_scaled = state.scaler.transform(X)
+    X_train, X_test = X_scaled[in_train], X_scaled[~in_train]
+    weight_train, weight_test = weight[in_train], weight[~in_train]
+    targets = {"regression": engagement, "classification": is_click}
+
+    search_started = time.perf_counter()
+    results = search(
+        X_train, {kind: values[in_train] for kind, values in targets.items()}, weight_train,
+        folds, workers, ensembles
+    )
+    results["regression"].append(SearchResult("SGDRegressor (incremental)", {}, float("nan"), state.regressor))
+    results["classification"].append(SearchResult("SGDClassifier (incremental)", {}, float("nan"), state.classifier))
+    search_seconds = time.perf_counter() - search_started
+
+    candidates = []
+    best: Dict[str, Tuple[float, SearchResult]] = {}
+    for kind, kind_results in results.items():
+        for result in kind_results:
+            test_score = score(kind, result.model, X_test, targets[kind][~in_train], weight_test)
+            candidates.append({
+                "task": kind,
+                "model": result.name,
+                "params": result.params,
+                "cv_score": None if np.isnan(result.cv_score) else round(result.cv_score, 4),
+                "test_score": None if np.isnan(test_score) else round(test_score, 4)
+            })
+            log(f"  {kind:<14} {result.name:<28} cv={result.cv_score:.4f} test={test_score:.4f}")
+            if not np.isnan(test_score) and (kind not in best or test_score > best[kind][0]):
+                best[kind] = (test_score, result)
+    if len(best) < 2:
+        raise ValueError("The test days hold a single class; no classification score to select a model")
+
+    test_r2, regression = best["regression"]
+    test_auc, classification = best["classification"]
+    training_seconds = time.perf_counter() - started
+    response_seconds = response_time(
+        regression.model, classification.model, state.scaler, state.encoder, feature_names,
+        config.get("recommendation_config", {}).get("prediction_horizon_days", 7)
+    )
+    benchmarks = check_benchmarks(
+        config.get("performance_benchmarks", {}), test_r2, test_auc, response_seconds, training_seconds
+    )
+    passed = all(check["passed"] for check in benchmarks.values())
+
+    metadata = {
+        "created_at": datetime.now().isoformat(),
+        "feature_names": feature_names,
+        "data": {
+            "first_day": days[0].astype(object),
+            "last_day": days[-1].astype(object),
+            "train_through": train_through,
+            "new_days": len(new_days),
+            "train_events": int(weight_train.sum()),
+            "test_events": int(weight_test.sum()),
+            "train_rows": int(in_train.sum()),
+            "test_rows": int((~in_train).sum())
+        },
+        "regression_model": {"name": regression.name, "params": regression.params, "test_r2": round(test_r2, 4)},
+        "classification_model": {"name": classification.name, "params": classification.params, "test_auc": round(test_auc, 4)},
+        "candidates": candidates,
+        "timings": {
+            "extract_seconds": round(extract_seconds, 2),
+            "incremental_seconds": round(incremental_seconds, 2),
+            "search_seconds": round(search_seconds, 2),
+            "training_seconds": round(training_seconds, 2),
+            "response_seconds": round(response_seconds, 4)
+        },
+        "benchmarks": benchmarks,
+        "passed": passed
+    }
+    publish(output, config["model_files"], {
+        "regression_model": regression.model,
+        "classification_model": classification.model,
+        "feature_scaler": state.scaler,
+        "traffic_encoder": state.encoder
+    }, metadata, promote=passed)
+    return metadata
@@ -0,0 +1,371 @@
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from config import settings
+from database.models import ClickEvent, PageView
+from models.analytics import BasicMetrics
+
+HOUR = timedelta(hours=1)
+
+def floor_hour(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+def ceil_hour(moment: datetime) -> datetime:
+    floored = floor_hour(moment)
+    return floored if floored == moment else floored + HOUR
+
+class EventAggregate:
+    """Click/view totals plus per-IP counts, so unique visitors survive adding and subtracting"""
+    __slots__ = ("clicks", "views", "click_ips", "view_ips")
+
+    def __init__(self):
+        self.clicks = 0
+        self.views = 0
+        self.click_ips: Counter = Counter()
+        self.view_ips: Counter = Counter()
+
+    def add(self, other: "EventAggregate") -> None:
+        self.clicks += other.clicks
+        self.views += other.views
+        self.click_ips.update(other.click_ips)
+        self.view_ips.update(other.view_ips)
+
+    def subtract(self, other: "EventAggregate") -> None:
+        self.clicks -= other.clicks
+        self.views -= other.views
+        for counts, removed in ((self.click_ips, other.click_ips), (self.view_ips, other.view_ips)):
+            for ip, count in removed.items():
+                remaining = counts[ip] - count
+                if remaining > 0:
+                    counts[ip] = remaining
+                else:
+                    del counts[ip]
+
+class RunningWindow:
+    """Aggregate over the closed hours [first_hour, end_hour), slid one bucket at a time"""
+
+    def __init__(self, first_hour: datetime, end_hour: datetime):
+        self.first_hour = first_hour
+        self.end_hour = end_hour
+        self.totals = EventAggregate()
+
+    def slide_cost(self, first_hour: datetime, end_hour: datetime) -> int:
+        return int((abs(first_hour - self.first_hour) + abs(end_hour - self.end_hour)) / HOUR)
+
+class ProfileWindows:
+    """Cached closed-hour buckets and running windows for one profile"""
+
+    def __init__(self):
+        self.buckets: Dict[datetime, EventAggregate] = {}
+        self.windows: List[RunningWindow] = []
+        self.created_at = time.monotonic()
+        self.generation = 0  # bumped by invalidate(), so fetches that raced it aren't stored
+        self.ip_entries = 0  # per-IP counter entries held, as of the last measure()
+
+    def measure(self) -> int:
+        aggregates = list(self.buckets.values()) + [w.totals for w in self.windows]
+        return sum(len(a.click_ips) + len(a.view_ips) for a in aggregates)
+
+class SlidingWindowAggregator:
+    """
+    Serves BasicMetrics for sliding date ranges from cached per-hour partial aggregates.
+
+    Closed hours are fetched once per profile with a grouped query and kept in memory.
+    A range is answered from a running window over its full hours that is slid to the new
+    position (adding newly elapsed buckets, subtracting expired ones), plus two small
+    queries for the partial hours at either edge. Refreshing a 7-day window a few seconds
+    later therefore costs O(new buckets) rather than a scan of the whole range.
+
+    Events written with past timestamps (batch uploads, spool replay) must call
+    invalidate(); profiles are also refetched after max_age_seconds to bound staleness
+    from writes made by other workers. Hours are only cached once they closed more than
+    settle_seconds ago, so a lagging read replica can't freeze an incomplete bucket.
+
+    Unique visitors need the per-IP counts, so memory is bounded by max_ip_entries (IP
+    counter entries over all cached hours and windows) besides max_profiles; least
+    recently used profiles are dropped first. Queries run outside the lock, which only
+    guards merging their results into the cache.
+    """
+
+    def __init__(self, max_profiles: int = 1000, max_windows_per_profile: int = 4,
+                 max_age_seconds: float = 3600, settle_seconds: float = 60,
+                 max_ip_entries: int = 1_000_000):
+        self.max_profiles = max_profiles
+        self.max_windows_per_profile = max_windows_per_profile
+        self.max_age_seconds = max_age_seconds
+        self.max_ip_entries = max_ip_entries
+        self.settle = timedelta(seconds=settle_seconds)
+        self._profiles: "OrderedDict[int, ProfileWindows]" = OrderedDict()
+        self._ip_entries = 0
+        self._lock = threading.Lock()
+
+    def _profile(self, profile_id: int) -> ProfileWindows:
+        cached = self._profiles.get(profile_id)
+        if cached is None or time.monotonic() - cached.created_at > self.max_age_seconds:
+            if cached is not None:
+                self._ip_entries -= cached.ip_entries
+            cached = ProfileWindows()
+            self._profiles[profile_id] = cached
+        self._profiles.move_to_end(profile_id)
+        self._evict()
+        return cached
+
+    def _remeasure(self, cached: ProfileWindows) -> None:
+        size = cached.measure()
+        self._ip_entries += size - cached.ip_entries
+        cached.ip_entries = size
+
+    def _evict(self) -> None:
+        """Drop least recently used profiles until both limits hold"""
+        while self._profiles and (len(self._profiles) > self.max_profiles or self._ip_entries > self.max_ip_entries):
+            _, evicted = self._profiles.popitem(last=False)
+            self._ip_entries -= evicted.ip_entries
+
+    def invalidate(self, profile_id: int, timestamp: Optional[datetime] = None) -> None:
+        """Forget cached aggregates that a late event at `timestamp` would change"""
+        with self._lock:
+            cached = self._profiles.get(profile_id)
+            if cached is None:
+                return
+            cached.generation += 1
+            if timestamp is None:
+                del self._profiles[profile_id]
+                self._ip_entries -= cached.ip_entries
+                return
+            hour = floor_hour(timestamp)
+            cached.buckets.pop(hour, None)
+            cached.windows = [
+                w for w in cached.windows if not (w.first_hour <= hour < w.end_hour)
+            ]
+            self._remeasure(cached)
+
+    @staticmethod
+    def late_hours(rows: List[dict], timestamp_column: str) -> Set[Tuple[int, datetime]]:
+        """(profile_id, hour) pairs for rows timestamped before the current hour"""
+        current_hour = floor_hour(datetime.now())
+        return {
+            (row["profile_id"], floor_hour(row[timestamp_column]))
+            for row in rows
+            if row.get(timestamp_column) and row[timestamp_column] < current_hour
+        }
+
+    def invalidate_rows(self, rows: List[dict], timestamp_column: str) -> None:
+        """Invalidate the cached hours touched by inserted rows that arrived late"""
+        for profile_id, hour in self.late_hours(rows, timestamp_column):
+            self.invalidate(profile_id, hour)
+
+    # Queries
+
+    @staticmethod
+    def _missing_hours(cached: ProfileWindows, start_hour: datetime, end_hour: datetime) -> List[datetime]:
+        missing = []
+        hour = start_hour
+        while hour < end_hour:
+            if hour not in cached.buckets:
+                missing.append(hour)
+            hour += HOUR
+        return missing
+
+    def _fetch_buckets(self, db: Session, profile_id: int, missing: List[datetime]) -> Dict[datetime, EventAggregate]:
+        """Aggregate the given closed hours (ascending) with one query per table"""
+        fetched = {hour: EventAggregate() for hour in missing}
+        range_start, range_end = missing[0], missing[-1] + HOUR
+
+        click_hour = func.date_trunc('hour', ClickEvent.clicked_at)
+        click_rows = db.query(
+            click_hour.label('hour'), ClickEvent.ip_address, func.count(ClickEvent.id)
+        ).filter(
+            ClickEvent.profile_id == profile_id,
+            ClickEvent.clicked_at >= range_start,
+            ClickEvent.clicked_at < range_end
+        ).group_by(click_hour, ClickEvent.ip_address)
+
+        for bucket_hour, ip_address, count in click_rows:
+            bucket = fetched.get(bucket_hour)
+            if bucket is not None:
+                bucket.clicks += count
+                bucket.click_ips[ip_address] += count
+
+        view_hour = func.date_trunc('hour', PageView.viewed_at)
+        view_rows = db.query(
+            view_hour.label('hour'), PageView.ip_address, func.count(PageView.id)
+        ).filter(
+            PageView.profile_id == profile_id,
+            PageView.viewed_at >= range_start,
+            PageView.viewed_at < range_end
+        ).group_by(view_hour, PageView.ip_address)
+
+        for bucket_hour, ip_address, count in view_rows:
+            bucket = fetched.get(bucket_hour)
+            if bucket is not None:
+                bucket.views += count
+                bucket.view_ips[ip_address] += count
+
+        return fetched
+
+    def _fetch_partial(self, db: Session, profile_id: int, start: datetime, end: datetime,
+                       include_end: bool) -> EventAggregate:
+        """Aggregate a sub-hour edge of a range directly"""
+        partial = EventAggregate()
+
+        click_end = ClickEvent.clicked_at <= end if include_end else ClickEvent.clicked_at < end
+        for ip_address, count in db.query(ClickEvent.ip_address, func.count(ClickEvent.id)).filter(
+            ClickEvent.profile_id == profile_id,
+            ClickEvent.clicked_at >= start,
+            click_end
+        ).group_by(ClickEvent.ip_address):
+            partial.clicks += count
+            partial.click_ips[ip_address] += count
+
+        view_end = PageView.viewed_at <= end if include_end else PageView.viewed_at < end
+        for ip_address, count in db.query(PageView.ip_address, func.count(PageView.id)).filter(
+            PageView.profile_id == profile_id,
+            PageView.viewed_at >= start,
+            view_end
+        ).group_by(PageView.ip_address):
+            partial.views += count
+            partial.view_ips[ip_address] += count
+
+        return partial
+
+    # Window maintenance
+
+    def _slide(self, cached: ProfileWindows, window: RunningWindow,
+               first_hour: datetime, end_hour: datetime) -> None:
+        buckets = cached.buckets
+        totals = window.totals
+
+        # Leading edge: expire hours that fell out, or add hours the window grew back into
+        hour = window.first_hour
+        while hour < first_hour:
+            totals.subtract(buckets[hour])
+            hour += HOUR
+        hour = first_hour
+        while hour < window.first_hour:
+            totals.add(buckets[hour])
+            hour += HOUR
+
+        # Trailing edge: add newly elapsed hours, or drop hours beyond the new end
+        hour = window.end_hour
+        while hour < end_hour:
+            totals.add(buckets[hour])
+            hour += HOUR
+        hour = end_hour
+        while hour < window.end_hour:
+            totals.subtract(buckets[hour])
+            hour += HOUR
+
+        window.first_hour = first_hour
+        window.end_hour = end_hour
+
+    def _window_for(self, cached: ProfileWindows, first_hour: datetime,
+                    end_hour: datetime) -> RunningWindow:
+        target_hours = int((end_hour - first_hour) / HOUR)
+        best = min(cached.windows, key=lambda w: w.slide_cost(first_hour, end_hour), default=None)
+
+        if best is not None and best.slide_cost(first_hour, end_hour) < max(target_hours, 1):
+            # Cheaper to slide an existing window than to rebuild one
+            if best.first_hour < end_hour and first_hour < best.end_hour:
+                self._slide(cached, best, first_hour, end_hour)
+                cached.windows.remove(best)
+                cached.windows.append(best)
+                return best
+
+        window = RunningWindow(first_hour, first_hour)
+        self._slide(cached, window, first_hour, end_hour)
+        cached.windows.append(window)
+        if len(cached.windows) > self.max_windows_per_profile:
+            cached.windows.pop(0)
+        return window
+
+    def _drop_expired_buckets(self, cached: ProfileWindows) -> None:
+        if not cached.windows:
+            cached.buckets.clear()
+            return
+        oldest = min(w.first_hour for w in cached.windows)
+        for hour in [h for h in cached.buckets if h < oldest]:
+            del cached.buckets[hour]
+
+    def metrics(self, db: Session, profile_id: int, start_date: datetime,
+                end_date: datetime) -> BasicMetrics:
+        """BasicMetrics for [start_date, end_date], equivalent to calculate_basic_metrics"""
+        first_hour = ceil_hour(start_date)
+        end_hour = floor_hour(min(end_date, datetime.now() - self.settle))
+
+        if first_hour >= end_hour:
+            # No settled full hour inside the range: nothing to reuse
+            combined = self._fetch_partial(db, profile_id, start_date, end_date, include_end=True)
+            return self._to_metrics(combined.clicks, combined.views,
+                                    len(combined.click_ips), len(combined.view_ips))
+
+        # The edges are never cached: query them before touching the cache
+        edges = EventAggregate()
+        if start_date < first_hour:
+            edges.add(self._fetch_partial(db, profile_id, start_date, first_hour, include_end=False))
+        edges.add(self._fetch_partial(db, profile_id, end_hour, end_date, include_end=True))
+
+        for _ in range(3):
+            with self._lock:
+                cached = self._profile(profile_id)
+                missing = self._missing_hours(cached, first_hour, end_hour)
+                if not missing:
+                    result = self._window_metrics(cached, first_hour, end_hour, edges)
+                    if self._profiles.get(profile_id) is cached:
+                        self._remeasure(cached)
+                        self._evict()
+                    return result
+                generation = cached.generation
+
+            fetched = self._fetch_buckets(db, profile_id, missing)
+
+            with self._lock:
+                # Invalidated or evicted while we were querying: the result may predate a late event
+                if self._profiles.get(profile_id) is cached and cached.generation == generation:
+                    cached.buckets.update(fetched)
+
+        # Kept losing the race with invalidations or eviction: answer without the cache
+        transient = ProfileWindows()
+        transient.buckets = self._fetch_buckets(db, profile_id, self._missing_hours(transient, first_hour, end_hour))
+        return self._window_metrics(transient, first_hour, end_hour, edges)
+
+    def _window_metrics(self, cached: ProfileWindows, first_hour: datetime, end_hour: datetime,
+                        edges: EventAggregate) -> BasicMetrics:
+        """Combine the running window over [first_hour, end_hour) with the edges (under the lock)"""
+        window = self._window_for(cached, first_hour, end_hour)
+        self._drop_expired_buckets(cached)
+        totals = window.totals
+
+        unique_clicks = len(totals.click_ips) + sum(1 for ip in edges.click_ips if ip not in totals.click_ips)
+        unique_views = len(totals.view_ips) + sum(1 for ip in edges.view_ips if ip not in totals.view_ips)
+
+        return self._to_metrics(
+            totals.clicks + edges.clicks,
+            totals.views + edges.views,
+            unique_clicks,
+            unique_views
+        )
+
+    @staticmethod
+    def _to_metrics(total_clicks: int, total_views: int, unique_clicks: int,
+                    unique_views: int) -> BasicMetrics:
+        ctr = (total_clicks / total_views * 100) if total_views > 0 else 0.0
+        return BasicMetrics(
+            total_clicks=total_clicks,
+            total_views=total_views,
+            unique_clicks=unique_clicks,
+            unique_views=unique_views,
+            click_through_rate=round(ctr, 2)
+        )
+
+window_aggregator = SlidingWindowAggregator(
+    max_profiles=settings.WINDOW_CACHE_MAX_PROFILES,
+    max_age_seconds=settings.WINDOW_CACHE_MAX_AGE,
+    settle_seconds=settings.REPLICA_MAX_LAG_SECONDS * 2,
+    max_ip_entries=settings.WINDOW_CACHE_MAX_IP_ENTRIES
+)
@@ -0,0 +1,21 @@
+"""
+Incremental sessionization of page views and clicks into visit_sessions.
+
+    python sessionize.py                  # process all new events, then exit (cron-friendly)
+    python sessionize.py --follow         # keep running, polling for new events
+    python sessionize.py --follow --interval 10
+
+Progress is stored in the sessionizer_cursor table; see services/event_jobs.py for
+resuming and sharding.
+"""
+from services.event_jobs import run_job_cli
+from services.sessionizer import sessionizer_job
+
+def describe(stats: dict) -> str:
+    return f"{stats['sessions_closed']:,} sessions closed, {stats['open_sessions']:,} open"
+
+def main():
+    run_job_cli(sessionizer_job, "Group page views and clicks into visits", describe)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Headless retraining of the recommendation models (recommendation_system/RecommendationSystem.ipynb).
+
+    python train_models.py                    # extract new days, retrain, publish a new version
+    python train_models.py --workers 8        # hyperparameter search folds on 8 processes
+    python train_models.py --no-ensembles     # linear and incremental models only (fast)
+    python train_models.py --rebuild          # drop the feature store and incremental state first
+
+Each run extracts the complete days since the previous run into the feature store (event
+counts per hour, traffic source and click/view), updates the cached scaler and the SGD
+learners with the new training days, runs the notebook's grid searches with TimeSeriesSplit
+folds and keeps the best regression and classification models on the held-out last days.
+
+Versions are written to --output as v1, v2, ... with the system_config.json model_files
+and a metadata.json (data range, scores of every candidate, timings, benchmark checks).
+LATEST names the newest version that passed the performance_benchmarks of
+system_config.json; the exit status is 1 when a check fails. Reads every shard.
+"""
+import argparse
+import os
+import sys
+
+from services.training import RECOMMENDATION_DIR, train
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrain the recommendation models")
+    parser.add_argument("--config", default=os.path.join(RECOMMENDATION_DIR, "system_config.json"))
+    parser.add_argument("--store", default=os.path.join(RECOMMENDATION_DIR, "features"),
+                        help="feature store and incremental state directory")
+    parser.add_argument("--output", default=os.path.join(RECOMMENDATION_DIR, "models"),
+                        help="directory of the versioned models")
+    parser.add_argument("--folds", type=int, default=5, help="TimeSeriesSplit folds of the hyperparameter search")
+    parser.add_argument("--test-size", type=float, default=0.2, help="share of the events held out (whole last days)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--no-ensembles", action="store_true", help="skip the random forest and gradient boosting searches")
+    parser.add_argument("--rebuild", action="store_true", help="re-extract every day and restart the incremental learners")
+    args = parser.parse_args()
+    if not 0 < args.test_size < 1:
+        parser.error("--test-size must be between 0 and 1")
+
+    try:
+        metadata = train(args.config, args.store, args.output, folds=args.folds, test_size=args.test_size,
+                         workers=args.workers, ensembles=not args.no_ensembles, rebuild=args.rebuild)
+    except ValueError as e:
+        raise SystemExit(f"Training failed: {e}")
+
+    regression = metadata["regression_model"]
+    classification = metadata["classification_model"]
+    print(f"{metadata['version']}: {regression['name']} (R² {regression['test_r2']:.4f}), "
+          f"{classification['name']} (AUC {classification['test_auc']:.4f}) "
+          f"in {metadata['timings']['training_seconds']:.1f}s")
+    for name, check in metadata["benchmarks"].items():
+        print(f"  {name}: {check['value']} (limit {check['threshold']}) {'ok' if check['passed'] else 'FAILED'}")
+    if not metadata["passed"]:
+        print("Benchmarks failed; LATEST still names the previous version")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,10 @@
 const API_BASE_URL = 'http://localhost:8000';
 let profileId = 1;
 let refreshInterval = null;
+let eventSource = null;
+let liveState = null;
+let secondaryRefreshTimer = null;
+let lastSecondaryRefresh = 0;
 let trafficChart = null;
 let timeChart = null;
 let isLoading = false;
@@ -76,6 +80,7 @@ function setupEventListeners() {
                 this.style.transform = '';
             }, 200);
             refreshData();
+            startAutoRefresh();
         });
     }
     
@@ -100,12 +105,95 @@ function setupEventListeners() {
     });
 }
 
-// Start auto-refresh timer
+// Start live updates: server push when available, polling otherwise
 function startAutoRefresh() {
+    stopAutoRefresh();
+    
+    if (!window.EventSource) {
+        refreshInterval = setInterval(refreshData, 30000); // 30 seconds
+        return;
+    }
+    
+    // The server only sends when this profile's metrics change, and computes each
+    // update once for every open dashboard on the profile
+    eventSource = new EventSource(`${API_BASE_URL}/api/realtime/${profileId}/events`);
+    eventSource.addEventListener('snapshot', e => applyLiveUpdate(JSON.parse(e.data), true));
+    eventSource.addEventListener('delta', e => applyLiveUpdate(JSON.parse(e.data), false));
+    eventSource.addEventListener('anomaly', e => showAnomalyAlert(JSON.parse(e.data)));
+    eventSource.onerror = () => {
+        // EventSource reconnects on its own; the server resends a full snapshot
+        console.warn('Live updates interrupted, reconnecting...');
+    };
+}
+
+function stopAutoRefresh() {
     if (refreshInterval) {
         clearInterval(refreshInterval);
+        refreshInterval = null;
     }
-    refreshInterval = setInterval(refreshData, 30000); // 30 seconds
+    if (eventSource) {
+        eventSource.close();
+        eventSource = null;
+    }
+    liveState = null;
+}
+
+// Apply a pushed snapshot or delta (only the changed sections are present)
+async function applyLiveUpdate(message, isSnapshot) {
+    if (message.profile_id !== profileId) return;
+    liveState = isSnapshot || !liveState ? message : { ...liveState, ...message };
+    
+    try {
+        if (message.summary || message.changes) {
+            await updateQuickStats(liveState, liveState);
+        }
+        if (message.time) {
+            await updateTimeChart(liveState.time);
+            updateRecommendations(liveState.time);
+        }
+        updateLastRefreshTime();
+        scheduleSecondaryRefresh();
+    } catch (error) {
+        console.error('Error applying live update:', error);
+    }
+}
+
+// Traffic spike or drop flagged by the server's streaming detector
+function showAnomalyAlert(anomaly) {
+    if (anomaly.profile_id !== profileId) return;
+    const subject = {
+        profile_views: 'Page views',
+        profile_clicks: 'Clicks',
+        link_clicks: `Clicks on link #${anomaly.link_id}`
+    }[anomaly.metric] || anomaly.metric;
+    const detail = `${anomaly.observed} vs ~${Math.round(anomaly.expected)} expected`;
+    
+    if (anomaly.kind === 'spike') {
+        showSuccessToast(`${subject} spiking: ${detail}`);
+    } else {
+        showError(`${subject} dropped: ${detail}`);
+    }
+}
+
+// Traffic sources and the links table aren't pushed; refetch them at most once a minute
+// after a change (unchanged responses come back as 304s)
+function scheduleSecondaryRefresh() {
+    if (secondaryRefreshTimer) return;
+    const wait = Math.max(0, lastSecondaryRefresh + 60000 - Date.now());
+    secondaryRefreshTimer = setTimeout(async () => {
+        secondaryRefreshTimer = null;
+        lastSecondaryRefresh = Date.now();
+        try {
+            const [traffic, profileData] = await Promise.all([
+                fetchTrafficAnalytics(),
+                fetchProfileAnalytics()
+            ]);
+            await updateTrafficChart(traffic);
+            await updateLinksTable(profileData);
+        } catch (error) {
+            console.error('Error refreshing traffic and links:', error);
+        }
+    }, wait);
 }
 
 // Main data refresh function with enhanced visual feedback
@@ -189,7 +277,10 @@ async function fetchTrafficAnalytics() {
 }
 
 async function fetchTimeAnalytics() {
-    const response = await fetch(`${API_BASE_URL}/api/analytics/time/${profileId}?granularity=daily`);
+    // Columnar arrays (start + step + clicks[] + views[]) instead of one object per period
+    const response = await fetch(`${API_BASE_URL}/api/analytics/time/${profileId}?granularity=daily`, {
+        headers: { 'Accept': 'application/vnd.linkpro.timeseries+json' }
+    });
     if (!response.ok) {
         throw new Error(`Time analytics API error: ${response.status}`);
     }
@@ -414,14 +505,15 @@ async function updateTimeChart(timeData) {
 
         const ctx = canvas.getContext('2d');
         
-        // Prepare data
-        const labels = timeData.data.map(d => {
-            const date = new Date(d.period);
+        // Prepare data: period i starts at start + i * step (wall-clock seconds)
+        const labels = timeData.clicks.map((_, i) => {
+            const date = new Date(timeData.start);
+            date.setSeconds(date.getSeconds() + i * timeData.step);
             return date.toLocaleDateString('en-US', { month: 'short', day: 'numeric' });
         });
         
-        const clicksData = timeData.data.map(d => d.clicks);
-        const viewsData = timeData.data.map(d => d.views);
+        const clicksData = timeData.clicks;
+        const viewsData = timeData.views;
 
         timeChart = new Chart(ctx, {
             type: 'line',
@@ -776,9 +868,11 @@ function debounce(func, wait) {
 }
 
 function cleanup() {
-    if (refreshInterval) {
-        clearInterval(refreshInterval);
-        refreshInterval = null;
+    stopAutoRefresh();
+    
+    if (secondaryRefreshTimer) {
+        clearTimeout(secondaryRefreshTimer);
+        secondaryRefreshTimer = null;
     }
     
     if (trafficChart) {